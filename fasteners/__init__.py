@@ -20,29 +20,109 @@
 
 from __future__ import absolute_import
 
-from fasteners.lock import locked
-from fasteners.lock import read_locked
-from fasteners.lock import ReaderWriterLock
-from fasteners.lock import try_lock
-from fasteners.lock import write_locked
-from fasteners.process_lock import interprocess_locked
-from fasteners.process_lock import interprocess_read_locked
-from fasteners.process_lock import interprocess_write_locked
-from fasteners.process_lock import InterProcessLock
-from fasteners.process_lock import InterProcessReaderWriterLock
+import importlib
 
+from fasteners._utils import CancellationToken
 from fasteners.version import _VERSION as __version__
 
 __all__ = [
     '__version__',
+    'async_read_locked',
+    'async_write_locked',
+    'AsyncReaderWriterLock',
+    'BigReaderWriterLock',
+    'CancellationToken',
     'locked',
     'read_locked',
     'ReaderWriterLock',
+    'SeqLock',
     'try_lock',
+    'VersionedValue',
     'write_locked',
     'interprocess_locked',
     'interprocess_read_locked',
     'interprocess_write_locked',
+    'InterProcessLeaseLock',
     'InterProcessLock',
     'InterProcessReaderWriterLock',
+    'InterProcessMechanism',
+    'InterProcessReaderWriterLockMechanism',
+    'LockHolder',
+    'register_mechanism',
+    'SQLiteLockTable',
+    'RedisLock',
+    'redis_locked',
+    'LockServer',
+    'ServerLock',
+    'ServerReaderWriterLock',
+    'InterProcessBarrier',
+    'InterProcessCondition',
+    'InterProcessEvent',
+    'InterProcessSemaphore',
+    'interprocess_semaphore_locked',
+    'InterProcessRateLimiter',
+    'locked_file',
+    'LockedFile',
+    'ThreadHolder',
+    'Watchdog',
+    'WatchdogReport',
 ]
+
+# Loaded on first use only, so that users only pay for importing the locks
+# they use (e.g. synchronous users do not import asyncio, short lived tools
+# taking a single process lock do not import the inter thread locks).
+_lazy_attributes = {
+    'BigReaderWriterLock': 'fasteners.lock',
+    'locked': 'fasteners.lock',
+    'read_locked': 'fasteners.lock',
+    'ReaderWriterLock': 'fasteners.lock',
+    'SeqLock': 'fasteners.lock',
+    'try_lock': 'fasteners.lock',
+    'VersionedValue': 'fasteners.lock',
+    'write_locked': 'fasteners.lock',
+    'interprocess_locked': 'fasteners.process_lock',
+    'interprocess_read_locked': 'fasteners.process_lock',
+    'interprocess_write_locked': 'fasteners.process_lock',
+    'InterProcessLock': 'fasteners.process_lock',
+    'InterProcessReaderWriterLock': 'fasteners.process_lock',
+    'InterProcessMechanism': 'fasteners.process_mechanism',
+    'InterProcessReaderWriterLockMechanism': 'fasteners.process_mechanism',
+    'LockHolder': 'fasteners.process_mechanism',
+    'register_mechanism': 'fasteners.process_mechanism',
+    'async_read_locked': 'fasteners.async_lock',
+    'async_write_locked': 'fasteners.async_lock',
+    'AsyncReaderWriterLock': 'fasteners.async_lock',
+    'InterProcessLeaseLock': 'fasteners.lease_lock',
+    'SQLiteLockTable': 'fasteners.sqlite_lock',
+    'RedisLock': 'fasteners.redis_lock',
+    'redis_locked': 'fasteners.redis_lock',
+    'LockServer': 'fasteners.lock_server',
+    'ServerLock': 'fasteners.server_lock',
+    'ServerReaderWriterLock': 'fasteners.server_lock',
+    'InterProcessBarrier': 'fasteners.process_event',
+    'InterProcessCondition': 'fasteners.process_event',
+    'InterProcessEvent': 'fasteners.process_event',
+    'InterProcessSemaphore': 'fasteners.process_semaphore',
+    'interprocess_semaphore_locked': 'fasteners.process_semaphore',
+    'InterProcessRateLimiter': 'fasteners.rate_limiter',
+    'locked_file': 'fasteners.shared_file',
+    'LockedFile': 'fasteners.shared_file',
+    'ThreadHolder': 'fasteners.watchdog',
+    'Watchdog': 'fasteners.watchdog',
+    'WatchdogReport': 'fasteners.watchdog',
+}
+
+
+def __getattr__(name):
+    try:
+        module_name = _lazy_attributes[name]
+    except KeyError:
+        raise AttributeError("module %r has no attribute %r"
+                             % (__name__, name))
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
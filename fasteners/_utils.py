@@ -16,14 +16,21 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import logging
 import os
+import sys
+import threading
 import time
+import weakref
 
 # log level for low-level debugging
 BLATHER = 5
 
-LOG = logging.getLogger(__name__)
+
+def _logger():
+    # NOTE: imported on first use (logging takes longer to import than all of
+    # fasteners), the modules of the locks import it themselves.
+    import logging
+    return logging.getLogger(__name__)
 
 
 def canonicalize_path(path):
@@ -39,6 +46,230 @@ def canonicalize_path(path):
         return canonicalize_path(str(path))
 
 
+def green_module():
+    """Returns the green thread library that monkey patched threading.
+
+    Returns the `eventlet` or `gevent` module (or None if neither of them
+    monkey patched the standard library threading).
+    """
+    patcher = sys.modules.get('eventlet.patcher')
+    if patcher is not None and patcher.is_monkey_patched('thread'):
+        return sys.modules['eventlet']
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('threading'):
+        return sys.modules['gevent']
+    return None
+
+
+def sleep(seconds):
+    """Sleeps, cooperatively yielding to the hub if threads are green."""
+    green = green_module()
+    if green is not None:
+        green.sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def cancellable_sleep(seconds, sleep_func=sleep, cancel=None):
+    """Sleeps, unless (and until) the cancellation token gets set.
+
+    Returns:
+        Whether the token is set (the sleep was cut short).
+    """
+    if cancel is None:
+        sleep_func(seconds)
+        return False
+    return bool(cancel.wait(seconds))
+
+
+class CancellationToken(object):
+    """A token to cancel waits for locks.
+
+    Has the interface of `threading.Event` (and any event can be used as a
+    token), but also wakes up waiters of inter thread locks right away,
+    instead of within a short polling interval.
+    """
+
+    def __init__(self):
+        # NOTE: created here (instead of subclassing) so that monkey patching
+        # after importing fasteners is picked up.
+        self._event = threading.Event()
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def is_set(self) -> bool:
+        """Whether the token is set (waits are cancelled)."""
+        return self._event.is_set()
+
+    def set(self):
+        """Set the token, cancelling waits using it."""
+        self._event.set()
+        with self._callbacks_lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def clear(self):
+        """Reset the token."""
+        self._event.clear()
+
+    def wait(self, timeout=None) -> bool:
+        """Wait until the token is set.
+
+        Returns:
+            Whether the token is set (it is unless the wait timed out).
+        """
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback):
+        """Register a function to call (without arguments) on :py:meth:`set`.
+        """
+        with self._callbacks_lock:
+            self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        """Unregister a function registered with :py:meth:`add_callback`."""
+        with self._callbacks_lock:
+            self._callbacks.remove(callback)
+
+
+# The running watchdog (see `fasteners.watchdog`), None if there is none.
+active_watchdog = None
+
+
+def watch_hold(lock, owner=None):
+    """Have the running watchdog (if any) watch a hold of a lock (by the
+    current thread, or the optional `owner`).
+
+    Returns:
+        The watch, whose `done()` is to be called on release, None if no
+        watchdog is running.
+    """
+    watchdog = active_watchdog
+    if watchdog is None:
+        return None
+    return watchdog.holding(lock, owner)
+
+
+def watch_wait(lock, owner=None):
+    """Have the running watchdog (if any) watch a wait for a lock (by the
+    current thread, or the optional `owner`).
+
+    Returns:
+        The watch, whose `done()` is to be called once the wait is over, None
+        if no watchdog is running.
+    """
+    watchdog = active_watchdog
+    if watchdog is None:
+        return None
+    return watchdog.waiting(lock, owner)
+
+
+# Objects to reset in forked children (see `reset_after_fork`).
+_fork_resets = weakref.WeakSet()
+
+
+def reset_after_fork(obj):
+    """Have `obj._after_fork_in_child()` called in (later) forked children.
+
+    Only the forking thread lives on in a child, so the state of the other
+    threads (the locks they held, their waits) has to be forgotten there.
+    """
+    _fork_resets.add(obj)
+
+
+def _after_fork_in_child():
+    for obj in list(_fork_resets):
+        try:
+            obj._after_fork_in_child()
+        except Exception:
+            _logger().exception("Could not reset %r after forking", obj)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def current_thread_functor():
+    """Returns a function identifying the current (maybe green) thread."""
+    green = green_module()
+    if green is not None:
+        return green.getcurrent
+    return threading.current_thread
+
+
+def _windows_process_alive(pid):
+    # NOTE: ctypes is imported on first use, like the pywin32 shims.
+    import ctypes
+    from ctypes import wintypes
+
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL,
+                                     wintypes.DWORD]
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+    kernel32.WaitForSingleObject.restype = wintypes.DWORD
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+    kernel32.CloseHandle.restype = wintypes.BOOL
+    synchronize = 0x00100000
+    error_invalid_parameter = 87
+    wait_timeout = 0x102
+    handle = kernel32.OpenProcess(synchronize, False, pid)
+    if not handle:
+        # No such process (any other error, e.g. access denied, means it
+        # exists).
+        return ctypes.get_last_error() != error_invalid_parameter
+    try:
+        # The handle of an exited process is signaled.
+        return kernel32.WaitForSingleObject(handle, 0) == wait_timeout
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def process_alive(pid):
+    """Checks whether a process (on this host) is alive."""
+    if os.name == 'nt':
+        return _windows_process_alive(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OverflowError):
+        pass
+    return True
+
+
+def process_start_time(pid):
+    """Returns the start time of a process (in clock ticks since boot).
+
+    Together with the pid it identifies a process (pids get reused), None if
+    it can not be determined (on non linux systems).
+    """
+    try:
+        with open('/proc/%d/stat' % pid, 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name (in parentheses) may itself contain spaces.
+    fields = stat[stat.rindex(b')') + 2:].split()
+    try:
+        return int(fields[19])
+    except (IndexError, ValueError):
+        return None
+
+
+def process_exited(pid, start_time):
+    """Checks whether a process (on this host) that was alive has exited.
+
+    The start time of the process (see :py:func:`process_start_time`) tells
+    it apart from a later process reusing its pid.
+    """
+    if not process_alive(pid):
+        return True
+    return (start_time is not None
+            and process_start_time(pid) not in (None, start_time))
+
+
 def pick_first_not_none(*values):
     """Returns first of values that is *not* None (or None if all are/were)."""
     for val in values:
@@ -57,22 +288,70 @@ class LockStack(object):
 
     def __init__(self, logger=None):
         self._stack = []
-        self._logger = pick_first_not_none(logger, LOG)
+        if logger is None:
+            logger = _logger()
+        self._logger = logger
 
-    def acquire_lock(self, lock):
-        gotten = lock.acquire()
+    def acquire_lock(self, lock, timeout=None):
+        if timeout is None:
+            gotten = lock.acquire()
+        else:
+            gotten = lock.acquire(timeout=timeout)
         if gotten:
             self._stack.append(lock)
         return gotten
 
-    def __enter__(self):
-        return self
+    def acquire_locks(self, locks, timeout=None, ordered=False, key=id,
+                      delay=0.001, max_delay=0.05):
+        """Acquires all of the given locks (or none of them).
 
-    def __exit__(self, exc_type, exc_value, exc_tb):
-        am_left = len(self._stack)
+        Never waits while holding some of the locks: they are all tried
+        without blocking, and if one of them is busy the ones gotten so far
+        are released again and the whole set is retried later (with a
+        backoff), until the deadline.
+
+        Args:
+            locks: Locks to acquire (anything with ``acquire(blocking)``).
+            timeout: Maximal waiting time for the whole set (in seconds).
+            ordered: Whether to try the locks in a canonical order (sorted
+                by ``key``) instead of the given one.
+            key: Sort key for the canonical order.
+            delay: Starting delay as well as the delay increment.
+            max_delay: Maximal delay in between attempts.
+
+        Returns:
+            Whether all of the locks were acquired.
+        """
+        if ordered:
+            locks = sorted(locks, key=key)
+        watch = StopWatch(duration=timeout)
+        r = Retry(delay, max_delay, watch=watch)
+
+        def _try_acquire_all():
+            gotten = []
+            try:
+                for lock in locks:
+                    if lock.acquire(False):
+                        gotten.append(lock)
+                        continue
+                    self._release_all(gotten)
+                    if watch.expired():
+                        return False
+                    raise RetryAgain()
+            except BaseException:
+                self._release_all(gotten)
+                raise
+            self._stack.extend(gotten)
+            return True
+
+        with watch:
+            return r(_try_acquire_all)
+
+    def _release_all(self, locks):
+        am_left = len(locks)
         tot_am = am_left
-        while self._stack:
-            lock = self._stack.pop()
+        while locks:
+            lock = locks.pop()
             try:
                 lock.release()
             except Exception:
@@ -80,39 +359,264 @@ class LockStack(object):
                                        " stack with %s locks", am_left, tot_am)
             am_left -= 1
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self._release_all(self._stack)
+
 
 class RetryAgain(Exception):
     """Exception to signal to retry helper to try again."""
 
 
 class Retry(object):
-    """A little retry helper object."""
+    """A little retry helper object.
+
+    Gives up (returning False) once the optional cancellation token is set,
+    which also cuts the sleep in between attempts short. Retries for the
+    optional `lock` are watched by the running watchdog (if any).
+    """
 
     def __init__(self, delay, max_delay,
-                 sleep_func=time.sleep, watch=None):
+                 sleep_func=sleep, watch=None, cancel=None, lock=None):
         self.delay = delay
         self.attempts = 0
         self.max_delay = max_delay
         self.sleep_func = sleep_func
         self.watch = watch
+        self.cancel = cancel
+        self.lock = lock
 
     def __call__(self, fn, *args, **kwargs):
-        while True:
-            self.attempts += 1
+        waiting = None
+        try:
+            while True:
+                if self.cancel is not None and self.cancel.is_set():
+                    return False
+                self.attempts += 1
+                try:
+                    return fn(*args, **kwargs)
+                except RetryAgain:
+                    if (waiting is None and self.lock is not None
+                            and active_watchdog is not None):
+                        waiting = active_watchdog.waiting(self.lock)
+                    actual_delay = max(0.0, self._next_delay())
+                    if self.watch is not None:
+                        leftover = self.watch.leftover()
+                        if leftover is not None and leftover < actual_delay:
+                            actual_delay = leftover
+                    self._pause(actual_delay)
+        finally:
+            if waiting is not None:
+                waiting.done()
+
+    def _next_delay(self, attempts=None):
+        attempts = pick_first_not_none(attempts, self.attempts)
+        maybe_delay = attempts * self.delay
+        if maybe_delay < self.max_delay:
+            return maybe_delay
+        else:
+            return self.max_delay
+
+    def _pause(self, delay):
+        cancellable_sleep(delay, self.sleep_func, self.cancel)
+
+
+class HoldStats(object):
+    """Recent hold and wait times of a lock (moving averages, in seconds).
+
+    Kept in memory for every lock path, shared by the lock objects of a
+    process. When published, they are also kept in a small memory mapped
+    `<path>.stats` file, shared by the processes using the lock. Both are
+    best effort: they only steer how waiters wait.
+    """
+
+    # How much a new sample weighs in the averages.
+    WEIGHT = 0.25
+
+    # Hold and wait average, start of the current hold (`time.monotonic`),
+    # zero when unknown.
+    _FORMAT = '<ddd'
+    _SIZE = 24
+
+    _all = {}
+    _all_lock = threading.Lock()
+
+    @classmethod
+    def _after_fork_in_child(cls):
+        cls._all_lock = threading.Lock()
+        for stats in cls._all.values():
+            stats._lock = threading.Lock()
+
+    @classmethod
+    def for_path(cls, path, publish=False):
+        """The stats of a lock path (published from now on if `publish`)."""
+        with cls._all_lock:
+            stats = cls._all.get(path)
+            if stats is None:
+                stats = cls._all[path] = cls(path)
+            if publish:
+                stats.publish = True
+        return stats
+
+    def __init__(self, path):
+        self.path = path
+        self.publish = False
+        self._state = [0.0, 0.0, 0.0]
+        self._map = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        # NOTE: imported on first use, only published stats need them.
+        import mmap
+
+        fd = os.open(self.path + b'.stats', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < self._SIZE:
+                os.ftruncate(fd, self._SIZE)
+            self._map = mmap.mmap(fd, self._SIZE)
+        finally:
+            os.close(fd)
+
+    def _load(self):
+        import struct
+
+        if self.publish and self._map is None:
+            # Opened once the lock is used (its directory exists by then).
             try:
-                return fn(*args, **kwargs)
-            except RetryAgain:
-                maybe_delay = self.attempts * self.delay
-                if maybe_delay < self.max_delay:
-                    actual_delay = maybe_delay
-                else:
-                    actual_delay = self.max_delay
-                actual_delay = max(0.0, actual_delay)
-                if self.watch is not None:
-                    leftover = self.watch.leftover()
-                    if leftover is not None and leftover < actual_delay:
-                        actual_delay = leftover
-                self.sleep_func(actual_delay)
+                self._open()
+            except (OSError, ValueError):
+                # E.g. a read-only or full directory, kept in memory only.
+                _logger().warning("Could not publish the stats of `%s`,"
+                                  " keeping them in memory", self.path,
+                                  exc_info=True)
+                self.publish = False
+        if self._map is not None:
+            state = struct.unpack_from(self._FORMAT, self._map)
+            # Garbage (or a torn write) is as good as nothing known.
+            if all(0.0 <= value < float('inf') for value in state):
+                self._state = list(state)
+        return self._state
+
+    def _store(self, state):
+        self._state = state
+        if self._map is not None:
+            import struct
+
+            struct.pack_into(self._FORMAT, self._map, 0, *state)
+
+    def _average(self, average, sample):
+        if not average:
+            return sample
+        return average + self.WEIGHT * (sample - average)
+
+    def acquired(self, waited):
+        """Record an acquisition after waiting `waited` seconds.
+
+        Returns:
+            The start of the hold, to pass to :py:meth:`released`.
+        """
+        now = time.monotonic()
+        with self._lock:
+            hold, wait, _since = self._load()
+            self._store([hold, self._average(wait, waited), now])
+        return now
+
+    def released(self, since):
+        """Record the release of a hold that started at `since`."""
+        now = time.monotonic()
+        with self._lock:
+            hold, wait, _since = self._load()
+            self._store([self._average(hold, max(0.0, now - since)), wait,
+                         0.0])
+
+    def hold(self):
+        """Average hold time, None if unknown."""
+        with self._lock:
+            return self._load()[0] or None
+
+    def wait(self):
+        """Average wait time, None if unknown."""
+        with self._lock:
+            return self._load()[1] or None
+
+    def remaining(self, waited):
+        """Expected remaining hold time, None if unknown.
+
+        Args:
+            waited: How long the caller has been waiting already, used when
+                the start of the hold is unknown (held by a process not
+                publishing its stats).
+        """
+        with self._lock:
+            hold, _wait, since = self._load()
+        if not hold:
+            return None
+        now = time.monotonic()
+        if since and since <= now:
+            return max(0.0, hold - (now - since))
+        # Halved, as the hold may well have started before the wait.
+        return max(0.0, hold - waited) / 2
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=HoldStats._after_fork_in_child)
+
+
+class AdaptiveRetry(Retry):
+    """A retry helper waiting as long as the lock is expected to be held.
+
+    Spins (yielding the processor) while waiting for locks only held briefly
+    (which are then handed over quicker than any sleep would allow), and
+    sleeps for about the expected remaining hold time while waiting for
+    locks held long (instead of waking up every `max_delay` seconds). Once a
+    hold lasts longer than expected (or nothing is known yet) it falls back
+    to the increasing delays of :py:class:`.Retry`.
+    """
+
+    # Holds shorter than this (in seconds) are waited for by spinning...
+    SPIN_HOLD = 0.001
+
+    # ...for at most this long (in seconds).
+    SPIN_TIME = 0.002
+
+    def __init__(self, stats, delay, max_delay,
+                 sleep_func=sleep, watch=None, cancel=None, lock=None):
+        super(AdaptiveRetry, self).__init__(delay, max_delay,
+                                            sleep_func=sleep_func,
+                                            watch=watch, cancel=cancel,
+                                            lock=lock)
+        self.stats = stats
+        self._started = None
+        self._fallbacks = 0
+
+    def __call__(self, fn, *args, **kwargs):
+        self._started = time.monotonic()
+        return super(AdaptiveRetry, self).__call__(fn, *args, **kwargs)
+
+    def _next_delay(self):
+        waited = time.monotonic() - self._started
+        hold = self.stats.hold()
+        if hold is not None and hold < self.SPIN_HOLD:
+            wait = self.stats.wait()
+            # Long waits for short holds mean a crowd of waiters, spinning
+            # would only burn the processor.
+            if waited < self.SPIN_TIME and (wait is None
+                                            or wait < self.SPIN_TIME):
+                return 0.0
+        remaining = self.stats.remaining(waited)
+        if remaining:
+            return remaining
+        self._fallbacks += 1
+        return super(AdaptiveRetry, self)._next_delay(self._fallbacks)
+
+    def _pause(self, delay):
+        if (delay == 0.0 and self.sleep_func is sleep
+                and hasattr(os, 'sched_yield') and green_module() is None):
+            os.sched_yield()
+        else:
+            super(AdaptiveRetry, self)._pause(delay)
 
 
 class StopWatch(object):
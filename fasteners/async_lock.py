@@ -0,0 +1,418 @@
+import asyncio
+import contextlib
+import functools
+from typing import Optional
+
+from fasteners import _utils
+from fasteners.lock import _ReaderWriterLockState
+
+
+def _current_task():
+    task = asyncio.current_task()
+    if task is None:
+        raise RuntimeError("The asyncio readers writer lock can only be used"
+                           " from within a task")
+    return task
+
+
+def _wake(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
+class AsyncReaderWriterLock(_ReaderWriterLockState):
+    """An asyncio readers writer lock.
+
+    Has the same semantics as the inter-thread :py:class:`.ReaderWriterLock`,
+    except that its owners are tasks (instead of threads).
+    """
+
+    def __init__(self,
+                 current_task_functor=_current_task,
+                 policy: str = _ReaderWriterLockState.PREFER_WRITERS):
+        """
+        Args:
+            current_task_functor:
+                Optional function that returns the identity of the task in
+                case tasks are not properly identified by asyncio.current_task
+            policy:
+                Optional fairness policy, one of `PREFER_WRITERS` (default),
+                `PREFER_READERS`, `PHASE_FAIR` or `FIFO`.
+        """
+        super(AsyncReaderWriterLock, self).__init__(policy)
+        self._current_task = current_task_functor
+        self._wakeups = set()
+
+    @property
+    def policy(self) -> str:
+        """The fairness policy the lock was created with."""
+        return self._policy
+
+    @property
+    def has_pending_writers(self) -> bool:
+        """Check if there pending writers
+
+        Returns:
+            Whether there are pending writers.
+        """
+        return bool(self._pending_writers)
+
+    def is_writer(self, check_pending: bool = True) -> bool:
+        """Check if caller is a writer (optionally pending writer).
+
+        Args:
+            check_pending:
+                Whether to check for pending writer status.
+
+        Returns:
+            Whether the caller is the active (or optionally pending) writer.
+        """
+        me = self._current_task()
+        if self._writer == me:
+            return True
+        if check_pending:
+            return me in self._pending_writers
+        else:
+            return False
+
+    def is_reader(self) -> bool:
+        """Check if caller is a reader.
+
+        Returns:
+            Whether the caller is an active reader.
+        """
+        me = self._current_task()
+        return me in self._readers
+
+    @property
+    def owner(self) -> Optional[str]:
+        """Ownership (if any) of the lock
+
+        Returns:
+            `'w'` if locked by a writer, `'r'` if locked by readers, None
+            otherwise.
+        """
+        if self._writer is not None:
+            return self.WRITER
+        if self._readers:
+            return self.READER
+        return None
+
+    def _notify_all(self):
+        wakeups, self._wakeups = self._wakeups, set()
+        for fut in wakeups:
+            _wake(fut)
+
+    async def _wait(self, me, predicate, timeout):
+        if predicate():
+            return True
+        waiting = _utils.watch_wait(self, me)
+        try:
+            return await self._wait_until(predicate, timeout)
+        finally:
+            if waiting is not None:
+                waiting.done()
+
+    async def _wait_until(self, predicate, timeout):
+        loop = asyncio.get_running_loop()
+        if timeout is not None:
+            deadline = loop.time() + timeout
+        while not predicate():
+            fut = loop.create_future()
+            if timeout is None:
+                handle = None
+            else:
+                leftover = deadline - loop.time()
+                if leftover <= 0:
+                    return False
+                handle = loop.call_later(leftover, _wake, fut)
+            self._wakeups.add(fut)
+            try:
+                await fut
+            finally:
+                self._wakeups.discard(fut)
+                if handle is not None:
+                    handle.cancel()
+        return True
+
+    @staticmethod
+    def _check_timeout(blocking, timeout):
+        if timeout is not None and timeout < 0:
+            raise ValueError("Timeout must be greater than or equal to zero")
+        if not blocking:
+            return 0
+        return timeout
+
+    async def acquire_read_lock(self,
+                                blocking: bool = True,
+                                timeout: Optional[float] = None) -> bool:
+        """Acquire a read lock.
+
+        Will wait until no active writers (and, depending on the policy,
+        pending writers).
+
+        Args:
+            blocking:
+                Whether to wait to try to acquire the lock.
+            timeout:
+                When `blocking`, maximal waiting time (in seconds).
+
+        Returns:
+            whether or not the acquisition succeeded
+
+        Raises:
+            RuntimeError: if a pending writer tries to acquire a read lock.
+        """
+        me = self._current_task()
+        timeout = self._check_timeout(blocking, timeout)
+        gotten = await self._acquire_read_lock(me, timeout)
+        if gotten:
+            self._watch_hold(me, me)
+        return gotten
+
+    def release_read_lock(self):
+        """Release a read lock.
+
+        Raises:
+            RuntimeError: if the current task does not own a read lock.
+        """
+        me = self._current_task()
+        self._release_read_lock(me)
+
+    async def _acquire_read_lock(self, me, timeout):
+        if me in self._pending_writers:
+            raise RuntimeError("Writer %s can not acquire a read lock"
+                               " while waiting for the write lock"
+                               % me)
+        if me in self._readers:
+            self._readers[me] += 1
+            return True
+        if self._writer == me:
+            self._readers[me] = 1
+            return True
+        if self._policy == self.FIFO:
+            if self._writer is None and not self._waiters:
+                self._readers[me] = 1
+                return True
+            self._waiters.append((self.READER, me))
+            try:
+                gotten = await self._wait(me, lambda: me in self._readers,
+                                          timeout)
+            except BaseException:
+                # The lock might have been handed off to us meanwhile.
+                if me in self._readers:
+                    self._release_read_lock(me)
+                else:
+                    self._withdraw(me, self.READER)
+                    self._notify_all()
+                raise
+            if not gotten:
+                self._withdraw(me, self.READER)
+                self._notify_all()
+            return gotten
+        phase = self._enter_waiting_readers()
+        gotten = False
+        try:
+            gotten = await self._wait(
+                me, lambda: self._reader_may_enter(me, phase), timeout)
+        finally:
+            self._leave_waiting_readers(phase)
+            if not gotten:
+                # Phase fair writers may have been waiting for us to get in.
+                self._notify_all()
+        if gotten:
+            self._readers[me] = 1
+        return gotten
+
+    def _release_read_lock(self, me, raise_on_not_owned=True):
+        try:
+            me_instances = self._readers[me]
+            if me_instances > 1:
+                self._readers[me] = me_instances - 1
+            else:
+                self._readers.pop(me)
+        except KeyError:
+            if raise_on_not_owned:
+                raise RuntimeError(f"Task {me} does not own a read lock")
+        self._handoff()
+        self._notify_all()
+        self._unwatch_hold(me)
+
+    @contextlib.asynccontextmanager
+    async def read_lock(self):
+        """Context manager that grants a read lock.
+
+        Will wait until no active writers (and, depending on the policy,
+        pending writers).
+
+        Raises:
+            RuntimeError: if a pending writer tries to acquire a read lock.
+        """
+        me = self._current_task()
+        await self._acquire_read_lock(me, None)
+        self._watch_hold(me, me)
+        try:
+            yield self
+        finally:
+            self._release_read_lock(me, raise_on_not_owned=False)
+
+    async def acquire_write_lock(self,
+                                 blocking: bool = True,
+                                 timeout: Optional[float] = None) -> bool:
+        """Acquire a write lock.
+
+        Will wait until no active readers. Blocks readers after acquiring.
+
+        Writers are processed in fair order (FIFO) among themselves.
+
+        Args:
+            blocking:
+                Whether to wait to try to acquire the lock.
+            timeout:
+                When `blocking`, maximal waiting time (in seconds).
+
+        Returns:
+            whether or not the acquisition succeeded
+
+        Raises:
+            RuntimeError: if an active reader attempts to acquire a lock.
+        """
+        me = self._current_task()
+        timeout = self._check_timeout(blocking, timeout)
+        gotten = await self._acquire_write_lock(me, timeout)
+        if gotten:
+            self._watch_hold(me, me)
+        return gotten
+
+    def release_write_lock(self):
+        """Release a write lock.
+
+        Raises:
+            RuntimeError: if the current task does not own a write lock.
+        """
+        me = self._current_task()
+        self._release_write_lock(me)
+
+    async def _acquire_write_lock(self, me, timeout):
+        if self._writer == me:
+            self._writer_entries += 1
+            return True
+        if me in self._readers:
+            raise RuntimeError("Reader %s to writer privilege"
+                               " escalation not allowed" % me)
+        self._pending_writers.append(me)
+        if self._policy == self.FIFO:
+            self._waiters.append((self.WRITER, me))
+            self._handoff()
+            predicate = lambda: self._writer == me  # noqa: E731
+        else:
+            predicate = lambda: self._writer_may_enter(me)  # noqa: E731
+        try:
+            gotten = await self._wait(me, predicate, timeout)
+        except BaseException:
+            # The lock might have been handed off to us meanwhile.
+            if self._writer == me:
+                self._clear_writer()
+            else:
+                self._withdraw(me, self.WRITER)
+            self._notify_all()
+            raise
+        if not gotten:
+            self._withdraw(me, self.WRITER)
+            self._notify_all()
+        elif self._policy != self.FIFO:
+            self._writer = self._pending_writers.popleft()
+            self._writer_entries = 1
+        return gotten
+
+    def _release_write_lock(self, me):
+        if self._writer != me:
+            raise RuntimeError(f"Task {me} does not own a write lock")
+        self._writer_entries -= 1
+        if self._writer_entries == 0:
+            self._clear_writer()
+            self._notify_all()
+            self._unwatch_hold(me)
+
+    @contextlib.asynccontextmanager
+    async def write_lock(self):
+        """Context manager that grants a write lock.
+
+        Will wait until no active readers. Blocks readers after acquiring.
+
+        Writers are processed in fair order (FIFO) among themselves.
+
+        Raises:
+            RuntimeError: if an active reader attempts to acquire a lock.
+        """
+        me = self._current_task()
+        await self._acquire_write_lock(me, None)
+        self._watch_hold(me, me)
+        try:
+            yield self
+        finally:
+            self._release_write_lock(me)
+
+
+def async_read_locked(*args, **kwargs):
+    """Acquires & releases a read lock around call into decorated coroutine
+    method.
+
+    If no attribute name is provided then by default the attribute named
+    '_lock' is looked for (this attribute is expected to be a
+    :py:class:`.AsyncReaderWriterLock`) in the instance object this decorator
+    is attached to.
+    """
+
+    def decorator(f):
+        attr_name = kwargs.get('lock', '_lock')
+
+        @functools.wraps(f)
+        async def wrapper(self, *args, **kwargs):
+            rw_lock = getattr(self, attr_name)
+            async with rw_lock.read_lock():
+                return await f(self, *args, **kwargs)
+
+        return wrapper
+
+    # This is needed to handle when the decorator has args or the decorator
+    # doesn't have args, python is rather weird here...
+    if kwargs or not args:
+        return decorator
+    else:
+        if len(args) == 1:
+            return decorator(args[0])
+        else:
+            return decorator
+
+
+def async_write_locked(*args, **kwargs):
+    """Acquires & releases a write lock around call into decorated coroutine
+    method.
+
+    If no attribute name is provided then by default the attribute named
+    '_lock' is looked for (this attribute is expected to be a
+    :py:class:`.AsyncReaderWriterLock`) in the instance object this decorator
+    is attached to.
+    """
+
+    def decorator(f):
+        attr_name = kwargs.get('lock', '_lock')
+
+        @functools.wraps(f)
+        async def wrapper(self, *args, **kwargs):
+            rw_lock = getattr(self, attr_name)
+            async with rw_lock.write_lock():
+                return await f(self, *args, **kwargs)
+
+        return wrapper
+
+    # This is needed to handle when the decorator has args or the decorator
+    # doesn't have args, python is rather weird here...
+    if kwargs or not args:
+        return decorator
+    else:
+        if len(args) == 1:
+            return decorator(args[0])
+        else:
+            return decorator
@@ -0,0 +1,371 @@
+import contextlib
+import json
+import logging
+import os
+from pathlib import Path
+import socket
+import threading
+import time
+from typing import Callable
+from typing import Optional
+from typing import Union
+import uuid
+
+from fasteners import _utils
+from fasteners.process_lock import _ensure_tree
+
+LOG = logging.getLogger(__name__)
+
+
+class InterProcessLeaseLock:
+    """An interprocess lock based on heartbeat renewed leases.
+
+    Meant for network and shared filesystems (NFS, some container overlay
+    filesystems) where `fcntl` locks are slow, unreliable or silently local
+    only. Only relies on atomic exclusive file creation and atomic renames.
+
+    The lease file holds the holder id, a fencing token and the expiry time
+    of the lease. While held, a background thread keeps renewing the lease,
+    waiters take over leases that expired (because their holder died or
+    hung). Every acquisition increments the fencing token, which can be
+    passed on to the resources guarded by the lock to reject stale holders.
+
+    Every read-modify-write of the lease file is done while holding a short
+    lived guard file (`<path>.guard`), created with `O_EXCL`.
+
+    Lease expiry times are compared against the `time.time()` of each host,
+    so using the lock across hosts requires their clocks to be synchronized
+    to well within the `ttl`.
+    """
+
+    def __init__(self,
+                 path: Union[Path, str],
+                 ttl: float = 30.0,
+                 heartbeat_interval: Optional[float] = None,
+                 sleep_func: Callable[[float], None] = _utils.sleep,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            path:
+                Path to the lease file.
+            ttl:
+                Time to live of a lease (in seconds), a lease that was not
+                renewed for this long can be taken over by waiters.
+            heartbeat_interval:
+                Optional time in between lease renewals (in seconds), a third
+                of the `ttl` by default.
+            sleep_func:
+                Optional function to use for sleeping.
+            logger:
+                Optional logger to use for logging.
+        """
+        if ttl <= 0:
+            raise ValueError("Ttl must be greater than zero")
+        self.path = _utils.canonicalize_path(path)
+        self.guard_path = self.path + b'.guard'
+        self.ttl = ttl
+        self.heartbeat_interval = _utils.pick_first_not_none(
+            heartbeat_interval, ttl / 3.0)
+        if self.heartbeat_interval >= ttl:
+            raise ValueError("Heartbeat interval must be less than the ttl")
+        self.sleep_func = sleep_func
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+        self.holder_id = '%s:%s:%s' % (socket.gethostname(), os.getpid(),
+                                       uuid.uuid4().hex)
+        self.acquired = False
+        self.lost = False
+        self.token = None
+        self._heartbeat_stop = None
+        self._heartbeat_thread = None
+        self._guard_token = None
+        self._watch = None
+
+    def _try_lock_guard(self):
+        token = uuid.uuid4().hex
+        try:
+            fd = os.open(self.guard_path,
+                         os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            self._break_stale_guard()
+            return False
+        try:
+            os.write(fd, token.encode())
+        finally:
+            os.close(fd)
+        self._guard_token = token
+        return True
+
+    def _read_guard(self, path):
+        with open(path, 'rb') as f:
+            return f.read().decode()
+
+    def _remove_guard(self, is_expected):
+        # The guard is moved aside (atomically) before removing it, so that a
+        # guard that turns out not to be the expected one (because it was
+        # broken and recreated by someone else meanwhile) can be put back.
+        aside = self.guard_path + b'.' + uuid.uuid4().hex.encode()
+        try:
+            os.rename(self.guard_path, aside)
+        except FileNotFoundError:
+            return False
+        try:
+            removed = is_expected(aside)
+            if not removed:
+                with contextlib.suppress(FileExistsError):
+                    os.link(aside, self.guard_path)
+        finally:
+            os.unlink(aside)
+        return removed
+
+    def _break_stale_guard(self):
+        # The guard is only held for a single read-modify-write, so if it is
+        # older than a lease it was left behind by a crashed process.
+        try:
+            age = time.time() - os.stat(self.guard_path).st_mtime
+            token = self._read_guard(self.guard_path)
+        except FileNotFoundError:
+            return
+        if age <= self.ttl:
+            return
+
+        def _is_stale(path):
+            return (self._read_guard(path) == token
+                    and time.time() - os.stat(path).st_mtime > self.ttl)
+
+        if self._remove_guard(_is_stale):
+            self.logger.warning("Broke stale lease guard `%s` (%0.3fs old)",
+                                self.guard_path, age)
+
+    def _unlock_guard(self):
+        token, self._guard_token = self._guard_token, None
+
+        def _is_mine(path):
+            return self._read_guard(path) == token
+
+        if not self._remove_guard(_is_mine):
+            self.logger.warning("Lease guard `%s` was broken by someone else"
+                                " while held", self.guard_path)
+
+    @contextlib.contextmanager
+    def _guarded(self):
+        def _lock_guard():
+            if not self._try_lock_guard():
+                raise _utils.RetryAgain()
+
+        r = _utils.Retry(0.001, 0.01, sleep_func=self.sleep_func)
+        r(_lock_guard)
+        try:
+            yield
+        finally:
+            self._unlock_guard()
+
+    def _read_lease(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            self.logger.warning("Ignoring corrupted lease file `%s`",
+                                self.path)
+            return None
+
+    def _write_lease(self, holder, token, expires):
+        # Written aside and renamed over, so readers never see a torn lease.
+        tmp_path = self.path + b'.' + self.holder_id.encode() + b'.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'holder': holder, 'token': token, 'expires': expires},
+                      f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _owns(self, lease):
+        return (lease is not None and lease.get('holder') == self.holder_id
+                and lease.get('token') == self.token)
+
+    @staticmethod
+    def _is_free(lease, now):
+        return (lease is None or lease.get('holder') is None
+                or lease.get('expires', 0) <= now)
+
+    def _try_acquire(self, blocking, watch):
+        # Leases are replaced atomically, so they can be peeked at without
+        # the guard; only (likely) free leases are worth guard traffic that
+        # competes with the heartbeat of the holder.
+        if self._is_free(self._read_lease(), time.time()) and \
+                self._try_lock_guard():
+            try:
+                lease = self._read_lease()
+                now = time.time()
+                if self._is_free(lease, now):
+                    if lease is not None and lease.get('holder') is not None:
+                        self.logger.warning("Taking over lease `%s` of `%s`"
+                                            " which expired %0.3fs ago",
+                                            self.path, lease['holder'],
+                                            now - lease['expires'])
+                    token = 1 if lease is None else lease.get('token', 0) + 1
+                    self._write_lease(self.holder_id, token, now + self.ttl)
+                    self.token = token
+                    return True
+            except (IOError, OSError) as e:
+                raise threading.ThreadError("Unable to acquire lease on"
+                                            " `%(path)s` due to"
+                                            " %(exception)s" %
+                                            {
+                                                'path': self.path,
+                                                'exception': e,
+                                            })
+            finally:
+                self._unlock_guard()
+        if not blocking or watch.expired():
+            return False
+        raise _utils.RetryAgain()
+
+    def _do_open(self):
+        basedir = os.path.dirname(self.path)
+        if basedir:
+            made_basedir = _ensure_tree(basedir)
+            if made_basedir:
+                self.logger.log(_utils.BLATHER,
+                                'Created lock base path `%s`', basedir)
+
+    def acquire(self,
+                blocking: bool = True,
+                delay: float = 0.01,
+                max_delay: float = 0.1,
+                timeout: Optional[float] = None,
+                cancel: Optional[_utils.CancellationToken] = None) -> bool:
+        """Attempt to acquire the lease.
+
+        Args:
+            blocking:
+                Whether to wait to try to acquire the lease.
+            delay:
+                When `blocking`, starting delay as well as the delay increment
+                (in seconds).
+            max_delay:
+                When `blocking` the maximum delay in between attempts to
+                acquire (in seconds).
+            timeout:
+                When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded
+        """
+        if delay < 0:
+            raise ValueError("Delay must be greater than or equal to zero")
+        if timeout is not None and timeout < 0:
+            raise ValueError("Timeout must be greater than or equal to zero")
+        if delay >= max_delay:
+            max_delay = delay
+        if self.acquired:
+            return True
+        self._do_open()
+        watch = _utils.StopWatch(duration=timeout)
+        r = _utils.Retry(delay, max_delay,
+                         sleep_func=self.sleep_func, watch=watch,
+                         cancel=cancel, lock=self)
+        with watch:
+            gotten = r(self._try_acquire, blocking, watch)
+        if not gotten:
+            return False
+        self.acquired = True
+        self.lost = False
+        self._watch = _utils.watch_hold(self)
+        self._start_heartbeat()
+        self.logger.log(_utils.BLATHER,
+                        "Acquired lease `%s` (token %s) after waiting %0.3fs"
+                        " [%s attempts were required]", self.path, self.token,
+                        watch.elapsed(), r.attempts)
+        return True
+
+    def _start_heartbeat(self):
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat, args=(self._heartbeat_stop,),
+            name='fasteners-lease-heartbeat')
+        self._heartbeat_thread.daemon = True
+        self._heartbeat_thread.start()
+
+    def _stop_heartbeat(self):
+        if self._heartbeat_thread is not None:
+            self._heartbeat_stop.set()
+            if self._heartbeat_thread is not threading.current_thread():
+                self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+            self._heartbeat_stop = None
+
+    def _heartbeat(self, stop):
+        while not stop.wait(self.heartbeat_interval):
+            try:
+                with self._guarded():
+                    if not self._owns(self._read_lease()):
+                        self.lost = True
+                    else:
+                        self._write_lease(self.holder_id, self.token,
+                                          time.time() + self.ttl)
+            except Exception:
+                self.logger.exception("Failed renewing lease `%s`",
+                                      self.path)
+                continue
+            if self.lost:
+                self.logger.error("Lease `%s` (token %s) was taken over by"
+                                  " someone else", self.path, self.token)
+                return
+
+    def is_held(self) -> bool:
+        """Check (fencing) that the lease is still held by this lock.
+
+        Returns:
+            Whether the lease file still names this lock (and its token) as
+            the holder, and the lease has not expired.
+        """
+        if not self.acquired or self.lost:
+            return False
+        lease = self._read_lease()
+        return self._owns(lease) and lease.get('expires', 0) > time.time()
+
+    def __enter__(self):
+        gotten = self.acquire()
+        if not gotten:
+            # This shouldn't happen, but just in case...
+            raise threading.ThreadError("Unable to acquire a lease"
+                                        " on `%s` (when used as a"
+                                        " context manager)" % self.path)
+        return self
+
+    def release(self):
+        """Release the previously acquired lease."""
+        if not self.acquired:
+            raise threading.ThreadError("Unable to release an unacquired lock")
+        if self._watch is not None:
+            self._watch.done()
+            self._watch = None
+        self._stop_heartbeat()
+        try:
+            with self._guarded():
+                if self._owns(self._read_lease()):
+                    # Kept around (instead of removed) to keep the fencing
+                    # token increasing.
+                    self._write_lease(None, self.token, 0)
+                else:
+                    self.logger.warning("Lease `%s` (token %s) was taken"
+                                        " over by someone else before being"
+                                        " released", self.path, self.token)
+        except (IOError, OSError) as e:
+            msg = "Could not release the lease on `%s`" % self.path
+            self.logger.exception(msg)
+            raise threading.ThreadError(msg) from e
+        finally:
+            self.acquired = False
+        self.logger.log(_utils.BLATHER, "Released lease `%s`", self.path)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def exists(self):
+        return os.path.exists(self.path)
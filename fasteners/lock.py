@@ -21,34 +21,273 @@ import collections
 import contextlib
 import functools
 import threading
+from typing import Any
+from typing import Callable
 from typing import Optional
+import weakref
 
 from fasteners import _utils
 
+# How often waits with a cancellation token (not able to wake up waiters)
+# check it (in seconds).
+_CANCEL_POLL_INTERVAL = 0.05
 
-class ReaderWriterLock(object):
-    """An inter-thread readers writer lock."""
+
+class _ReaderWriterLockState(object):
+    """Ownership bookkeeping and fairness policies of a readers writer lock.
+
+    Shared by the inter-thread and the asyncio readers writer locks, which
+    only differ in how they wait (all of the methods here must be called
+    while holding the corresponding condition, or from the event loop).
+    """
 
     WRITER = 'w'  #: Writer owner type/string constant.
     READER = 'r'  #: Reader owner type/string constant.
+    UPGRADEABLE = 'u'  #: Upgradeable reader type/string constant.
+
+    #: Readers wait for active *and* pending writers, writers are served in
+    #: FIFO order (the default policy).
+    PREFER_WRITERS = 'prefer_writers'
+    #: Readers only wait for an active writer, writers wait until there are
+    #: no readers left (writers may starve under a constant stream of reads).
+    PREFER_READERS = 'prefer_readers'
+    #: Readers and writers alternate; readers that arrived while a writer was
+    #: active or pending are all let in before the next writer.
+    PHASE_FAIR = 'phase_fair'
+    #: Strict arrival order, the lock is handed off directly to the next
+    #: waiter(s) on release so that newcomers can not barge in.
+    FIFO = 'fifo'
+
+    POLICIES = (PREFER_WRITERS, PREFER_READERS, PHASE_FAIR, FIFO)
+
+    def __init__(self, policy):
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown policy %r, expected one of %s"
+                             % (policy, ", ".join(self.POLICIES)))
+        self._writer = None
+        self._writer_entries = 0
+        self._pending_writers = collections.deque()
+        self._readers = {}
+        # At most one upgradeable reader, it coexists with plain readers.
+        self._upgrader = None
+        self._upgrader_entries = 0
+        self._upgrading = False
+        self._policy = policy
+        # Incremented on every write lock release, used by the phase fair
+        # policy to find readers that have waited out a writer.
+        self._phase = 0
+        self._waiting_readers = collections.Counter()
+        # Waiters (in arrival order) of the FIFO policy.
+        self._waiters = collections.deque()
+        # Holds watched by the watchdog, per owner.
+        self._watches = {}
+
+    def _enter_waiting_readers(self):
+        phase = self._phase
+        self._waiting_readers[phase] += 1
+        return phase
+
+    def _leave_waiting_readers(self, phase):
+        self._waiting_readers[phase] -= 1
+        if not self._waiting_readers[phase]:
+            del self._waiting_readers[phase]
+
+    def _reader_may_enter(self, me, phase):
+        if self._writer is not None:
+            return False
+        if self._upgrading:
+            # Do not starve the upgradeable reader waiting for us to leave
+            # (whatever the policy).
+            return False
+        if self._policy == self.PREFER_READERS:
+            return True
+        if self._policy == self.PHASE_FAIR:
+            # A writer went through since we started waiting, our turn.
+            return not self._pending_writers or phase != self._phase
+        return not self._pending_writers
+
+    def _writer_may_enter(self, me):
+        if self._readers or self._writer is not None:
+            return False
+        if self._upgrader is not None:
+            return False
+        if self._pending_writers[0] != me:
+            return False
+        if self._policy == self.PHASE_FAIR:
+            # Let the readers that waited out the previous writer in first.
+            return not any(phase != self._phase
+                           for phase in self._waiting_readers)
+        return True
+
+    def _handoff(self):
+        # Grant the lock to the waiters at the head of the FIFO queue, this
+        # must be called (with the condition held) whenever the lock is
+        # released by someone.
+        while self._waiters:
+            kind, who = self._waiters[0]
+            if kind == self.WRITER:
+                if (not self._readers and self._writer is None
+                        and self._upgrader is None):
+                    self._waiters.popleft()
+                    self._pending_writers.remove(who)
+                    self._writer = who
+                    self._writer_entries = 1
+                break
+            if self._writer is not None or self._upgrading:
+                break
+            if kind == self.UPGRADEABLE:
+                if self._upgrader is not None:
+                    break
+                self._waiters.popleft()
+                self._upgrader = who
+                self._upgrader_entries = 1
+            else:
+                self._waiters.popleft()
+                self._readers[who] = 1
+
+    def _clear_writer(self):
+        self._writer = None
+        self._writer_entries = 0
+        self._phase += 1
+        self._handoff()
+
+    def _withdraw(self, me, kind):
+        # Forget about a waiter that gave up (timed out or was cancelled).
+        if kind == self.WRITER and me in self._pending_writers:
+            self._pending_writers.remove(me)
+        try:
+            self._waiters.remove((kind, me))
+        except ValueError:
+            pass
+        self._handoff()
+
+    def _watch_hold(self, me, owner=None):
+        # Watches the hold of an owner (from its first acquisition on).
+        if _utils.active_watchdog is not None and me not in self._watches:
+            watch = _utils.watch_hold(self, owner)
+            if watch is not None:
+                self._watches[me] = watch
+
+    def _unwatch_hold(self, me):
+        # Stops watching the hold of an owner that no longer holds anything.
+        if self._watches and not (me == self._writer or me == self._upgrader
+                                  or me in self._readers):
+            watch = self._watches.pop(me, None)
+            if watch is not None:
+                watch.done()
+
+    def _owners(self):
+        # The (owner, mode) of the holders, for the watchdog (a racy
+        # snapshot, without holding the condition).
+        owners = []
+        writer, upgrader = self._writer, self._upgrader
+        if writer is not None:
+            owners.append((writer, self.WRITER))
+        if upgrader is not None:
+            owners.append((upgrader, self.UPGRADEABLE))
+        owners.extend((reader, self.READER) for reader in list(self._readers))
+        return owners
+
+
+class ReaderWriterLock(_ReaderWriterLockState):
+    """An inter-thread readers writer lock."""
 
     def __init__(self,
-                 condition_cls=threading.Condition,
-                 current_thread_functor=threading.current_thread):
+                 condition_cls=None,
+                 current_thread_functor=None,
+                 policy: str = _ReaderWriterLockState.PREFER_WRITERS):
         """
         Args:
             condition_cls:
-                Optional custom `Condition` primitive used for synchronization.
+                Optional custom `Condition` primitive used for synchronization,
+                defaults to (the possibly monkey patched) threading.Condition.
             current_thread_functor:
                 Optional function that returns the identity of the thread in case
-                threads are not properly identified by threading.current_thread
+                threads are not properly identified by threading.current_thread.
+                Defaults to the current greenlet if eventlet or gevent monkey
+                patched threading.
+            policy:
+                Optional fairness policy, one of `PREFER_WRITERS` (default),
+                `PREFER_READERS`, `PHASE_FAIR` or `FIFO`.
         """
-        self._writer = None
-        self._writer_entries = 0
-        self._pending_writers = collections.deque()
-        self._readers = {}
+        super(ReaderWriterLock, self).__init__(policy)
+        # NOTE: looked up at creation time (instead of import time) so that
+        # monkey patching after importing fasteners is picked up.
+        if condition_cls is None:
+            condition_cls = threading.Condition
+        if current_thread_functor is None:
+            current_thread_functor = _utils.current_thread_functor()
+        self._condition_cls = condition_cls
         self._cond = condition_cls()
         self._current_thread = current_thread_functor
+        _utils.reset_after_fork(self)
+
+    def _after_fork_in_child(self):
+        if _utils.green_module() is not None:
+            # Green threads all live on in the child.
+            return
+        # Only the forking thread lives on, it keeps what it holds; the other
+        # owners and all of the waiters are gone (and one of them may have
+        # been holding the condition).
+        me = self._current_thread()
+        self._cond = self._condition_cls()
+        if self._writer != me:
+            self._writer = None
+            self._writer_entries = 0
+        if self._upgrader != me:
+            self._upgrader = None
+            self._upgrader_entries = 0
+        self._upgrading = False
+        self._readers = {reader: entries
+                         for reader, entries in self._readers.items()
+                         if reader == me}
+        self._pending_writers.clear()
+        self._waiting_readers.clear()
+        self._waiters.clear()
+        self._watches = {}
+
+    def _notify_all(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _wait(self, predicate, cancel):
+        # Waits (holding the condition) until the predicate holds, returns
+        # False if the wait got cancelled first.
+        if predicate():
+            return True
+        waiting = _utils.watch_wait(self)
+        try:
+            return self._wait_until(predicate, cancel)
+        finally:
+            if waiting is not None:
+                waiting.done()
+
+    def _wait_until(self, predicate, cancel):
+        if cancel is None:
+            while not predicate():
+                self._cond.wait()
+            return True
+        add_callback = getattr(cancel, 'add_callback', None)
+        if add_callback is not None:
+            # Woken up by the token, only checked when notified.
+            add_callback(self._notify_all)
+        try:
+            while not predicate():
+                if cancel.is_set():
+                    return False
+                if add_callback is not None:
+                    self._cond.wait()
+                else:
+                    self._cond.wait(_CANCEL_POLL_INTERVAL)
+            return True
+        finally:
+            if add_callback is not None:
+                cancel.remove_callback(self._notify_all)
+
+    @property
+    def policy(self) -> str:
+        """The fairness policy the lock was created with."""
+        return self._policy
 
     @property
     def has_pending_writers(self) -> bool:
@@ -81,10 +320,18 @@ class ReaderWriterLock(object):
         """Check if caller is a reader.
 
         Returns:
-            Whether the caller is an active reader.
+            Whether the caller is an active (plain or upgradeable) reader.
         """
         me = self._current_thread()
-        return me in self._readers
+        return me in self._readers or self._upgrader == me
+
+    def is_upgradeable_reader(self) -> bool:
+        """Check if caller holds the upgradeable read lock.
+
+        Returns:
+            Whether the caller is the active upgradeable reader.
+        """
+        return self._upgrader == self._current_thread()
 
     @property
     def owner(self) -> Optional[str]:
@@ -96,20 +343,35 @@ class ReaderWriterLock(object):
         """Returns whether the lock is locked by a writer or reader."""
         if self._writer is not None:
             return self.WRITER
-        if self._readers:
+        if self._readers or self._upgrader is not None:
             return self.READER
         return None
 
-    def acquire_read_lock(self):
+    def acquire_read_lock(self,
+                          cancel: Optional[_utils.CancellationToken] = None
+                          ) -> bool:
         """Acquire a read lock.
 
-        Will wait until no active or pending writers.
+        Will wait until no active writers (and, depending on the policy,
+        pending writers).
+
+        Args:
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded (it did unless
+            cancelled)
 
         Raises:
             RuntimeError: if a pending writer tries to acquire a read lock.
         """
         me = self._current_thread()
-        self._acquire_read_lock(me)
+        gotten = self._acquire_read_lock(me, cancel)
+        if gotten:
+            self._watch_hold(me)
+        return gotten
 
     def release_read_lock(self):
         """Release a read lock.
@@ -120,26 +382,45 @@ class ReaderWriterLock(object):
         me = self._current_thread()
         self._release_read_lock(me)
 
-    def _acquire_read_lock(self, me):
+    def _acquire_read_lock(self, me, cancel=None):
         if me in self._pending_writers:
             raise RuntimeError("Writer %s can not acquire a read lock"
                                " while waiting for the write lock"
                                % me)
         with self._cond:
-            while True:
-                # No active writer, or we are the writer;
-                # Also no pending writers;
-                # we are good to become a reader.
-                if self._writer is None or self._writer == me:
-                    if me in self._readers:
-                        # ok to get a lock if current thread already has one
-                        self._readers[me] = self._readers[me] + 1
-                        break
-                    elif (self._writer == me) or not self.has_pending_writers:
-                        self._readers[me] = 1
-                        break
+            if me in self._readers:
+                # ok to get a lock if current thread already has one
+                self._readers[me] = self._readers[me] + 1
+                return True
+            if self._writer == me or self._upgrader == me:
+                self._readers[me] = 1
+                return True
+            if self._policy == self.FIFO:
+                if (self._writer is None and not self._upgrading
+                        and not self._waiters):
+                    self._readers[me] = 1
+                    return True
+                self._waiters.append((self.READER, me))
+                if self._wait(lambda: me in self._readers, cancel):
+                    return True
+                self._withdraw(me, self.READER)
+                self._cond.notify_all()
+                return False
+            phase = self._enter_waiting_readers()
+            gotten = False
+            try:
                 # An active or pending writer; guess we have to wait.
-                self._cond.wait()
+                gotten = self._wait(
+                    lambda: self._reader_may_enter(me, phase), cancel)
+                if gotten:
+                    self._readers[me] = 1
+            finally:
+                self._leave_waiting_readers(phase)
+                if not gotten:
+                    # Phase fair writers may have been waiting for us to get
+                    # in.
+                    self._cond.notify_all()
+            return gotten
 
     def _release_read_lock(self, me, raise_on_not_owned=True):
         # I am no longer a reader, remove *one* occurrence of myself.
@@ -156,52 +437,252 @@ class ReaderWriterLock(object):
             except KeyError:
                 if raise_on_not_owned:
                     raise RuntimeError(f"Thread {me} does not own a read lock")
+            self._handoff()
             self._cond.notify_all()
+            self._unwatch_hold(me)
 
     @contextlib.contextmanager
     def read_lock(self):
         """Context manager that grants a read lock.
 
-        Will wait until no active or pending writers.
+        Will wait until no active writers (and, depending on the policy,
+        pending writers).
 
         Raises:
             RuntimeError: if a pending writer tries to acquire a read lock.
         """
         me = self._current_thread()
         self._acquire_read_lock(me)
+        self._watch_hold(me)
         try:
             yield self
         finally:
             self._release_read_lock(me, raise_on_not_owned=False)
 
-    def _acquire_write_lock(self, me):
+    def acquire_upgradeable_read_lock(
+            self,
+            cancel: Optional[_utils.CancellationToken] = None) -> bool:
+        """Acquire the upgradeable read lock.
+
+        The upgradeable read lock coexists with plain readers, but only one
+        thread at a time can hold it. Its holder can atomically turn it into
+        a write lock with :py:meth:`upgrade`.
+
+        Args:
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded (it did unless
+            cancelled)
+
+        Raises:
+            RuntimeError: if a plain reader or a pending writer tries to
+                acquire the upgradeable read lock.
+        """
+        me = self._current_thread()
+        gotten = self._acquire_upgradeable_read_lock(me, cancel)
+        if gotten:
+            self._watch_hold(me)
+        return gotten
+
+    def release_upgradeable_read_lock(self):
+        """Release the upgradeable read lock.
+
+        Raises:
+            RuntimeError: if the current thread does not own the upgradeable
+                read lock.
+        """
+        me = self._current_thread()
+        self._release_upgradeable_read_lock(me)
+
+    def _acquire_upgradeable_read_lock(self, me, cancel=None):
+        if me in self._pending_writers:
+            raise RuntimeError("Writer %s can not acquire an upgradeable read"
+                               " lock while waiting for the write lock" % me)
+        if me in self._readers:
+            raise RuntimeError("Reader %s to upgradeable reader privilege"
+                               " escalation not allowed" % me)
+        with self._cond:
+            if self._upgrader == me:
+                self._upgrader_entries += 1
+                return True
+            if self._writer == me:
+                self._upgrader = me
+                self._upgrader_entries = 1
+                return True
+            if self._policy == self.FIFO:
+                if (self._writer is None and self._upgrader is None
+                        and not self._waiters):
+                    self._upgrader = me
+                    self._upgrader_entries = 1
+                    return True
+                self._waiters.append((self.UPGRADEABLE, me))
+                if self._wait(lambda: self._upgrader == me, cancel):
+                    return True
+                self._withdraw(me, self.UPGRADEABLE)
+                self._cond.notify_all()
+                return False
+            phase = self._enter_waiting_readers()
+            gotten = False
+            try:
+                gotten = self._wait(
+                    lambda: (self._upgrader is None
+                             and self._reader_may_enter(me, phase)), cancel)
+                if gotten:
+                    self._upgrader = me
+                    self._upgrader_entries = 1
+            finally:
+                self._leave_waiting_readers(phase)
+                if not gotten:
+                    self._cond.notify_all()
+            return gotten
+
+    def _release_upgradeable_read_lock(self, me, raise_on_not_owned=True):
+        with self._cond:
+            if self._upgrader != me:
+                if raise_on_not_owned:
+                    raise RuntimeError(f"Thread {me} does not own the"
+                                       f" upgradeable read lock")
+                return
+            self._upgrader_entries -= 1
+            if self._upgrader_entries == 0:
+                self._upgrader = None
+                self._handoff()
+                self._cond.notify_all()
+                self._unwatch_hold(me)
+
+    @contextlib.contextmanager
+    def upgradeable_read_lock(self):
+        """Context manager that grants the upgradeable read lock.
+
+        Inside of the context the lock may be upgraded with
+        :py:meth:`upgrade` (and then downgraded with :py:meth:`downgrade`),
+        whatever the caller holds at exit is released.
+
+        Raises:
+            RuntimeError: if a plain reader or a pending writer tries to
+                acquire the upgradeable read lock.
+        """
+        me = self._current_thread()
+        self._acquire_upgradeable_read_lock(me)
+        self._watch_hold(me)
+        try:
+            yield self
+        finally:
+            if self._upgrader == me:
+                self._release_upgradeable_read_lock(me)
+            elif self._writer == me:
+                self._release_write_lock(me)
+            else:
+                self._release_read_lock(me, raise_on_not_owned=False)
+
+    def upgrade(self):
+        """Atomically turn the upgradeable read lock into a write lock.
+
+        Will wait until the plain readers leave, no other writer can get in
+        between. Afterwards the caller is a writer and should release the
+        lock with :py:meth:`release_write_lock` (or :py:meth:`downgrade` it).
+
+        Raises:
+            RuntimeError: if the current thread does not own the upgradeable
+                read lock exactly once, or also holds a plain read lock.
+        """
+        me = self._current_thread()
+        with self._cond:
+            if self._upgrader != me:
+                raise RuntimeError(f"Thread {me} does not own the"
+                                   f" upgradeable read lock")
+            if self._upgrader_entries != 1 or self._writer == me:
+                raise RuntimeError(f"Thread {me} can not upgrade a reentrant"
+                                   f" lock")
+            if me in self._readers:
+                raise RuntimeError(f"Thread {me} can not upgrade while holding"
+                                   f" a plain read lock")
+            self._upgrading = True
+            try:
+                while self._readers:
+                    self._cond.wait()
+            except BaseException:
+                self._upgrading = False
+                self._handoff()
+                self._cond.notify_all()
+                raise
+            self._upgrading = False
+            self._upgrader = None
+            self._upgrader_entries = 0
+            self._writer = me
+            self._writer_entries = 1
+
+    def downgrade(self):
+        """Atomically turn a write lock into a (plain) read lock.
+
+        No other writer can get in between, waiting readers are let in.
+        Afterwards the caller should release the lock with
+        :py:meth:`release_read_lock`.
+
+        Raises:
+            RuntimeError: if the current thread does not own the write lock
+                exactly once.
+        """
+        me = self._current_thread()
+        with self._cond:
+            if self._writer != me:
+                raise RuntimeError(f"Thread {me} does not own a write lock")
+            if self._writer_entries != 1:
+                raise RuntimeError(f"Thread {me} can not downgrade a reentrant"
+                                   f" lock")
+            self._readers[me] = self._readers.get(me, 0) + 1
+            self._clear_writer()
+            self._cond.notify_all()
+
+    def _acquire_write_lock(self, me, cancel=None):
         if self.is_reader():
             raise RuntimeError("Reader %s to writer privilege"
                                " escalation not allowed" % me)
 
         with self._cond:
             self._pending_writers.append(me)
-            while True:
+            if self._policy == self.FIFO:
+                self._waiters.append((self.WRITER, me))
+                self._handoff()
+                predicate = lambda: self._writer == me  # noqa: E731
+            else:
                 # No readers, and no active writer, am I next??
-                if len(self._readers) == 0 and self._writer is None:
-                    if self._pending_writers[0] == me:
-                        self._writer = self._pending_writers.popleft()
-                        self._writer_entries = 1
-                        break
-                self._cond.wait()
+                predicate = lambda: self._writer_may_enter(me)  # noqa: E731
+            if not self._wait(predicate, cancel):
+                self._withdraw(me, self.WRITER)
+                self._cond.notify_all()
+                return False
+            if self._policy != self.FIFO:
+                self._writer = self._pending_writers.popleft()
+                self._writer_entries = 1
+            return True
 
     def _release_write_lock(self, me, raise_on_not_owned=True):
         with self._cond:
-            self._writer = None
-            self._writer_entries = 0
+            self._clear_writer()
             self._cond.notify_all()
+            self._unwatch_hold(me)
 
-    def acquire_write_lock(self):
+    def acquire_write_lock(self,
+                           cancel: Optional[_utils.CancellationToken] = None
+                           ) -> bool:
         """Acquire a write lock.
 
         Will wait until no active readers. Blocks readers after acquiring.
 
-        Guaranteed for locks to be processed in fair order (FIFO).
+        Writers are processed in fair order (FIFO) among themselves.
+
+        Args:
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded (it did unless
+            cancelled)
 
         Raises:
             RuntimeError: if an active reader attempts to acquire a lock.
@@ -209,8 +690,11 @@ class ReaderWriterLock(object):
         me = self._current_thread()
         if self._writer == me:
             self._writer_entries += 1
-        else:
-            self._acquire_write_lock(me)
+            return True
+        gotten = self._acquire_write_lock(me, cancel)
+        if gotten:
+            self._watch_hold(me)
+        return gotten
 
     def release_write_lock(self):
         """Release a write lock.
@@ -232,7 +716,7 @@ class ReaderWriterLock(object):
 
         Will wait until no active readers. Blocks readers after acquiring.
 
-        Guaranteed for locks to be processed in fair order (FIFO).
+        Writers are processed in fair order (FIFO) among themselves.
 
         Raises:
             RuntimeError: if an active reader attempts to acquire a lock.
@@ -246,12 +730,535 @@ class ReaderWriterLock(object):
                 self._writer_entries -= 1
         else:
             self._acquire_write_lock(me)
+            self._watch_hold(me)
             try:
                 yield self
             finally:
                 self._release_write_lock(me)
 
 
+class _ReaderSlot(object):
+    __slots__ = ('lock', 'count', '__weakref__')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+
+class BigReaderWriterLock(object):
+    """An inter-thread readers writer lock for read-mostly data (brlock).
+
+    Every reader thread gets a slot of its own, so readers only ever touch
+    thread local state and do not contend with each other. Writers pay for
+    this by acquiring the slots of all the reader threads (and hence get
+    slower the more threads have read through the lock).
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        # Slots disappear together with the threads they belong to.
+        self._slots = weakref.WeakSet()
+        # Guards the slot registry, held by the writer for its whole hold.
+        self._slots_lock = threading.Lock()
+        self._held_slots = []
+        self._writer = None
+        self._writer_entries = 0
+        self._writer_reads = 0
+        self._watch = None
+        _utils.reset_after_fork(self)
+
+    def _after_fork_in_child(self):
+        if _utils.green_module() is not None:
+            # Green threads all live on in the child.
+            return
+        if self._writer == threading.get_ident():
+            # Holds every slot (and the registry) already.
+            return
+        # Only the forking thread lives on, the slots of the other threads
+        # (and the registry) may have been held by them.
+        self._slots_lock = threading.Lock()
+        self._held_slots = []
+        self._writer = None
+        self._writer_entries = 0
+        self._writer_reads = 0
+        self._watch = None
+        self._slots = weakref.WeakSet()
+        slot = getattr(self._local, 'slot', None)
+        if slot is not None:
+            if not slot.count:
+                slot.lock = threading.Lock()
+            self._slots.add(slot)
+
+    def _new_slot(self):
+        # Registers a slot for this thread (waiting for a writer holding the
+        # registry); returns it and the wait watch.
+        slot = _ReaderSlot()
+        waiting = self._acquire_watched(self._slots_lock, None)
+        try:
+            self._slots.add(slot)
+        finally:
+            self._slots_lock.release()
+        self._local.slot = slot
+        return slot, waiting
+
+    def _acquire_watched(self, lock, waiting):
+        # Acquires a (slot or registry) lock, watching the wait for it when
+        # there is one; returns the (first) wait watch.
+        if not lock.acquire(False):
+            if waiting is None:
+                waiting = _utils.watch_wait(self)
+            lock.acquire()
+        return waiting
+
+    def _owners(self):
+        # The writer, for the watchdog (readers are not known by thread).
+        writer = self._writer
+        if writer is None:
+            return None
+        for thread in threading.enumerate():
+            if thread.ident == writer:
+                return [(thread, 'w')]
+        return None
+
+    def is_writer(self) -> bool:
+        """Check if caller is the writer.
+
+        Returns:
+            Whether the caller is the active writer.
+        """
+        return self._writer == threading.get_ident()
+
+    def is_reader(self) -> bool:
+        """Check if caller is a reader.
+
+        Returns:
+            Whether the caller is an active reader.
+        """
+        slot = getattr(self._local, 'slot', None)
+        if slot is not None and slot.count:
+            return True
+        return self.is_writer() and self._writer_reads > 0
+
+    def acquire_read_lock(self):
+        """Acquire a read lock.
+
+        Will wait until no active writer.
+        """
+        slot = getattr(self._local, 'slot', None)
+        if slot is not None and slot.count:
+            slot.count += 1
+        elif self._writer == threading.get_ident():
+            # The writer already holds every slot (ours included).
+            self._writer_reads += 1
+        else:
+            waiting = None
+            if slot is None:
+                slot, waiting = self._new_slot()
+            waiting = self._acquire_watched(slot.lock, waiting)
+            if waiting is not None:
+                waiting.done()
+            slot.count = 1
+
+    def release_read_lock(self):
+        """Release a read lock.
+
+        Raises:
+            RuntimeError: if the current thread does not own a read lock.
+        """
+        slot = getattr(self._local, 'slot', None)
+        if slot is not None and slot.count:
+            slot.count -= 1
+            if not slot.count:
+                slot.lock.release()
+        elif self._writer == threading.get_ident() and self._writer_reads:
+            self._writer_reads -= 1
+        else:
+            raise RuntimeError(f"Thread {threading.current_thread()} does not"
+                               f" own a read lock")
+
+    @contextlib.contextmanager
+    def read_lock(self):
+        """Context manager that grants a read lock.
+
+        Will wait until no active writer.
+        """
+        self.acquire_read_lock()
+        try:
+            yield self
+        finally:
+            self.release_read_lock()
+
+    def acquire_write_lock(self):
+        """Acquire a write lock.
+
+        Will wait until no active readers (by acquiring the slot of every
+        reader thread). Blocks readers after acquiring.
+
+        Raises:
+            RuntimeError: if an active reader attempts to acquire a lock.
+        """
+        me = threading.get_ident()
+        if self._writer == me:
+            self._writer_entries += 1
+            return
+        slot = getattr(self._local, 'slot', None)
+        if slot is not None and slot.count:
+            raise RuntimeError("Reader %s to writer privilege"
+                               " escalation not allowed"
+                               % threading.current_thread())
+        waiting = self._acquire_watched(self._slots_lock, None)
+        try:
+            held = list(self._slots)
+            for slot in held:
+                waiting = self._acquire_watched(slot.lock, waiting)
+        finally:
+            if waiting is not None:
+                waiting.done()
+        self._held_slots = held
+        self._writer = me
+        self._writer_entries = 1
+        self._watch = _utils.watch_hold(self)
+
+    def release_write_lock(self):
+        """Release a write lock.
+
+        Raises:
+            RuntimeError: if the current thread does not own a write lock.
+        """
+        if self._writer != threading.get_ident():
+            raise RuntimeError(f"Thread {threading.current_thread()} does not"
+                               f" own a write lock")
+        self._writer_entries -= 1
+        if self._writer_entries:
+            return
+        keep = None
+        if self._writer_reads:
+            # The writer is still reading, it keeps (only) its own slot.
+            keep = getattr(self._local, 'slot', None)
+            if keep is None:
+                keep = self._local.slot = _ReaderSlot()
+                self._slots.add(keep)
+            if keep not in self._held_slots:
+                keep.lock.acquire()
+            keep.count = self._writer_reads
+            self._writer_reads = 0
+        held, self._held_slots = self._held_slots, []
+        self._writer = None
+        if self._watch is not None:
+            self._watch.done()
+            self._watch = None
+        for slot in held:
+            if slot is not keep:
+                slot.lock.release()
+        self._slots_lock.release()
+
+    @contextlib.contextmanager
+    def write_lock(self):
+        """Context manager that grants a write lock.
+
+        Will wait until no active readers. Blocks readers after acquiring.
+
+        Raises:
+            RuntimeError: if an active reader attempts to acquire a lock.
+        """
+        self.acquire_write_lock()
+        try:
+            yield self
+        finally:
+            self.release_write_lock()
+
+
+class SeqLock(object):
+    """An inter-thread sequence lock for small, frequently read data.
+
+    Writers are serialized by a write lock and bump a sequence number before
+    and after every update. Readers do not lock at all: they run their read
+    section optimistically and retry it if the sequence changed meanwhile
+    (or a write was in progress), so they never block writers.
+    """
+
+    def __init__(self, max_retries: Optional[int] = 100):
+        """
+        Args:
+            max_retries:
+                Optional default number of optimistic retries of a read
+                before falling back to a real read lock (None to retry
+                forever).
+        """
+        self._sequence = 0
+        self._write_entries = 0
+        self._rw_lock = ReaderWriterLock()
+        self.max_retries = max_retries
+        _utils.reset_after_fork(self)
+
+    def _after_fork_in_child(self):
+        # The write lock resets itself; an update of a thread that did not
+        # survive the fork is over (readers would retry it forever).
+        if _utils.green_module() is None and not self._rw_lock.is_writer(
+                check_pending=False):
+            self._write_entries = 0
+            if self._sequence & 1:
+                self._sequence += 1
+
+    @property
+    def sequence(self) -> int:
+        """The current sequence number (odd while a write is in progress)."""
+        return self._sequence
+
+    def read_begin(self) -> int:
+        """Start an optimistic read section.
+
+        Returns:
+            The sequence number to pass to :py:meth:`read_retry` at the end
+            of the read section.
+        """
+        return self._sequence
+
+    def read_retry(self, sequence: int) -> bool:
+        """Check if an optimistic read section has to be retried.
+
+        Args:
+            sequence:
+                The sequence number :py:meth:`read_begin` returned.
+
+        Returns:
+            Whether a write was in progress or happened during the read.
+        """
+        return bool(sequence & 1) or self._sequence != sequence
+
+    def read(self, func: Callable, *args, max_retries: Optional[int] = None,
+             **kwargs):
+        """Run a read section optimistically, retrying until it is consistent.
+
+        The read section must be free of side effects, as it may see a torn
+        state and be run many times. Exceptions raised by a torn read are
+        retried as well.
+
+        Args:
+            func:
+                Function that reads the data (and returns the result).
+            max_retries:
+                Optional number of retries before falling back to a real
+                read lock, overrides the instance default.
+
+        Returns:
+            Whatever `func` returned for a consistent read.
+        """
+        max_retries = _utils.pick_first_not_none(max_retries,
+                                                 self.max_retries)
+        retries = 0
+        while max_retries is None or retries <= max_retries:
+            sequence = self._sequence
+            if not sequence & 1:
+                try:
+                    result = func(*args, **kwargs)
+                except Exception:
+                    if self._sequence == sequence:
+                        raise
+                else:
+                    if self._sequence == sequence:
+                        return result
+            retries += 1
+            # Let the writer make progress.
+            _utils.sleep(0)
+        with self._rw_lock.read_lock():
+            return func(*args, **kwargs)
+
+    def acquire_write_lock(self):
+        """Acquire the write lock (reentrant) and start an update."""
+        self._rw_lock.acquire_write_lock()
+        self._write_entries += 1
+        if self._write_entries == 1:
+            self._sequence += 1
+
+    def release_write_lock(self):
+        """Finish an update and release the write lock.
+
+        Raises:
+            RuntimeError: if the current thread does not own the write lock.
+        """
+        if not self._rw_lock.is_writer(check_pending=False):
+            raise RuntimeError(f"Thread {threading.current_thread()} does not"
+                               f" own a write lock")
+        self._write_entries -= 1
+        if self._write_entries == 0:
+            self._sequence += 1
+        self._rw_lock.release_write_lock()
+
+    @contextlib.contextmanager
+    def write_lock(self):
+        """Context manager that grants the write lock for an update."""
+        self.acquire_write_lock()
+        try:
+            yield self
+        finally:
+            self.release_write_lock()
+
+
+class _ReadSection(object):
+    __slots__ = ('version', 'depth', '__weakref__')
+
+    def __init__(self):
+        self.version = None
+        self.depth = 0
+
+
+class VersionedValue(object):
+    """A copy-on-write (RCU style) versioned value container.
+
+    Readers get the current snapshot without any locking. Writers are
+    serialized by a write lock and publish new versions atomically, they
+    never stall readers. The published values must be treated as immutable,
+    as readers may still be looking at the previous versions; a writer can
+    wait for those readers to finish with :py:meth:`synchronize` before it
+    cleans up after an old value.
+    """
+
+    def __init__(self, value: Any = None):
+        """
+        Args:
+            value:
+                Optional initial value (version zero).
+        """
+        self._current = (0, value)
+        self._write_lock = threading.Lock()
+        # The thread running an update function (under the write lock).
+        self._updater = None
+        self._local = threading.local()
+        # Read sections disappear together with the threads they belong to.
+        self._sections = weakref.WeakSet()
+        self._sections_lock = threading.Lock()
+        _utils.reset_after_fork(self)
+
+    def _after_fork_in_child(self):
+        if _utils.green_module() is not None:
+            # Green threads all live on in the child.
+            return
+        # Only the forking thread lives on, the reads of the other threads
+        # never finish and they may have been holding the locks.
+        if self._updater != threading.get_ident():
+            self._write_lock = threading.Lock()
+        self._sections_lock = threading.Lock()
+        self._sections = weakref.WeakSet()
+        section = getattr(self._local, 'section', None)
+        if section is not None:
+            self._sections.add(section)
+
+    @property
+    def version(self) -> int:
+        """The version number of the current value."""
+        return self._current[0]
+
+    def get(self) -> Any:
+        """Get the current value.
+
+        Unlike :py:meth:`read`, the read is invisible to
+        :py:meth:`synchronize`.
+        """
+        return self._current[1]
+
+    def _get_section(self):
+        try:
+            return self._local.section
+        except AttributeError:
+            section = _ReadSection()
+            with self._sections_lock:
+                self._sections.add(section)
+            self._local.section = section
+            return section
+
+    @contextlib.contextmanager
+    def read(self):
+        """Context manager that grants the current value for reading.
+
+        :py:meth:`synchronize` waits for the read to finish if a newer
+        version gets published meanwhile.
+        """
+        section = self._get_section()
+        if not section.depth:
+            # Announce the read before loading the value: if a new version
+            # gets published in between we merely look older than we are.
+            section.version = self._current[0]
+        section.depth += 1
+        try:
+            yield self._current[1]
+        finally:
+            section.depth -= 1
+            if not section.depth:
+                section.version = None
+
+    def set(self, value: Any) -> Any:
+        """Publish a new version.
+
+        Args:
+            value:
+                The new value.
+
+        Returns:
+            The previous value (readers may still be using it).
+        """
+        with self._write_lock:
+            version, old_value = self._current
+            self._current = (version + 1, value)
+        return old_value
+
+    def update(self, func: Callable[[Any], Any]) -> Any:
+        """Publish a new version computed from the current one.
+
+        Args:
+            func:
+                Function that returns the new value given the current value
+                (which it must not modify), called under the write lock.
+
+        Returns:
+            The new value.
+        """
+        with self._write_lock:
+            self._updater = threading.get_ident()
+            try:
+                version, old_value = self._current
+                value = func(old_value)
+                self._current = (version + 1, value)
+            finally:
+                self._updater = None
+        return value
+
+    def synchronize(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the readers of the previous versions to finish.
+
+        Args:
+            timeout:
+                Optional maximal waiting time (in seconds).
+
+        Returns:
+            Whether the readers of the previous versions are gone.
+
+        Raises:
+            RuntimeError: if called from within a read of an old version.
+        """
+        target = self._current[0]
+        section = getattr(self._local, 'section', None)
+        if (section is not None and section.version is not None
+                and section.version < target):
+            raise RuntimeError("Can not wait for own read of an old version")
+        watch = _utils.StopWatch(duration=timeout)
+        r = _utils.Retry(0.001, 0.05, watch=watch)
+
+        def _drained():
+            with self._sections_lock:
+                sections = list(self._sections)
+            for section in sections:
+                version = section.version
+                if version is not None and version < target:
+                    if watch.expired():
+                        return False
+                    raise _utils.RetryAgain()
+            return True
+
+        with watch:
+            return r(_drained)
+
+
 def locked(*args, **kwargs):
     """A locking **method** decorator.
 
@@ -270,6 +1277,15 @@ def locked(*args, **kwargs):
     failures happen) can be provided by passing a logger instance for keyword
     argument ``logger``.
 
+    A maximal waiting time (in seconds) can be provided by passing keyword
+    argument ``timeout``, `threading.ThreadError` is raised if the lock (or
+    all of the locks in a list) could not be acquired in time. A list of locks
+    is then acquired all at once: if one of them is busy, the others are
+    released again and the whole list is retried with a backoff, so that it
+    never waits while holding some of the locks. Passing ``ordered=True``
+    does the same, trying the locks in a canonical order (to avoid lock
+    order inversions between methods that list the same locks differently).
+
     NOTE(paulius): This function is DEPRECATED and will be kept until the end
     of time. It is potentially used by oslo, but too specific to be recommended
     for other projects
@@ -278,16 +1294,33 @@ def locked(*args, **kwargs):
     def decorator(f):
         attr_name = kwargs.get('lock', '_lock')
         logger = kwargs.get('logger')
+        timeout = kwargs.get('timeout')
+        ordered = kwargs.get('ordered', False)
 
         @functools.wraps(f)
         def wrapper(self, *args, **kwargs):
             attr_value = getattr(self, attr_name)
             if isinstance(attr_value, (tuple, list)):
                 with _utils.LockStack(logger=logger) as stack:
-                    for i, lock in enumerate(attr_value):
-                        if not stack.acquire_lock(lock):
-                            raise threading.ThreadError("Unable to acquire"
-                                                        " lock %s" % (i + 1))
+                    if timeout is not None or ordered:
+                        if not stack.acquire_locks(attr_value,
+                                                   timeout=timeout,
+                                                   ordered=ordered):
+                            raise threading.ThreadError(
+                                "Unable to acquire %s locks within %s"
+                                " seconds" % (len(attr_value), timeout))
+                    else:
+                        for i, lock in enumerate(attr_value):
+                            if not stack.acquire_lock(lock):
+                                raise threading.ThreadError(
+                                    "Unable to acquire lock %s" % (i + 1))
+                    return f(self, *args, **kwargs)
+            elif timeout is not None:
+                with _utils.LockStack(logger=logger) as stack:
+                    if not stack.acquire_lock(attr_value, timeout=timeout):
+                        raise threading.ThreadError(
+                            "Unable to acquire lock within %s seconds"
+                            % timeout)
                     return f(self, *args, **kwargs)
             else:
                 lock = attr_value
@@ -0,0 +1,315 @@
+import argparse
+import asyncio
+import collections
+import contextlib
+import errno
+import json
+import logging
+import os
+from pathlib import Path
+import socket
+import threading
+import time
+from typing import Optional
+from typing import Union
+
+from fasteners import _utils
+from fasteners.server_lock import _encode
+
+LOG = logging.getLogger(__name__)
+
+
+class _Request(object):
+    __slots__ = ('client', 'shared', 'since')
+
+    def __init__(self, client, shared):
+        self.client = client
+        self.shared = shared
+        self.since = time.monotonic()
+
+
+class _Key(object):
+    """Holders and (FIFO) queue of waiters of a single key."""
+
+    def __init__(self):
+        self.holders = {}
+        self.queue = collections.deque()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+        self.max_queue = 0
+
+    def grantable(self, request):
+        others = [shared for client, shared in self.holders.items()
+                  if client is not request.client]
+        if request.shared:
+            return all(others)
+        return not others
+
+    def stats(self):
+        return {
+            'holders': len(self.holders),
+            'waiters': len(self.queue),
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'wait_time': self.wait_time,
+            'max_waiters': self.max_queue,
+        }
+
+    def add_to(self, totals):
+        totals['acquisitions'] += self.acquisitions
+        totals['contended'] += self.contended
+        totals['wait_time'] += self.wait_time
+        totals['max_waiters'] = max(totals['max_waiters'], self.max_queue)
+
+
+class LockServer:
+    """A lock server, granting locks to clients on a unix socket.
+
+    Keeps a FIFO queue of waiters per key and pushes grants to them (so
+    waiters do not poll), locks are released when their client disconnects.
+    Conversions (of a held read lock to a write lock) go before the other
+    waiters, which wait for the held read lock to go anyway. Serves
+    :py:class:`.ServerLock` and :py:class:`.ServerReaderWriterLock` clients,
+    and collects contention statistics.
+
+    Run it as a daemon with `python -m fasteners.lock_server <path>`, or in a
+    (background) thread of some process with :py:meth:`start`.
+    """
+
+    def __init__(self,
+                 path: Union[Path, str],
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            path:
+                Path of the unix socket to listen on.
+            logger:
+                Optional logger to use for logging.
+        """
+        self.path = _utils.canonicalize_path(path)
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+        self._keys = {}
+        # Statistics of the keys no longer held nor waited for.
+        self._totals = {'acquisitions': 0, 'contended': 0, 'wait_time': 0.0,
+                        'max_waiters': 0}
+        # Keys held or waited for by every connected client.
+        self._client_keys = {}
+        self._loop = None
+        self._stopped = None
+        self._thread = None
+
+    def _grant(self, key, state):
+        while state.queue and state.grantable(state.queue[0]):
+            request = state.queue.popleft()
+            state.wait_time += time.monotonic() - request.since
+            state.holders[request.client] = request.shared
+            state.acquisitions += 1
+            request.client.write(_encode({'granted': True}))
+        if not state.holders and not state.queue:
+            # Kept forever otherwise, with millions of (transient) keys; only
+            # their statistics are added up.
+            del self._keys[key]
+            state.add_to(self._totals)
+
+    def _acquire(self, client, key, shared, wait):
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = _Key()
+        self._client_keys[client].add(key)
+        request = _Request(client, shared)
+        if client in state.holders:
+            self._convert(key, state, request, wait)
+            return
+        if not state.queue and state.grantable(request):
+            state.queue.append(request)
+            self._grant(key, state)
+            return
+        if not wait:
+            client.write(_encode({'granted': False}))
+            return
+        state.contended += 1
+        state.queue.append(request)
+        state.max_queue = max(state.max_queue, len(state.queue))
+
+    def _convert(self, key, state, request, wait):
+        # The waiters wait for the lock held by this client to go, so a
+        # conversion waiting behind them would wait forever.
+        if state.grantable(request):
+            state.holders[request.client] = request.shared
+            state.acquisitions += 1
+            request.client.write(_encode({'granted': True}))
+            # A downgrade lets readers in.
+            self._grant(key, state)
+            return
+        if not wait or any(other.client in state.holders
+                           for other in state.queue):
+            # Two conversions would wait for each other.
+            request.client.write(_encode({'granted': False}))
+            return
+        state.contended += 1
+        state.queue.appendleft(request)
+        state.max_queue = max(state.max_queue, len(state.queue))
+
+    def _cancel(self, client, key):
+        state = self._keys.get(key)
+        if state is not None:
+            for request in state.queue:
+                if request.client is client:
+                    state.queue.remove(request)
+                    break
+            self._grant(key, state)
+        client.write(_encode({'cancelled': True}))
+
+    def _release(self, client, key):
+        state = self._keys.get(key)
+        if state is not None and client in state.holders:
+            del state.holders[client]
+            self._grant(key, state)
+        client.write(_encode({'released': True}))
+
+    def _disconnect(self, client):
+        for key in self._client_keys.pop(client):
+            state = self._keys.get(key)
+            if state is None:
+                continue
+            state.holders.pop(client, None)
+            for request in [request for request in state.queue
+                            if request.client is client]:
+                state.queue.remove(request)
+            self._grant(key, state)
+
+    async def _serve_client(self, reader, writer):
+        self._client_keys[writer] = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                message = json.loads(line)
+                op = message['op']
+                if op == 'acquire':
+                    self._acquire(writer, message['key'], message['shared'],
+                                  message['wait'])
+                elif op == 'release':
+                    self._release(writer, message['key'])
+                elif op == 'cancel':
+                    self._cancel(writer, message['key'])
+                elif op == 'stats':
+                    writer.write(_encode(self.stats()))
+                else:
+                    raise ValueError("Unknown operation %r" % op)
+        except (ConnectionError, ValueError, KeyError):
+            self.logger.exception("Dropping misbehaving lock client")
+        finally:
+            self._disconnect(writer)
+            writer.close()
+
+    def stats(self) -> dict:
+        """Contention statistics.
+
+        Returns:
+            The number of connected clients; per key that is held or waited
+            for, the number of holders and waiters, of acquisitions, of
+            acquisitions that had to wait, their total waiting time (in
+            seconds) and the maximal number of waiters; and the `totals` of
+            the latter (of all the keys ever used).
+        """
+        totals = dict(self._totals)
+        for state in self._keys.values():
+            state.add_to(totals)
+        return {
+            'clients': len(self._client_keys),
+            'keys': {key: state.stats() for key, state in self._keys.items()},
+            'totals': totals,
+        }
+
+    def _remove_stale_socket(self):
+        # Left behind by a server that is gone, the socket of a running
+        # server is not taken over.
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(os.fsdecode(self.path))
+        except FileNotFoundError:
+            return
+        except ConnectionRefusedError:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+            return
+        finally:
+            sock.close()
+        raise OSError(errno.EADDRINUSE, "A lock server is serving already",
+                      os.fsdecode(self.path))
+
+    async def _serve(self, started):
+        self._remove_stale_socket()
+        server = await asyncio.start_unix_server(self._serve_client,
+                                                 os.fsdecode(self.path))
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self.logger.info("Serving locks on `%s`", self.path)
+        if started is not None:
+            started.set()
+        try:
+            await self._stopped.wait()
+        finally:
+            server.close()
+            for client in list(self._client_keys):
+                client.close()
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+
+    async def serve(self):
+        """Serve clients (until stopped)."""
+        await self._serve(None)
+
+    def serve_forever(self):
+        """Serve clients (until stopped), in the calling thread."""
+        asyncio.run(self.serve())
+
+    def start(self):
+        """Serve clients in a background (daemon) thread."""
+        started = threading.Event()
+        failures = []
+
+        def _run():
+            try:
+                asyncio.run(self._serve(started))
+            except BaseException as e:
+                failures.append(e)
+            finally:
+                started.set()
+
+        self._thread = threading.Thread(target=_run,
+                                        name='fasteners-lock-server')
+        self._thread.daemon = True
+        self._thread.start()
+        started.wait()
+        if failures:
+            self._thread.join()
+            self._thread = None
+            raise failures[0]
+
+    def stop(self):
+        """Stop serving clients."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve fasteners locks on a unix socket.")
+    parser.add_argument('path', help="path of the unix socket")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        LockServer(args.path).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,547 @@
+import contextlib
+import errno
+import json
+import logging
+import os
+from pathlib import Path
+import select
+import threading
+import time
+from typing import Callable
+from typing import Optional
+from typing import Union
+import uuid
+
+from fasteners import _utils
+from fasteners.process_lock import _ensure_tree
+from fasteners.process_lock import InterProcessLock
+from fasteners.process_mechanism import _thread_exclusive_mechanism
+
+LOG = logging.getLogger(__name__)
+
+# Waiters are woken up through fifos, where there are none (windows) they poll.
+_HAS_FIFOS = hasattr(os, 'mkfifo')
+
+
+class _Waiter(object):
+    __slots__ = ('path', 'read_fd', 'write_fd')
+
+    def __init__(self, path, read_fd=None, write_fd=None):
+        self.path = path
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+
+
+class _Waiters(object):
+    """A directory of waiters, one entry (a fifo if possible) per waiter.
+
+    Entries are named after their arrival time, so that waiters are notified
+    in arrival order. Notifying a waiter removes its entry (and writes to its
+    fifo); a waiter without a fifo polls for the removal of its entry.
+    """
+
+    def __init__(self, path, poll_interval, sleep_func):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.sleep_func = sleep_func
+
+    def register(self):
+        _ensure_tree(self.path)
+        name = '%020d-%s-%s' % (time.time_ns(), os.getpid(), uuid.uuid4().hex)
+        path = os.path.join(self.path, os.fsencode(name))
+        if not _HAS_FIFOS:
+            with open(path, 'wb'):
+                pass
+            return _Waiter(path)
+        os.mkfifo(path, 0o600)
+        read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        # Keeping a writer open ourselves, the fifo never reads as closed.
+        write_fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        return _Waiter(path, read_fd, write_fd)
+
+    def unregister(self, waiter):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(waiter.path)
+        if waiter.read_fd is not None:
+            os.close(waiter.read_fd)
+            os.close(waiter.write_fd)
+
+    def wait(self, waiter, timeout):
+        """Wait to be notified.
+
+        Returns:
+            Whether the waiter was notified (within the timeout).
+        """
+        watch = _utils.StopWatch(duration=timeout)
+        with watch:
+            while True:
+                if not os.path.exists(waiter.path):
+                    return True
+                if watch.expired():
+                    return False
+                # Polling (rarely) even with a fifo, in case a notifier died
+                # in between removing the entry and writing to the fifo.
+                nap = self.poll_interval
+                leftover = watch.leftover()
+                if leftover is not None:
+                    nap = min(nap, leftover)
+                if waiter.read_fd is None:
+                    self.sleep_func(nap)
+                    continue
+                readable, _, _ = select.select([waiter.read_fd], [], [], nap)
+                if readable:
+                    with contextlib.suppress(BlockingIOError):
+                        os.read(waiter.read_fd, 4096)
+                    return True
+
+    def notify(self, n=None):
+        """Notify (at most `n`) waiters, in arrival order.
+
+        Returns:
+            The number of notified waiters.
+        """
+        try:
+            names = sorted(os.listdir(self.path))
+        except FileNotFoundError:
+            return 0
+        notified = 0
+        for name in names:
+            if n is not None and notified >= n:
+                break
+            path = os.path.join(self.path, name)
+            if self._notify(path):
+                notified += 1
+        return notified
+
+    def _notify(self, path):
+        if not _HAS_FIFOS:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                return False
+            return True
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                raise
+            # No reader, the waiter died without cleaning up after itself.
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            return False
+        try:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Notified by someone else (or gave up) meanwhile.
+                return False
+            with contextlib.suppress(BlockingIOError):
+                os.write(fd, b'\0')
+        finally:
+            os.close(fd)
+        return True
+
+
+class InterProcessEvent:
+    """An interprocess event.
+
+    Has the same interface as `threading.Event`. The flag is kept in a state
+    file, waiters are woken up by :py:meth:`set` through a fifo (or, where
+    there are none, poll the state file).
+    """
+
+    def __init__(self,
+                 path: Union[Path, str],
+                 poll_interval: float = 1.0,
+                 sleep_func: Callable[[float], None] = _utils.sleep,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            path:
+                Path to the state file of the event, waiters register in a
+                `<path>.waiters` directory.
+            poll_interval:
+                Maximal time (in seconds) in between checks of the state
+                (when waiters are woken up through fifos, only a safety net).
+            sleep_func:
+                Optional function to use for sleeping.
+            logger:
+                Optional logger to use for logging.
+        """
+        self.path = _utils.canonicalize_path(path)
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+        self._waiters = _Waiters(self.path + b'.waiters', poll_interval,
+                                 sleep_func)
+
+    def _write(self, flag):
+        basedir = os.path.dirname(self.path)
+        if basedir:
+            _ensure_tree(basedir)
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, flag)
+        finally:
+            os.close(fd)
+
+    def is_set(self) -> bool:
+        """Whether the flag is set."""
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read(1) == b'1'
+        except FileNotFoundError:
+            return False
+
+    def set(self):
+        """Set the flag, waking up all of the waiters."""
+        self._write(b'1')
+        notified = self._waiters.notify()
+        self.logger.log(_utils.BLATHER, "Set event `%s` (notified %s"
+                        " waiters)", self.path, notified)
+
+    def clear(self):
+        """Reset the flag."""
+        self._write(b'0')
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the flag is set.
+
+        Args:
+            timeout:
+                Maximal waiting time (in seconds).
+
+        Returns:
+            Whether the flag is set (it is unless the wait timed out).
+        """
+        if timeout is not None and timeout < 0:
+            raise ValueError("Timeout must be greater than or equal to zero")
+        if self.is_set():
+            return True
+        watch = _utils.StopWatch(duration=timeout)
+        with watch:
+            while True:
+                # Registered before checking the flag, so a concurrent set()
+                # either is seen or notifies us.
+                waiter = self._waiters.register()
+                try:
+                    if self.is_set():
+                        return True
+                    self._waiters.wait(waiter, watch.leftover())
+                finally:
+                    self._waiters.unregister(waiter)
+                if self.is_set():
+                    return True
+                if watch.expired():
+                    return False
+
+
+class InterProcessCondition:
+    """An interprocess condition variable.
+
+    Has the same interface as `threading.Condition`, paired with an
+    :py:class:`.InterProcessLock`. Waiters are notified in arrival order,
+    woken up through a fifo (or, where there are none, polling).
+    """
+
+    def __init__(self,
+                 path: Union[Path, str],
+                 lock: Optional[InterProcessLock] = None,
+                 poll_interval: float = 1.0,
+                 sleep_func: Callable[[float], None] = _utils.sleep,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            path:
+                Path of the condition, waiters register in a `<path>.waiters`
+                directory.
+            lock:
+                Optional lock to pair the condition with, by default an
+                :py:class:`.InterProcessLock` of the path.
+            poll_interval:
+                Maximal time (in seconds) in between checks of whether the
+                waiter was notified (when waiters are woken up through
+                fifos, only a safety net).
+            sleep_func:
+                Optional function to use for sleeping.
+            logger:
+                Optional logger to use for logging.
+        """
+        self.path = _utils.canonicalize_path(path)
+        self.lock = _utils.pick_first_not_none(
+            lock, InterProcessLock(self.path, sleep_func=sleep_func))
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+        self._waiters = _Waiters(self.path + b'.waiters', poll_interval,
+                                 sleep_func)
+
+    def acquire(self, *args, **kwargs) -> bool:
+        """Acquire the underlying lock (see
+        :py:meth:`.InterProcessLock.acquire`)."""
+        return self.lock.acquire(*args, **kwargs)
+
+    def release(self):
+        """Release the underlying lock."""
+        self.lock.release()
+
+    def __enter__(self):
+        self.lock.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.lock.__exit__(exc_type, exc_val, exc_tb)
+
+    def _check_acquired(self):
+        if not self.lock.acquired:
+            raise RuntimeError("Cannot use an un-acquired condition")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Release the lock, wait until notified and reacquire the lock.
+
+        Args:
+            timeout:
+                Maximal waiting time (in seconds), not including the time
+                needed to reacquire the lock.
+
+        Returns:
+            Whether the waiter was notified (it was unless the wait timed
+            out).
+
+        Raises:
+            RuntimeError: if the lock is not held.
+        """
+        self._check_acquired()
+        if timeout is not None and timeout < 0:
+            raise ValueError("Timeout must be greater than or equal to zero")
+        waiter = self._waiters.register()
+        try:
+            self.lock.release()
+            try:
+                return self._waiters.wait(waiter, timeout)
+            finally:
+                self.lock.acquire()
+        finally:
+            self._waiters.unregister(waiter)
+
+    def wait_for(self,
+                 predicate: Callable[[], bool],
+                 timeout: Optional[float] = None) -> bool:
+        """Wait until a predicate (checked with the lock held) is true.
+
+        Args:
+            predicate:
+                Callable whose result is the condition.
+            timeout:
+                Maximal waiting time (in seconds).
+
+        Returns:
+            The last result of the predicate.
+        """
+        watch = _utils.StopWatch(duration=timeout)
+        with watch:
+            result = predicate()
+            while not result:
+                leftover = watch.leftover()
+                if leftover is not None and leftover <= 0:
+                    break
+                self.wait(leftover)
+                result = predicate()
+        return result
+
+    def notify(self, n: int = 1) -> int:
+        """Wake up (at most) `n` waiters, in arrival order.
+
+        Returns:
+            The number of notified waiters.
+
+        Raises:
+            RuntimeError: if the lock is not held.
+        """
+        self._check_acquired()
+        return self._waiters.notify(n)
+
+    def notify_all(self) -> int:
+        """Wake up all of the waiters.
+
+        Returns:
+            The number of notified waiters.
+
+        Raises:
+            RuntimeError: if the lock is not held.
+        """
+        self._check_acquired()
+        return self._waiters.notify()
+
+
+class InterProcessBarrier:
+    """An interprocess barrier.
+
+    Has the same interface as `threading.Barrier` (without an `action`). The
+    generation, the arrivals and whether the barrier is broken are kept in a
+    state file updated under an :py:class:`.InterProcessLock`, the last
+    arrival wakes up the others through their fifos (or, where there are
+    none, they poll). Waiting parties break the barrier when they notice that
+    another waiting party died.
+    """
+
+    def __init__(self,
+                 path: Union[Path, str],
+                 parties: int,
+                 poll_interval: float = 1.0,
+                 sleep_func: Callable[[float], None] = _utils.sleep,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            path:
+                Path to the state file of the barrier, it is locked with a
+                `<path>.lock` file and waiters register in a `<path>.waiters`
+                directory.
+            parties:
+                Number of parties to wait for.
+            poll_interval:
+                Maximal time (in seconds) in between checks of whether the
+                other waiting parties are alive.
+            sleep_func:
+                Optional function to use for sleeping.
+            logger:
+                Optional logger to use for logging.
+        """
+        if parties < 1:
+            raise ValueError("Parties must be greater than zero")
+        self.path = _utils.canonicalize_path(path)
+        self.parties = parties
+        self.poll_interval = poll_interval
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+        self.sleep_func = sleep_func
+        self._waiters = _Waiters(self.path + b'.waiters', poll_interval,
+                                 sleep_func)
+
+    def _locked(self):
+        return InterProcessLock(self.path + b'.lock',
+                                sleep_func=self.sleep_func,
+                                mechanism=_thread_exclusive_mechanism())
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            # Never written (or by a writer that crashed half way).
+            return {'generation': 0, 'arrivals': [], 'broken': False,
+                    'reset': None}
+
+    def _write(self, state):
+        tmp_path = self.path + b'.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(state).encode())
+        os.replace(tmp_path, self.path)
+
+    def _break(self, state):
+        state['broken'] = True
+        self._write(state)
+        self._waiters.notify()
+
+    def _is_broken(self, state, generation):
+        return state['reset'] == generation or (
+            state['generation'] == generation and state['broken'])
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        """Wait until all of the parties arrived.
+
+        Args:
+            timeout:
+                Maximal waiting time (in seconds), the barrier breaks when it
+                is exceeded.
+
+        Returns:
+            The arrival index of the party (from 0 to `parties - 1`).
+
+        Raises:
+            threading.BrokenBarrierError: if the barrier is (or gets) broken,
+                reset, or the wait timed out.
+        """
+        if timeout is not None and timeout < 0:
+            raise ValueError("Timeout must be greater than or equal to zero")
+        watch = _utils.StopWatch(duration=timeout)
+        with watch:
+            with self._locked():
+                state = self._read()
+                if state['broken']:
+                    raise threading.BrokenBarrierError
+                generation = state['generation']
+                index = len(state['arrivals'])
+                if index + 1 == self.parties:
+                    state['generation'] += 1
+                    state['arrivals'] = []
+                    self._write(state)
+                    notified = self._waiters.notify()
+                    self.logger.log(_utils.BLATHER, "Barrier `%s` passed"
+                                    " (notified %s parties)", self.path,
+                                    notified)
+                    return index
+                pid = os.getpid()
+                state['arrivals'].append(
+                    [pid, _utils.process_start_time(pid)])
+                self._write(state)
+                waiter = self._waiters.register()
+            try:
+                while True:
+                    nap = self.poll_interval
+                    leftover = watch.leftover()
+                    if leftover is not None:
+                        nap = min(nap, leftover)
+                    notified = self._waiters.wait(waiter, nap)
+                    with self._locked():
+                        state = self._read()
+                        if self._is_broken(state, generation):
+                            raise threading.BrokenBarrierError
+                        if state['generation'] != generation:
+                            return index
+                        if watch.expired():
+                            self._break(state)
+                            raise threading.BrokenBarrierError
+                        for pid, start_time in state['arrivals']:
+                            if _utils.process_exited(pid, start_time):
+                                self.logger.warning(
+                                    "Breaking barrier `%s`, party %s died",
+                                    self.path, pid)
+                                self._break(state)
+                                raise threading.BrokenBarrierError
+                        if notified:
+                            # Woken up for nothing, register again.
+                            self._waiters.unregister(waiter)
+                            waiter = self._waiters.register()
+            finally:
+                self._waiters.unregister(waiter)
+
+    def reset(self):
+        """Return the barrier to its initial (empty, not broken) state.
+
+        Parties waiting on it get a `threading.BrokenBarrierError`.
+        """
+        with self._locked():
+            state = self._read()
+            if state['arrivals'] or state['broken']:
+                state['reset'] = state['generation']
+                state['generation'] += 1
+            state['arrivals'] = []
+            state['broken'] = False
+            self._write(state)
+            self._waiters.notify()
+
+    def abort(self):
+        """Break the barrier, parties waiting on it (or arriving later, until
+        it is reset) get a `threading.BrokenBarrierError`."""
+        with self._locked():
+            self._break(self._read())
+
+    @property
+    def n_waiting(self) -> int:
+        """The number of parties waiting on the barrier."""
+        with self._locked():
+            return len(self._read()['arrivals'])
+
+    @property
+    def broken(self) -> bool:
+        """Whether the barrier is broken."""
+        with self._locked():
+            return self._read()['broken']
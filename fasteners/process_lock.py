@@ -21,19 +21,36 @@ import functools
 import logging
 import os
 from pathlib import Path
+import struct
 import threading
-import time
 from typing import Callable
+from typing import List
 from typing import Optional
 from typing import Union
 
 from fasteners import _utils
-from fasteners.process_mechanism import _interprocess_mechanism
-from fasteners.process_mechanism import _interprocess_reader_writer_mechanism
+from fasteners.process_mechanism import get_mechanism
+from fasteners.process_mechanism import InterProcessMechanism
+from fasteners.process_mechanism import InterProcessReaderWriterLockMechanism
+from fasteners.process_mechanism import LockHolder
+
+if os.name != 'nt':
+    import fcntl
 
 LOG = logging.getLogger(__name__)
 
 
+def _with_local_holder(holders, mode):
+    # F_GETLK never reports the locks of this very process, a lock object
+    # holding the lock (in `mode`) adds itself.
+    if mode is None:
+        return holders
+    me = os.getpid()
+    if not any(holder.pid == me for holder in holders):
+        holders.append(LockHolder(me, mode, None))
+    return holders
+
+
 def _ensure_tree(path):
     """Create a directory (and any ancestor directories required).
 
@@ -55,6 +72,115 @@ def _ensure_tree(path):
         return True
 
 
+class _TicketQueue:
+    """A (cross process) FIFO ticket queue, stored in a tickets file.
+
+    The file starts with two counters, the next ticket to hand out and the
+    ticket now being served, updated while holding a (byte range) lock of
+    them. Every waiter also holds a lock of a byte (past the counters) of its
+    ticket, so that waiters can tell whether the waiter being served died
+    (and then skip it).
+    """
+
+    _COUNTERS = struct.Struct('<qq')
+
+    # Tickets of this process, fcntl locks can not tell lock objects of a
+    # single process apart (the lock just also protects the counters in
+    # between threads).
+    _owned = set()
+    _owned_lock = threading.Lock()
+
+    # Closing any descriptor of a file drops all of the fcntl locks of the
+    # process on it, so every tickets file is opened (once) for good.
+    _fds = {}
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def open(self):
+        if self.fd is None:
+            with self._owned_lock:
+                fd = self._fds.get(self.path)
+                if fd is None:
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                    self._fds[self.path] = fd
+            self.fd = fd
+
+    @classmethod
+    def _after_fork_in_child(cls):
+        # Locks (and so tickets) are not inherited.
+        cls._owned_lock = threading.Lock()
+        cls._owned.clear()
+
+    @contextmanager
+    def _counters(self):
+        with self._owned_lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self._COUNTERS.size, 0)
+            try:
+                data = os.pread(self.fd, self._COUNTERS.size, 0)
+                if len(data) < self._COUNTERS.size:
+                    counters = [0, 0]
+                else:
+                    counters = list(self._COUNTERS.unpack(data))
+                before = list(counters)
+                yield counters
+                if counters != before:
+                    os.pwrite(self.fd, self._COUNTERS.pack(*counters), 0)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self._COUNTERS.size, 0)
+
+    def _slot(self, ticket):
+        return self._COUNTERS.size + ticket
+
+    def take(self, only_if_first=False):
+        """Take a ticket, None if `only_if_first` and someone is waiting."""
+        with self._counters() as counters:
+            ticket, serving = counters
+            while serving != ticket and self._is_abandoned(serving):
+                counters[1] = serving = serving + 1
+            if only_if_first and ticket != serving:
+                return None
+            counters[0] = ticket + 1
+            fcntl.lockf(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1,
+                        self._slot(ticket))
+            self._owned.add((self.path, ticket))
+        return ticket
+
+    def distance(self, ticket):
+        """How many tickets are before the given one, skipping dead ones."""
+        with self._counters() as counters:
+            serving = counters[1]
+            if serving != ticket and self._is_abandoned(serving):
+                counters[1] = serving = serving + 1
+        return ticket - serving
+
+    def _is_abandoned(self, ticket):
+        if (self.path, ticket) in self._owned:
+            return False
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1,
+                        self._slot(ticket))
+        except (IOError, OSError) as e:
+            if e.errno in (errno.EACCES, errno.EAGAIN):
+                return False
+            raise
+        fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self._slot(ticket))
+        return True
+
+    def done(self, ticket):
+        """Give up (or be done being served with) a ticket."""
+        with self._counters() as counters:
+            if counters[1] == ticket:
+                counters[1] = ticket + 1
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self._slot(ticket))
+            self._owned.discard((self.path, ticket))
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_TicketQueue._after_fork_in_child)
+
+
 class InterProcessLock:
     """An interprocess lock."""
 
@@ -63,22 +189,67 @@ class InterProcessLock:
 
     def __init__(self,
                  path: Union[Path, str],
-                 sleep_func: Callable[[float], None] = time.sleep,
-                 logger: Optional[logging.Logger] = None):
+                 sleep_func: Callable[[float], None] = _utils.sleep,
+                 logger: Optional[logging.Logger] = None,
+                 mechanism: Union[str, InterProcessMechanism, None] = None,
+                 fair: bool = False,
+                 adaptive: bool = False,
+                 publish_stats: bool = False):
         """
         args:
             path:
                 Path to the file that will be used for locking.
             sleep_func:
-                Optional function to use for sleeping.
+                Optional function to use for sleeping. By default sleeps
+                cooperatively when eventlet or gevent monkey patched threads.
             logger:
                 Optional logger to use for logging.
+            mechanism:
+                Optional locking backend, either the name it was registered
+                under (e.g. `'fcntl'`, `'flock'`, `'mkdir'` or `'excl'`) or an
+                :py:class:`.InterProcessMechanism` instance. Defaults to the
+                platform default.
+            fair:
+                Whether waiters get the lock in arrival order (first come,
+                first served), using a ticket queue in a `<path>.tickets`
+                file. Not supported on windows.
+            adaptive:
+                Whether to wait as long as the lock is expected to be held
+                (from its recent hold times), spinning for locks held briefly
+                and sleeping (longer than `max_delay`) for locks held long.
+            publish_stats:
+                Whether to share the recent hold and wait times of the lock
+                with other processes, in a `<path>.stats` file.
         """
         self.lockfile = None
         self.path = _utils.canonicalize_path(path)
         self.acquired = False
         self.sleep_func = sleep_func
         self.logger = _utils.pick_first_not_none(logger, LOG)
+        self.mechanism = get_mechanism(mechanism)
+        if fair and os.name == 'nt':
+            raise ValueError("Fair locks are not supported on windows")
+        self._tickets = _TicketQueue(self.path + b'.tickets') if fair else None
+        self._ticket = None
+        self.adaptive = adaptive
+        self.stats = None
+        if adaptive or publish_stats:
+            self.stats = _utils.HoldStats.for_path(self.path,
+                                                   publish=publish_stats)
+        self._held_since = None
+        self._watch = None
+        _utils.reset_after_fork(self)
+
+    def _after_fork_in_child(self):
+        # Locks are not inherited (flock ones are shared with the parent,
+        # which releases them), the handle is reopened on the next acquire.
+        self.acquired = False
+        self._ticket = None
+        self._held_since = None
+        self._watch = None
+        lockfile, self.lockfile = self.lockfile, None
+        if lockfile is not None:
+            self.mechanism.close_handle(lockfile)
 
     def _try_acquire(self, blocking, watch):
         try:
@@ -107,17 +278,15 @@ class InterProcessLock:
             if made_basedir:
                 self.logger.log(_utils.BLATHER,
                                 'Created lock base path `%s`', basedir)
-        # Open in append mode so we don't overwrite any potential contents of
-        # the target file. This eliminates the possibility of an attacker
-        # creating a symlink to an important file in our lock path.
-        if self.lockfile is None or self.lockfile.closed:
-            self.lockfile = open(self.path, 'a')
+        if self.lockfile is None or getattr(self.lockfile, 'closed', False):
+            self.lockfile = self.mechanism.get_handle(self.path)
 
     def acquire(self,
                 blocking: bool = True,
                 delay: float = 0.01,
                 max_delay: float = 0.1,
-                timeout: Optional[float] = None) -> bool:
+                timeout: Optional[float] = None,
+                cancel: Optional[_utils.CancellationToken] = None) -> bool:
         """Attempt to acquire the lock.
 
         Args:
@@ -131,6 +300,9 @@ class InterProcessLock:
                 acquire (in seconds).
             timeout:
                 When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
 
         Returns:
             whether or not the acquisition succeeded
@@ -143,23 +315,79 @@ class InterProcessLock:
             max_delay = delay
         self._do_open()
         watch = _utils.StopWatch(duration=timeout)
-        r = _utils.Retry(delay, max_delay,
-                         sleep_func=self.sleep_func, watch=watch)
+        r = self._retry(delay, max_delay, watch, cancel)
         with watch:
-            gotten = r(self._try_acquire, blocking, watch)
+            if self._tickets is None:
+                gotten = r(self._try_acquire, blocking, watch)
+            else:
+                gotten = self._acquire_fair(blocking, delay, max_delay, watch,
+                                            cancel)
         if not gotten:
             return False
         else:
             self.acquired = True
+            self._watch = _utils.watch_hold(self)
+            if self.stats is not None:
+                self._held_since = self.stats.acquired(watch.elapsed())
             self.logger.log(_utils.BLATHER,
                             "Acquired file lock `%s` after waiting %0.3fs [%s"
                             " attempts were required]", self.path,
                             watch.elapsed(), r.attempts)
             return True
 
+    def _retry(self, delay, max_delay, watch, cancel):
+        if self.adaptive:
+            return _utils.AdaptiveRetry(self.stats, delay, max_delay,
+                                        sleep_func=self.sleep_func,
+                                        watch=watch, cancel=cancel, lock=self)
+        return _utils.Retry(delay, max_delay,
+                            sleep_func=self.sleep_func, watch=watch,
+                            cancel=cancel, lock=self)
+
+    def _acquire_fair(self, blocking, delay, max_delay, watch, cancel):
+        if cancel is not None and cancel.is_set():
+            return False
+        self._tickets.open()
+        ticket = self._tickets.take(only_if_first=not blocking)
+        if ticket is None:
+            return False
+        gotten = False
+        waiting = None
+        try:
+            while True:
+                distance = self._tickets.distance(ticket)
+                if distance <= 0:
+                    gotten = self._try_acquire(False, watch)
+                    if gotten:
+                        self._ticket = ticket
+                        return True
+                    # Held by someone not queueing (not in fair mode).
+                    distance = 1
+                if not blocking or watch.expired():
+                    return False
+                if waiting is None and _utils.active_watchdog is not None:
+                    waiting = _utils.active_watchdog.waiting(self)
+                # The further back in the queue, the longer the nap.
+                nap = min(max_delay, delay * distance)
+                if self.adaptive:
+                    hold = self.stats.hold()
+                    if hold is not None:
+                        # Those ahead are going to hold it about this long.
+                        nap = max(nap, hold * (distance - 1))
+                leftover = watch.leftover()
+                if leftover is not None:
+                    nap = min(nap, leftover)
+                if _utils.cancellable_sleep(nap, self.sleep_func, cancel):
+                    return False
+        finally:
+            if waiting is not None:
+                waiting.done()
+            if not gotten:
+                self._tickets.done(ticket)
+
     def _do_close(self):
         if self.lockfile is not None:
-            self.lockfile.close()
+            self.mechanism.close_handle(self.lockfile)
             self.lockfile = None
 
     def __enter__(self):
@@ -175,6 +403,13 @@ class InterProcessLock:
         """Release the previously acquired lock."""
         if not self.acquired:
             raise threading.ThreadError("Unable to release an unacquired lock")
+        if self._watch is not None:
+            self._watch.done()
+            self._watch = None
+        if self._held_since is not None:
+            # Still holding the lock, so holders take turns updating them.
+            self.stats.released(self._held_since)
+            self._held_since = None
         try:
             self.unlock()
         except Exception as e:
@@ -182,6 +417,10 @@ class InterProcessLock:
             self.logger.exception(msg)
             raise threading.ThreadError(msg) from e
         else:
+            if self._ticket is not None:
+                # Next in line, please.
+                self._tickets.done(self._ticket)
+                self._ticket = None
             self.acquired = False
             try:
                 self._do_close()
@@ -199,11 +438,38 @@ class InterProcessLock:
     def exists(self):
         return os.path.exists(self.path)
 
+    def holders(self) -> Optional[List[LockHolder]]:
+        """List the holders of the lock (including this process), without
+        locking it.
+
+        Uses `/proc/locks` on linux, elsewhere `fcntl` locks are probed with
+        `F_GETLK` (which only reports one other holder, this process is only
+        reported when this very lock object holds the lock).
+
+        Returns:
+            A list of :py:class:`.LockHolder` (with their pids), None if the
+            lock backend can not tell (e.g. `flock` locks on non linux
+            systems, or on windows).
+        """
+        try:
+            holders = self.mechanism.holders(self.path)
+        except NotImplementedError:
+            return None
+        return _with_local_holder(holders, 'w' if self.acquired else None)
+
+    def is_locked(self) -> Optional[bool]:
+        """Whether the lock is held by anyone, without locking it (None if
+        that can not be told, see :py:meth:`holders`)."""
+        if self.acquired:
+            return True
+        holders = self.holders()
+        return None if holders is None else bool(holders)
+
     def trylock(self):
-        _interprocess_mechanism.trylock(self.lockfile)
+        self.mechanism.trylock(self.lockfile)
 
     def unlock(self):
-        _interprocess_mechanism.unlock(self.lockfile)
+        self.mechanism.unlock(self.lockfile)
 
 
 class InterProcessReaderWriterLock:
@@ -214,21 +480,58 @@ class InterProcessReaderWriterLock:
 
     def __init__(self,
                  path: Union[Path, str],
-                 sleep_func: Callable[[float], None] = time.sleep,
-                 logger: Optional[logging.Logger] = None):
+                 sleep_func: Callable[[float], None] = _utils.sleep,
+                 logger: Optional[logging.Logger] = None,
+                 mechanism: Union[str, InterProcessReaderWriterLockMechanism,
+                                  None] = None,
+                 adaptive: bool = False,
+                 publish_stats: bool = False):
         """
         Args:
             path:
                 Path to the file that will be used for locking.
             sleep_func:
-                Optional function to use for sleeping.
+                Optional function to use for sleeping. By default sleeps
+                cooperatively when eventlet or gevent monkey patched threads.
             logger:
                 Optional logger to use for logging.
+            mechanism:
+                Optional locking backend, either the name it was registered
+                under (e.g. `'fcntl'` or `'flock'`) or an
+                :py:class:`.InterProcessReaderWriterLockMechanism` instance.
+                Defaults to the platform default.
+            adaptive:
+                Whether to wait as long as the lock is expected to be held
+                (from its recent hold times), spinning for locks held briefly
+                and sleeping (longer than `max_delay`) for locks held long.
+            publish_stats:
+                Whether to share the recent hold and wait times of the lock
+                with other processes, in a `<path>.stats` file.
         """
         self.lockfile = None
         self.path = _utils.canonicalize_path(path)
         self.sleep_func = sleep_func
         self.logger = _utils.pick_first_not_none(logger, LOG)
+        self.mechanism = get_mechanism(mechanism, reader_writer=True)
+        self.adaptive = adaptive
+        self.stats = None
+        if adaptive or publish_stats:
+            self.stats = _utils.HoldStats.for_path(self.path,
+                                                   publish=publish_stats)
+        self._held_since = None
+        self._held_mode = None
+        self._watch = None
+        _utils.reset_after_fork(self)
+
+    def _after_fork_in_child(self):
+        # Locks are not inherited (flock ones are shared with the parent,
+        # which releases them), the handle is reopened on the next acquire.
+        self._held_since = None
+        self._held_mode = None
+        self._watch = None
+        lockfile, self.lockfile = self.lockfile, None
+        if lockfile is not None:
+            self.mechanism.close_handle(lockfile)
 
     @contextmanager
     def read_lock(self, delay=0.01, max_delay=0.1):
@@ -260,7 +563,7 @@ class InterProcessReaderWriterLock:
 
     def _try_acquire(self, blocking, watch, exclusive):
         try:
-            gotten = _interprocess_reader_writer_mechanism.trylock(self.lockfile, exclusive)
+            gotten = self.mechanism.trylock(self.lockfile, exclusive)
         except Exception as e:
             raise threading.ThreadError(
                 "Unable to acquire lock on {} due to {}!".format(self.path, e))
@@ -281,13 +584,15 @@ class InterProcessReaderWriterLock:
                 self.logger.log(_utils.BLATHER,
                                 'Created lock base path `%s`', basedir)
         if self.lockfile is None:
-            self.lockfile = _interprocess_reader_writer_mechanism.get_handle(self.path)
+            self.lockfile = self.mechanism.get_handle(self.path)
 
     def acquire_read_lock(self,
                           blocking: bool = True,
                           delay: float = 0.01,
                           max_delay: float = 0.1,
-                          timeout: float = None) -> bool:
+                          timeout: float = None,
+                          cancel: Optional[_utils.CancellationToken] = None
+                          ) -> bool:
         """Attempt to acquire a reader's lock.
 
         Args:
@@ -301,17 +606,23 @@ class InterProcessReaderWriterLock:
                 acquire (in seconds).
             timeout:
                 When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
 
         Returns:
             whether or not the acquisition succeeded
         """
-        return self._acquire(blocking, delay, max_delay, timeout, exclusive=False)
+        return self._acquire(blocking, delay, max_delay, timeout,
+                             exclusive=False, cancel=cancel)
 
     def acquire_write_lock(self,
                            blocking: bool = True,
                            delay: float = 0.01,
                            max_delay: float = 0.1,
-                           timeout: float = None) -> bool:
+                           timeout: float = None,
+                           cancel: Optional[_utils.CancellationToken] = None
+                           ) -> bool:
         """Attempt to acquire a writer's lock.
 
         Args:
@@ -325,15 +636,19 @@ class InterProcessReaderWriterLock:
                 acquire (in seconds).
             timeout:
                 When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
 
         Returns:
             whether or not the acquisition succeeded
         """
-        return self._acquire(blocking, delay, max_delay, timeout, exclusive=True)
+        return self._acquire(blocking, delay, max_delay, timeout,
+                             exclusive=True, cancel=cancel)
 
     def _acquire(self, blocking=True,
                  delay=0.01, max_delay=0.1,
-                 timeout=None, exclusive=True):
+                 timeout=None, exclusive=True, cancel=None):
 
         if delay < 0:
             raise ValueError("Delay must be greater than or equal to zero")
@@ -343,28 +658,77 @@ class InterProcessReaderWriterLock:
             max_delay = delay
         self._do_open()
         watch = _utils.StopWatch(duration=timeout)
-        r = _utils.Retry(delay, max_delay,
-                         sleep_func=self.sleep_func, watch=watch)
+        r = self._retry(delay, max_delay, watch, cancel)
         with watch:
             gotten = r(self._try_acquire, blocking, watch, exclusive)
         if not gotten:
             return False
         else:
+            self._held_mode = 'w' if exclusive else 'r'
+            self._watch = _utils.watch_hold(self)
+            if self.stats is not None:
+                self._held_since = self.stats.acquired(watch.elapsed())
             self.logger.log(_utils.BLATHER,
                             "Acquired file lock `%s` after waiting %0.3fs [%s"
                             " attempts were required]", self.path,
                             watch.elapsed(), r.attempts)
             return True
 
+    def _retry(self, delay, max_delay, watch, cancel):
+        if self.adaptive:
+            return _utils.AdaptiveRetry(self.stats, delay, max_delay,
+                                        sleep_func=self.sleep_func,
+                                        watch=watch, cancel=cancel, lock=self)
+        return _utils.Retry(delay, max_delay,
+                            sleep_func=self.sleep_func, watch=watch,
+                            cancel=cancel, lock=self)
+
     def _do_close(self):
         if self.lockfile is not None:
-            _interprocess_reader_writer_mechanism.close_handle(self.lockfile)
+            self.mechanism.close_handle(self.lockfile)
             self.lockfile = None
 
+    def holders(self) -> Optional[List[LockHolder]]:
+        """List the holders of the lock (including this process), without
+        locking it.
+
+        Uses `/proc/locks` on linux, elsewhere `fcntl` locks are probed with
+        `F_GETLK` (which only reports one other holder, this process is only
+        reported when this very lock object holds the lock).
+
+        Returns:
+            A list of :py:class:`.LockHolder` (with their pids and modes, a
+            writer or any number of readers), None if the lock backend can
+            not tell (e.g. `flock` locks on non linux systems, or on
+            windows).
+        """
+        try:
+            holders = self.mechanism.holders(self.path)
+        except NotImplementedError:
+            return None
+        return _with_local_holder(holders, self._held_mode)
+
+    def is_locked(self) -> Optional[bool]:
+        """Whether the lock is held by anyone (writer or readers), without
+        locking it (None if that can not be told, see :py:meth:`holders`).
+        """
+        holders = self.holders()
+        return None if holders is None else bool(holders)
+
+    def _record_release(self):
+        self._held_mode = None
+        if self._watch is not None:
+            self._watch.done()
+            self._watch = None
+        if self._held_since is not None:
+            self.stats.released(self._held_since)
+            self._held_since = None
+
     def release_write_lock(self):
         """Release the writer's lock."""
+        self._record_release()
         try:
-            _interprocess_reader_writer_mechanism.unlock(self.lockfile)
+            self.mechanism.unlock(self.lockfile)
         except IOError:
             self.logger.exception("Could not unlock the acquired lock opened"
                                   " on `%s`", self.path)
@@ -381,8 +745,9 @@ class InterProcessReaderWriterLock:
 
     def release_read_lock(self):
         """Release the reader's lock."""
+        self._record_release()
         try:
-            _interprocess_reader_writer_mechanism.unlock(self.lockfile)
+            self.mechanism.unlock(self.lockfile)
         except IOError:
             self.logger.exception("Could not unlock the acquired lock opened"
                                   " on `%s`", self.path)
@@ -1,45 +1,207 @@
 from abc import ABC
 from abc import abstractmethod
+import collections
+import contextlib
 import errno
 import os
+import struct
+import sys
+import threading
+import time
 
+from fasteners import _utils
 
-class _InterProcessReaderWriterLockMechanism(ABC):
 
-    @staticmethod
+LockHolder = collections.namedtuple('LockHolder', ['pid', 'mode', 'host'])
+LockHolder.__doc__ = """A holder of an interprocess lock.
+
+Attributes:
+    pid: Process id of the holder, None if unknown (e.g. for open file
+        description locks).
+    mode: `'w'` for an exclusive (writer) holder, `'r'` for a shared (reader)
+        one.
+    host: Host of the holder, only known by the backends writing an owner
+        record (None otherwise).
+"""
+
+
+class InterProcessReaderWriterLockMechanism(ABC):
+    """Interface of the interprocess readers writer lock backends.
+
+    A backend works on a handle it creates (and closes) itself for the lock
+    path.
+    """
+
     @abstractmethod
-    def trylock(lockfile, exclusive):
-        ...
+    def trylock(self, lockfile, exclusive):
+        """Try to lock the handle, without blocking.
+
+        Returns:
+            Whether the lock was acquired.
+        """
 
-    @staticmethod
     @abstractmethod
-    def unlock(lockfile):
-        ...
+    def unlock(self, lockfile):
+        """Unlock the handle."""
 
-    @staticmethod
     @abstractmethod
-    def get_handle(path):
-        ...
+    def get_handle(self, path):
+        """Open a handle for the lock path."""
 
-    @staticmethod
     @abstractmethod
-    def close_handle(lockfile):
-        ...
+    def close_handle(self, lockfile):
+        """Close a handle opened by :py:meth:`get_handle`."""
 
+    def holders(self, path):
+        """List the holders of the lock of a path, without locking it.
 
-class _InterProcessMechanism(ABC):
-    @staticmethod
-    @abstractmethod
-    def trylock(lockfile):
-        ...
+        Returns:
+            A list of :py:class:`.LockHolder`.
+
+        Raises:
+            NotImplementedError: if the backend can not tell.
+        """
+        raise NotImplementedError("%s can not list lock holders"
+                                  % type(self).__name__)
+
+
+class InterProcessMechanism(ABC):
+    """Interface of the interprocess (exclusive) lock backends.
+
+    A backend works on a handle it creates (and closes) itself for the lock
+    path, by default a file opened in append mode.
+    """
 
-    @staticmethod
     @abstractmethod
-    def unlock(lockfile):
-        ...
+    def trylock(self, lockfile):
+        """Try to lock the handle, without blocking.
 
+        Raises:
+            OSError: with errno `EACCES` or `EAGAIN` if the lock is held by
+                someone else (with any other errno on failure).
+        """
+
+    @abstractmethod
+    def unlock(self, lockfile):
+        """Unlock the handle."""
+
+    def get_handle(self, path):
+        """Open a handle for the lock path."""
+        # Open in append mode so we don't overwrite any potential contents of
+        # the target file. This eliminates the possibility of an attacker
+        # creating a symlink to an important file in our lock path.
+        return open(path, 'a')
+
+    def close_handle(self, lockfile):
+        """Close a handle opened by :py:meth:`get_handle`."""
+        lockfile.close()
 
-class _WindowsInterProcessMechanism(_InterProcessMechanism):
+    def holders(self, path):
+        """List the holders of the lock of a path, without locking it.
+
+        Returns:
+            A list of :py:class:`.LockHolder`.
+
+        Raises:
+            NotImplementedError: if the backend can not tell.
+        """
+        raise NotImplementedError("%s can not list lock holders"
+                                  % type(self).__name__)
+
+
+# For backwards compatibility.
+_InterProcessReaderWriterLockMechanism = InterProcessReaderWriterLockMechanism
+_InterProcessMechanism = InterProcessMechanism
+
+
+_PROC_LOCKS = '/proc/locks'
+
+
+def _kernel_holders(path, kinds):
+    """List the holders of kernel locks of a file, from `/proc/locks`.
+
+    Returns:
+        The holders, None if `/proc/locks` is not available (not linux).
+    """
+    try:
+        f = open(_PROC_LOCKS)
+    except OSError:
+        return None
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        f.close()
+        return []
+    # Files are named `major:minor:inode` (the device numbers in hex).
+    name = '%02x:%02x:%d' % (os.major(st.st_dev), os.minor(st.st_dev),
+                             st.st_ino)
+    holders = []
+    with f:
+        for line in f:
+            # e.g. `1: POSIX  ADVISORY  WRITE 1234 fd:00:5678 0 EOF`, lines
+            # of blocked waiters have a `->` after the number.
+            fields = line.split()
+            if len(fields) < 6 or fields[1] == '->':
+                continue
+            kind, _kind, mode, pid, file_name = fields[1:6]
+            if kind not in kinds or file_name != name:
+                continue
+            pid = int(pid)
+            holders.append(LockHolder(pid if pid > 0 else None,
+                                      'r' if mode == 'READ' else 'w', None))
+    return holders
+
+
+# Files probed with F_GETLK, opened once for good (closing any descriptor of
+# a file drops all of the fcntl locks of the process on it).
+_probe_fds = {}
+_probe_fds_lock = threading.Lock()
+
+
+def _fcntl_holders(path):
+    """List the holders of fcntl locks of a file, without `/proc/locks`.
+
+    F_GETLK only reports a single conflicting lock, and never the locks of
+    this very process.
+    """
+    holders = _kernel_holders(path, ('POSIX', 'OFDLCK'))
+    if holders is not None:
+        return holders
+    with _probe_fds_lock:
+        fd = _probe_fds.get(path)
+        if fd is None:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                return []
+            _probe_fds[path] = fd
+    if sys.platform.startswith('linux'):
+        # struct flock: type, whence, start, length, pid.
+        layout = struct.Struct('hhqqi4x')
+        probe = layout.pack(fcntl.F_WRLCK, os.SEEK_SET, 0, 0, 0)
+        lock_type, _whence, _start, _length, pid = layout.unpack(
+            fcntl.fcntl(fd, fcntl.F_GETLK, probe))
+    else:
+        # The BSD (and macOS) struct flock: start, length, pid, type, whence.
+        layout = struct.Struct('qqihh')
+        probe = layout.pack(0, 0, 0, fcntl.F_WRLCK, os.SEEK_SET)
+        _start, _length, pid, lock_type, _whence = layout.unpack(
+            fcntl.fcntl(fd, fcntl.F_GETLK, probe))
+    if lock_type == fcntl.F_UNLCK:
+        return []
+    return [LockHolder(pid if pid > 0 else None,
+                       'r' if lock_type == fcntl.F_RDLCK else 'w', None)]
+
+
+def _flock_holders(path):
+    holders = _kernel_holders(path, ('FLOCK',))
+    if holders is None:
+        raise NotImplementedError("flock lock holders can only be listed on"
+                                  " linux")
+    return holders
+
+
+class _WindowsInterProcessMechanism(InterProcessMechanism):
     """Interprocess lock implementation that works on windows systems."""
 
     @staticmethod
@@ -53,7 +215,7 @@ class _WindowsInterProcessMechanism(_InterProcessMechanism):
         msvcrt.locking(fileno, msvcrt.LK_UNLCK, 1)
 
 
-class _FcntlInterProcessMechanism(_InterProcessMechanism):
+class _FcntlInterProcessMechanism(InterProcessMechanism):
     """Interprocess lock implementation that works on posix systems."""
 
     @staticmethod
@@ -64,13 +226,287 @@ class _FcntlInterProcessMechanism(_InterProcessMechanism):
     def unlock(lockfile):
         fcntl.lockf(lockfile, fcntl.LOCK_UN)
 
+    @staticmethod
+    def holders(path):
+        return _fcntl_holders(path)
+
+
+class _FlockInterProcessMechanism(InterProcessMechanism):
+    """Interprocess lock implementation based on `flock(2)`.
+
+    Unlike `fcntl` record locks, `flock` locks belong to the open file (so
+    they also exclude other handles within the same process).
+    """
+
+    @staticmethod
+    def trylock(lockfile):
+        fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    @staticmethod
+    def unlock(lockfile):
+        fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    @staticmethod
+    def holders(path):
+        return _flock_holders(path)
+
+
+_OWNER_MAGIC = 'fasteners'
+
+# Files without an owner record which are older than this (in seconds) were
+# not created by a backend still busy writing its record, they are foreign.
+_OWNER_GRACE = 1.0
+
+
+def _hostname():
+    try:
+        return os.uname().nodename
+    except AttributeError:
+        return os.environ.get('COMPUTERNAME', '')
+
+
+def _owner_record():
+    return '%s:%s:%s\n' % (_OWNER_MAGIC, _hostname(), os.getpid())
+
+
+def _write_owner(path):
+    fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    try:
+        os.write(fd, _owner_record().encode())
+    finally:
+        os.close(fd)
+
+
+def _read_owner(path):
+    """Read an owner record.
+
+    Returns:
+        The `(host, pid)` of the owner, None if the record is (still) empty.
+
+    Raises:
+        OSError: with errno `EEXIST` if the file is not an owner record.
+    """
+    with open(path, 'rb') as f:
+        record = f.read()
+    if not record:
+        if time.time() - os.stat(path).st_mtime > _OWNER_GRACE:
+            raise OSError(errno.EEXIST, "Not a lock owner record", path)
+        return None
+    try:
+        magic, host, pid = record.decode().rstrip('\n').rsplit(':', 2)
+        pid = int(pid)
+    except ValueError:
+        magic = None
+    if magic != _OWNER_MAGIC:
+        raise OSError(errno.EEXIST, "Not a lock owner record", path)
+    return host, pid
+
+
+def _owner_holders(path):
+    try:
+        owner = _read_owner(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    if owner is None:
+        # Just created, the owner is still writing its record.
+        return [LockHolder(None, 'w', None)]
+    if _is_dead(owner):
+        # Broken by the next one acquiring it.
+        return []
+    host, pid = owner
+    return [LockHolder(pid, 'w', host)]
+
+
+def _is_dead(owner):
+    # Only processes on this very host can be checked for liveness, the pid
+    # of a holder on another host (of a network filesystem) means nothing.
+    if owner is None or owner[0] != _hostname():
+        return False
+    return not _utils.process_alive(owner[1])
+
+
+# The "owner" of a lock directory whose owner crashed before writing its
+# record.
+_NO_OWNER = object()
+
+
+def _restore_aside(aside, path, restore):
+    # Puts back a lock moved aside that turned out not to be stale (someone
+    # else broke the stale one and acquired it meanwhile), returns whether it
+    # was put back. If it can not be, it is left aside rather than removed
+    # (it is held).
+    try:
+        restore(aside, path)
+    except OSError:
+        _utils._logger().warning("Could not restore lock `%s` moved aside"
+                                 " to `%s`, leaving it there", path, aside)
+        return False
+    return True
+
+
+def _aside_path(path):
+    if isinstance(path, bytes):
+        return path + ('.%s.%s.stale' % (os.getpid(), time.time())).encode()
+    return '%s.%s.%s.stale' % (path, os.getpid(), time.time())
+
+
+class _MkdirInterProcessMechanism(InterProcessMechanism):
+    """Interprocess lock implementation based on atomic directory creation.
+
+    The lock path is a directory that exists while the lock is held, it
+    contains an `owner` file naming the holder. Works on (almost) any
+    filesystem. Locks of crashed holders on the same host are broken, locks
+    of holders on other hosts are **not** released if the holder crashes.
+    """
+
+    def get_handle(self, path):
+        return path
+
+    def close_handle(self, lockfile):
+        pass
+
+    @staticmethod
+    def _owner_path(lockdir):
+        return os.path.join(lockdir, b'owner' if isinstance(lockdir, bytes)
+                            else 'owner')
+
+    def trylock(self, lockfile):
+        try:
+            os.mkdir(lockfile)
+        except FileExistsError:
+            if not os.path.isdir(lockfile):
+                raise OSError(errno.ENOTDIR,
+                              "Lock path exists and is not a directory",
+                              lockfile)
+            self._break_stale(lockfile)
+            raise OSError(errno.EAGAIN, "Lock directory exists", lockfile)
+        try:
+            _write_owner(self._owner_path(lockfile))
+        except BaseException:
+            os.rmdir(lockfile)
+            raise
+
+    def _stale_owner(self, lockdir):
+        # The dead owner of a stale lock directory (`_NO_OWNER` if its owner
+        # crashed before writing its record), None if not stale.
+        try:
+            owner = _read_owner(self._owner_path(lockdir))
+        except FileNotFoundError:
+            # Released meanwhile, its owner is not written yet or it crashed
+            # before writing it (writing it also touches the directory).
+            try:
+                age = time.time() - os.stat(lockdir).st_mtime
+            except OSError:
+                return None
+            return _NO_OWNER if age > _OWNER_GRACE else None
+        return owner if _is_dead(owner) else None
+
+    def _break_stale(self, lockfile):
+        owner = self._stale_owner(lockfile)
+        if owner is None:
+            return
+        # Moved aside (atomically) first, so that if someone else broke it
+        # and acquired it meanwhile we do not remove their lock.
+        aside = _aside_path(lockfile)
+        try:
+            os.rename(lockfile, aside)
+        except OSError:
+            return
+        try:
+            stolen = self._stale_owner(aside)
+        except OSError:
+            stolen = None
+        if stolen is None or stolen != owner:
+            _restore_aside(aside, lockfile, os.rename)
+            return
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self._owner_path(aside))
+        os.rmdir(aside)
+
+    def unlock(self, lockfile):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self._owner_path(lockfile))
+        os.rmdir(lockfile)
+
+    def holders(self, path):
+        return _owner_holders(self._owner_path(path))
+
+
+class _ExclusiveCreateInterProcessMechanism(InterProcessMechanism):
+    """Interprocess lock implementation based on `O_EXCL` file creation.
 
-class _WindowsInterProcessReaderWriterLockMechanism(_InterProcessReaderWriterLockMechanism):
+    The lock path is a file (naming the host and pid of the holder) that
+    exists while the lock is held. Works on (almost) any filesystem. Locks of
+    crashed holders on the same host are broken, locks of holders on other
+    hosts are **not** released if the holder crashes.
+    """
+
+    def get_handle(self, path):
+        return path
+
+    def close_handle(self, lockfile):
+        pass
+
+    def trylock(self, lockfile):
+        try:
+            _write_owner(lockfile)
+        except FileExistsError:
+            if os.path.isdir(lockfile):
+                raise OSError(errno.EISDIR,
+                              "Lock path exists and is a directory", lockfile)
+            self._break_stale(lockfile)
+            raise OSError(errno.EAGAIN, "Lock file exists", lockfile)
+
+    @staticmethod
+    def _break_stale(lockfile):
+        try:
+            owner = _read_owner(lockfile)
+        except FileNotFoundError:
+            return
+        if not _is_dead(owner):
+            return
+        # Moved aside (atomically) first, so that if someone else broke it
+        # and acquired it meanwhile we do not remove their lock.
+        aside = _aside_path(lockfile)
+        try:
+            os.rename(lockfile, aside)
+        except FileNotFoundError:
+            return
+        try:
+            stolen = _read_owner(aside)
+        except OSError:
+            stolen = None
+        if stolen != owner and not _restore_aside(aside, lockfile, os.link):
+            return
+        os.unlink(aside)
+
+    @staticmethod
+    def unlock(lockfile):
+        os.unlink(lockfile)
+
+    @staticmethod
+    def holders(path):
+        if os.path.isdir(path):
+            return []
+        return _owner_holders(path)
+
+
+def _pywin32():
+    # NOTE: the (ctypes based) shims are imported on first use, only windows
+    # readers writer locks need them.
+    import fasteners.pywin32.pywintypes as pywintypes
+    import fasteners.pywin32.win32con as win32con
+    import fasteners.pywin32.win32file as win32file
+    return pywintypes, win32con, win32file
+
+
+class _WindowsInterProcessReaderWriterLockMechanism(InterProcessReaderWriterLockMechanism):
     """Interprocess readers writer lock implementation that works on windows
     systems."""
 
     @staticmethod
     def trylock(lockfile, exclusive):
+        pywintypes, win32con, win32file = _pywin32()
 
         if exclusive:
             flags = win32con.LOCKFILE_FAIL_IMMEDIATELY | win32con.LOCKFILE_EXCLUSIVE_LOCK
@@ -90,6 +526,7 @@ class _WindowsInterProcessReaderWriterLockMechanism(_InterProcessReaderWriterLoc
 
     @staticmethod
     def unlock(lockfile):
+        pywintypes, _win32con, win32file = _pywin32()
         handle = msvcrt.get_osfhandle(lockfile.fileno())
         ok = win32file.UnlockFileEx(handle, 0, 1, 0, win32file.pointer(pywintypes.OVERLAPPED()))
         if not ok:
@@ -104,7 +541,7 @@ class _WindowsInterProcessReaderWriterLockMechanism(_InterProcessReaderWriterLoc
         lockfile.close()
 
 
-class _FcntlInterProcessReaderWriterLockMechanism(_InterProcessReaderWriterLockMechanism):
+class _FcntlInterProcessReaderWriterLockMechanism(InterProcessReaderWriterLockMechanism):
     """Interprocess readers writer lock implementation that works on posix
     systems."""
 
@@ -137,18 +574,135 @@ class _FcntlInterProcessReaderWriterLockMechanism(_InterProcessReaderWriterLockM
     def close_handle(lockfile):
         lockfile.close()
 
+    @staticmethod
+    def holders(path):
+        return _fcntl_holders(path)
+
+
+class _FlockInterProcessReaderWriterLockMechanism(InterProcessReaderWriterLockMechanism):
+    """Interprocess readers writer lock implementation based on `flock(2)`."""
+
+    @staticmethod
+    def trylock(lockfile, exclusive):
+
+        if exclusive:
+            flags = fcntl.LOCK_EX | fcntl.LOCK_NB
+        else:
+            flags = fcntl.LOCK_SH | fcntl.LOCK_NB
+
+        try:
+            fcntl.flock(lockfile, flags)
+            return True
+        except (IOError, OSError) as e:
+            if e.errno in (errno.EACCES, errno.EAGAIN):
+                return False
+            else:
+                raise e
+
+    @staticmethod
+    def unlock(lockfile):
+        fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    @staticmethod
+    def get_handle(path):
+        return open(path, 'a+')
+
+    @staticmethod
+    def close_handle(lockfile):
+        lockfile.close()
+
+    @staticmethod
+    def holders(path):
+        return _flock_holders(path)
+
+
+_mechanisms = {}
+_reader_writer_mechanisms = {}
+
+
+def _thread_exclusive_mechanism():
+    # The backend whose locks also exclude the other lock objects (so the
+    # threads) of a process: flock where available, LockFileEx on windows.
+    # Helpers holding a file lock briefly use a lock object per use with it,
+    # so that threads can share the helper.
+    return 'default' if os.name == 'nt' else 'flock'
+
+
+def register_mechanism(name, mechanism):
+    """Register a lock backend under a name.
+
+    Args:
+        name:
+            Name to register the backend under (replacing any previous one).
+        mechanism:
+            An :py:class:`.InterProcessMechanism` (for exclusive locks) or an
+            :py:class:`.InterProcessReaderWriterLockMechanism` (for readers
+            writer locks).
+    """
+    if isinstance(mechanism, InterProcessMechanism):
+        _mechanisms[name] = mechanism
+    elif isinstance(mechanism, InterProcessReaderWriterLockMechanism):
+        _reader_writer_mechanisms[name] = mechanism
+    else:
+        raise TypeError("Mechanism must implement InterProcessMechanism or"
+                        " InterProcessReaderWriterLockMechanism, not %r"
+                        % (mechanism,))
+
+
+def get_mechanism(mechanism=None, reader_writer=False):
+    """Look up a lock backend.
+
+    Args:
+        mechanism:
+            Name of a registered backend, a backend instance (which is
+            returned as is) or None for the platform default.
+        reader_writer:
+            Whether a readers writer lock backend is wanted.
+
+    Returns:
+        The lock backend.
+    """
+    if reader_writer:
+        registry = _reader_writer_mechanisms
+        interface = InterProcessReaderWriterLockMechanism
+    else:
+        registry = _mechanisms
+        interface = InterProcessMechanism
+    if mechanism is None:
+        mechanism = 'default'
+    if isinstance(mechanism, str):
+        try:
+            return registry[mechanism]
+        except KeyError:
+            raise ValueError("Unknown mechanism %r, expected one of %s"
+                             % (mechanism, ", ".join(sorted(registry))))
+    if not isinstance(mechanism, interface):
+        raise TypeError("Mechanism must implement %s, not %r"
+                        % (interface.__name__, mechanism))
+    return mechanism
+
 
 if os.name == 'nt':
     import msvcrt
-    import fasteners.pywin32.pywintypes as pywintypes
-    import fasteners.pywin32.win32con as win32con
-    import fasteners.pywin32.win32file as win32file
 
     _interprocess_reader_writer_mechanism = _WindowsInterProcessReaderWriterLockMechanism()
     _interprocess_mechanism = _WindowsInterProcessMechanism()
 
+    register_mechanism('windows', _interprocess_mechanism)
+    register_mechanism('windows', _interprocess_reader_writer_mechanism)
+
 else:
     import fcntl
 
     _interprocess_reader_writer_mechanism = _FcntlInterProcessReaderWriterLockMechanism()
     _interprocess_mechanism = _FcntlInterProcessMechanism()
+
+    register_mechanism('fcntl', _interprocess_mechanism)
+    register_mechanism('fcntl', _interprocess_reader_writer_mechanism)
+    register_mechanism('flock', _FlockInterProcessMechanism())
+    register_mechanism('flock', _FlockInterProcessReaderWriterLockMechanism())
+
+register_mechanism('default', _interprocess_mechanism)
+register_mechanism('default', _interprocess_reader_writer_mechanism)
+register_mechanism('mkdir', _MkdirInterProcessMechanism())
+register_mechanism('excl', _ExclusiveCreateInterProcessMechanism())
@@ -0,0 +1,250 @@
+import errno
+import functools
+import logging
+import os
+from pathlib import Path
+import random
+import threading
+from typing import Callable
+from typing import Optional
+from typing import Union
+
+from fasteners import _utils
+from fasteners.process_lock import _ensure_tree
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+LOG = logging.getLogger(__name__)
+
+
+class _Slots:
+    """The slots (bytes) of a semaphore file, shared by a whole process.
+
+    fcntl locks can not tell lock objects of a single process apart, and
+    closing any descriptor of a file drops all of the locks of the process on
+    it. So every file is opened (once) for good, and the slots held by this
+    process are tracked here.
+    """
+
+    _held = set()
+    _lock = threading.Lock()
+    _fds = {}
+
+    @classmethod
+    def _after_fork_in_child(cls):
+        # Locks (and so slots) are not inherited.
+        cls._lock = threading.Lock()
+        cls._held.clear()
+
+    @classmethod
+    def _fd(cls, path):
+        fd = cls._fds.get(path)
+        if fd is None:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            cls._fds[path] = fd
+        return fd
+
+    @classmethod
+    def try_lock(cls, path, slot):
+        with cls._lock:
+            if (path, slot) in cls._held:
+                return False
+            fd = cls._fd(path)
+            try:
+                if os.name == 'nt':
+                    os.lseek(fd, slot, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+            except (IOError, OSError) as e:
+                if e.errno in (errno.EACCES, errno.EAGAIN):
+                    return False
+                raise
+            cls._held.add((path, slot))
+            return True
+
+    @classmethod
+    def unlock(cls, path, slot):
+        with cls._lock:
+            fd = cls._fds[path]
+            if os.name == 'nt':
+                os.lseek(fd, slot, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, slot)
+            cls._held.discard((path, slot))
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_Slots._after_fork_in_child)
+
+
+class InterProcessSemaphore:
+    """An interprocess semaphore.
+
+    Lets at most `permits` holders (threads or processes) in at once. Every
+    permit is a lock of one byte of a single file, so permits of crashed
+    processes are given back by the operating system.
+    """
+
+    def __init__(self,
+                 path: Union[Path, str],
+                 permits: int,
+                 sleep_func: Callable[[float], None] = _utils.sleep,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            path:
+                Path to the file that will be used for locking.
+            permits:
+                Number of holders allowed in at once.
+            sleep_func:
+                Optional function to use for sleeping.
+            logger:
+                Optional logger to use for logging.
+        """
+        if permits < 1:
+            raise ValueError("Permits must be greater than zero")
+        self.path = _utils.canonicalize_path(path)
+        self.permits = permits
+        self.sleep_func = sleep_func
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+        self.slot = None
+        self._watch = None
+        _utils.reset_after_fork(self)
+
+    def _after_fork_in_child(self):
+        # Permits (slot locks) are not inherited.
+        self.slot = None
+        self._watch = None
+
+    @property
+    def acquired(self):
+        return self.slot is not None
+
+    def _try_acquire(self, blocking, watch):
+        # Starting at a random slot, holders do not all contend for the first
+        # ones.
+        start = random.randrange(self.permits)
+        try:
+            for i in range(self.permits):
+                slot = (start + i) % self.permits
+                if _Slots.try_lock(self.path, slot):
+                    self.slot = slot
+                    return True
+        except (IOError, OSError) as e:
+            raise threading.ThreadError("Unable to acquire a permit of"
+                                        " `%(path)s` due to %(exception)s" %
+                                        {
+                                            'path': self.path,
+                                            'exception': e,
+                                        })
+        if not blocking or watch.expired():
+            return False
+        raise _utils.RetryAgain()
+
+    def acquire(self,
+                blocking: bool = True,
+                delay: float = 0.01,
+                max_delay: float = 0.1,
+                timeout: Optional[float] = None,
+                cancel: Optional[_utils.CancellationToken] = None) -> bool:
+        """Attempt to acquire a permit.
+
+        Args:
+            blocking:
+                Whether to wait to try to acquire a permit.
+            delay:
+                When `blocking`, starting delay as well as the delay increment
+                (in seconds).
+            max_delay:
+                When `blocking` the maximum delay in between attempts to
+                acquire (in seconds).
+            timeout:
+                When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded
+        """
+        if delay < 0:
+            raise ValueError("Delay must be greater than or equal to zero")
+        if timeout is not None and timeout < 0:
+            raise ValueError("Timeout must be greater than or equal to zero")
+        if delay >= max_delay:
+            max_delay = delay
+        if self.acquired:
+            return True
+        basedir = os.path.dirname(self.path)
+        if basedir:
+            _ensure_tree(basedir)
+        watch = _utils.StopWatch(duration=timeout)
+        r = _utils.Retry(delay, max_delay,
+                         sleep_func=self.sleep_func, watch=watch,
+                         cancel=cancel, lock=self)
+        with watch:
+            gotten = r(self._try_acquire, blocking, watch)
+        if not gotten:
+            return False
+        self._watch = _utils.watch_hold(self)
+        self.logger.log(_utils.BLATHER,
+                        "Acquired permit %s of `%s` after waiting %0.3fs [%s"
+                        " attempts were required]", self.slot, self.path,
+                        watch.elapsed(), r.attempts)
+        return True
+
+    def __enter__(self):
+        gotten = self.acquire()
+        if not gotten:
+            # This shouldn't happen, but just in case...
+            raise threading.ThreadError("Unable to acquire a permit of `%s`"
+                                        " (when used as a context manager)"
+                                        % self.path)
+        return self
+
+    def release(self):
+        """Release the previously acquired permit."""
+        if not self.acquired:
+            raise threading.ThreadError("Unable to release an unacquired"
+                                        " permit")
+        slot, self.slot = self.slot, None
+        if self._watch is not None:
+            self._watch.done()
+            self._watch = None
+        try:
+            _Slots.unlock(self.path, slot)
+        except Exception as e:
+            msg = "Could not release permit %s of `%s`" % (slot, self.path)
+            self.logger.exception(msg)
+            raise threading.ThreadError(msg) from e
+        self.logger.log(_utils.BLATHER, "Released permit %s of `%s`", slot,
+                        self.path)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def interprocess_semaphore_locked(path: Union[Path, str], permits: int):
+    """Acquires & releases a permit of an interprocess semaphore around the
+    call to the decorated function.
+
+    Args:
+        path: Path to the file used for locking.
+        permits: Number of calls allowed in at once.
+    """
+
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            # A semaphore object per call, it holds a single permit.
+            with InterProcessSemaphore(path, permits):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,164 @@
+import logging
+import mmap
+import os
+from pathlib import Path
+import struct
+import threading
+import time
+from typing import Callable
+from typing import Optional
+from typing import Union
+
+from fasteners import _utils
+from fasteners.process_lock import _ensure_tree
+from fasteners.process_lock import InterProcessLock
+from fasteners.process_mechanism import _thread_exclusive_mechanism
+
+LOG = logging.getLogger(__name__)
+
+
+class InterProcessRateLimiter:
+    """An interprocess token bucket rate limiter.
+
+    Processes (and threads) sharing the limiter get at most `rate` tokens per
+    second on average, with bursts of up to `capacity` tokens. The bucket is
+    kept in a small memory mapped state file, updated under an
+    :py:class:`.InterProcessLock` of a `<path>.lock` file. Callers are not
+    woken up by anyone: taking tokens returns how long to wait for them.
+
+    The bucket is refilled using `time.monotonic`, which is shared by the
+    processes of a host (but not across hosts).
+    """
+
+    _STATE = struct.Struct('<dd')
+
+    def __init__(self,
+                 path: Union[Path, str],
+                 rate: float,
+                 capacity: Optional[float] = None,
+                 sleep_func: Callable[[float], None] = _utils.sleep,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            path:
+                Path to the state file of the bucket.
+            rate:
+                Number of tokens added to the bucket per second.
+            capacity:
+                Maximal number of tokens in the bucket (the largest burst),
+                by default `rate` (one second worth of tokens).
+            sleep_func:
+                Optional function to use for sleeping.
+            logger:
+                Optional logger to use for logging.
+        """
+        if rate <= 0:
+            raise ValueError("Rate must be greater than zero")
+        capacity = _utils.pick_first_not_none(capacity, rate)
+        if capacity <= 0:
+            raise ValueError("Capacity must be greater than zero")
+        self.path = _utils.canonicalize_path(path)
+        self.rate = rate
+        self.capacity = capacity
+        self.sleep_func = sleep_func
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+        # Also excludes other limiters of the same path in this process.
+        self._lock = InterProcessLock(self.path + b'.lock',
+                                      sleep_func=sleep_func,
+                                      mechanism=_thread_exclusive_mechanism())
+        self._thread_lock = threading.Lock()
+        self._map = None
+        _utils.reset_after_fork(self)
+
+    def _after_fork_in_child(self):
+        # The mapping is shared with the parent, the thread lock may have
+        # been held by another thread of the parent.
+        self._thread_lock = threading.Lock()
+
+    def _open(self):
+        basedir = os.path.dirname(self.path)
+        if basedir:
+            _ensure_tree(basedir)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < self._STATE.size:
+                # Zeros, a bucket never used yet.
+                os.ftruncate(fd, self._STATE.size)
+            self._map = mmap.mmap(fd, self._STATE.size)
+        finally:
+            os.close(fd)
+
+    def _take(self, tokens, max_wait):
+        with self._thread_lock, self._lock:
+            if self._map is None:
+                self._open()
+            available, stamp = self._STATE.unpack_from(self._map)
+            now = time.monotonic()
+            if stamp == 0.0 or stamp > now:
+                # Never used, or used before a reboot.
+                available = self.capacity
+            else:
+                available = min(self.capacity,
+                                available + (now - stamp) * self.rate)
+            wait = max(0.0, (tokens - available) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            # Tokens not there yet are borrowed, later callers wait longer.
+            self._STATE.pack_into(self._map, 0, available - tokens, now)
+        return wait
+
+    def acquire(self,
+                tokens: float = 1,
+                max_wait: Optional[float] = None) -> Optional[float]:
+        """Take tokens from the bucket, without waiting for them.
+
+        Args:
+            tokens:
+                Number of tokens to take, at most the capacity.
+            max_wait:
+                Optional maximal waiting time (in seconds), no tokens are
+                taken if it would have to be waited longer for them (0 to
+                only take available tokens).
+
+        Returns:
+            How long (in seconds) to wait before using the tokens, or None if
+            that exceeds `max_wait` (and no tokens were taken).
+        """
+        if tokens <= 0 or tokens > self.capacity:
+            raise ValueError("Tokens must be greater than zero and at most"
+                             " the capacity")
+        if max_wait is not None and max_wait < 0:
+            raise ValueError("Max wait must be greater than or equal to zero")
+        return self._take(tokens, max_wait)
+
+    def wait(self,
+             tokens: float = 1,
+             timeout: Optional[float] = None) -> bool:
+        """Take tokens from the bucket, waiting (sleeping) until they can be
+        used.
+
+        Args:
+            tokens:
+                Number of tokens to take, at most the capacity.
+            timeout:
+                Optional maximal waiting time (in seconds).
+
+        Returns:
+            Whether the tokens were taken (they were unless it would have
+            taken longer than the timeout).
+        """
+        wait = self.acquire(tokens, max_wait=timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            self.logger.log(_utils.BLATHER, "Waiting %0.3fs for %s tokens of"
+                            " `%s`", wait, tokens, self.path)
+            self.sleep_func(wait)
+        return True
+
+    def close(self):
+        """Unmap the state file (it is mapped again when needed)."""
+        with self._thread_lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
@@ -0,0 +1,390 @@
+import functools
+import logging
+import socket
+import threading
+from typing import Callable
+from typing import Optional
+import uuid
+
+from fasteners import _utils
+
+LOG = logging.getLogger(__name__)
+
+# Only deletes (or extends) the lock if it still holds our token, so a holder
+# whose lock expired (and was taken by someone else) can not affect it.
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+EXTEND_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class ResponseError(Exception):
+    """Error reply of a Redis (protocol) server."""
+
+
+class RespClient:
+    """A minimal Redis protocol (RESP) client.
+
+    Only implements what :py:class:`.RedisLock` needs (`set`, `get` and
+    `eval`, with the signatures of the `redis` package client, which can be
+    used instead).
+    """
+
+    def __init__(self,
+                 host: str = 'localhost',
+                 port: int = 6379,
+                 unix_socket_path: Optional[str] = None,
+                 socket_timeout: Optional[float] = 5.0):
+        """
+        Args:
+            host:
+                Host of the server.
+            port:
+                Port of the server.
+            unix_socket_path:
+                Optional path of a unix socket of the server (instead of host
+                and port).
+            socket_timeout:
+                Optional timeout (in seconds) of the socket operations.
+        """
+        self.host = host
+        self.port = port
+        self.unix_socket_path = unix_socket_path
+        self.socket_timeout = socket_timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self.unix_socket_path is not None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.socket_timeout)
+            sock.connect(self.unix_socket_path)
+        else:
+            sock = socket.create_connection((self.host, self.port),
+                                            timeout=self.socket_timeout)
+        self._sock = sock
+        self._file = sock.makefile('rb')
+
+    def close(self):
+        """Close the connection (it is reopened when needed)."""
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = None
+            self._file = None
+
+    @staticmethod
+    def _encode(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            elif not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self):
+        line = self._file.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by the server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise ResponseError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise ResponseError("Unknown reply type %r" % kind)
+
+    def execute_command(self, *args):
+        """Send a command and return its reply."""
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            try:
+                self._sock.sendall(self._encode(args))
+                return self._read_reply()
+            except (OSError, ConnectionError):
+                # The connection is in an unknown state, start afresh.
+                self.close()
+                raise
+
+    def set(self, name, value, nx=False, px=None):
+        args = ['SET', name, value]
+        if px is not None:
+            args += ['PX', px]
+        if nx:
+            args.append('NX')
+        return True if self.execute_command(*args) == 'OK' else None
+
+    def get(self, name):
+        return self.execute_command('GET', name)
+
+    def eval(self, script, numkeys, *keys_and_args):
+        return self.execute_command('EVAL', script, numkeys, *keys_and_args)
+
+
+class RedisLock:
+    """A distributed lock on a Redis (protocol) server.
+
+    Has the same interface as :py:class:`.InterProcessLock`, but excludes
+    processes on any host using the same server. Acquired with `SET NX PX`
+    (so the lock expires if its holder dies) and released with a compare and
+    delete script. While held, a background thread keeps extending the lock.
+    """
+
+    def __init__(self,
+                 name: str,
+                 client=None,
+                 ttl: float = 30.0,
+                 auto_extend: bool = True,
+                 extend_interval: Optional[float] = None,
+                 sleep_func: Callable[[float], None] = _utils.sleep,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            name:
+                Name (key) of the lock on the server.
+            client:
+                Optional client of the server, anything with the `set`, `get`
+                and `eval` methods of a `redis.Redis` client. By default a
+                :py:class:`.RespClient` of a server on localhost.
+            ttl:
+                Time to live of the lock (in seconds), a lock that was not
+                extended for this long expires.
+            auto_extend:
+                Whether to keep extending the lock while held.
+            extend_interval:
+                Optional time in between extensions (in seconds), a third of
+                the `ttl` by default.
+            sleep_func:
+                Optional function to use for sleeping.
+            logger:
+                Optional logger to use for logging.
+        """
+        if ttl <= 0:
+            raise ValueError("Ttl must be greater than zero")
+        self.name = name
+        self.client = client if client is not None else RespClient()
+        self.ttl = ttl
+        self.auto_extend = auto_extend
+        self.extend_interval = _utils.pick_first_not_none(extend_interval,
+                                                          ttl / 3.0)
+        if self.extend_interval >= ttl:
+            raise ValueError("Extend interval must be less than the ttl")
+        self.sleep_func = sleep_func
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+        self.token = None
+        self.acquired = False
+        self.lost = False
+        self._extend_stop = None
+        self._extend_thread = None
+        self._watch = None
+
+    @property
+    def _ttl_ms(self):
+        return max(1, int(self.ttl * 1000))
+
+    def _try_acquire(self, blocking, watch):
+        try:
+            gotten = self.client.set(self.name, self.token, nx=True,
+                                     px=self._ttl_ms)
+        except Exception as e:
+            raise threading.ThreadError("Unable to acquire lock `%(name)s`"
+                                        " due to %(exception)s" %
+                                        {
+                                            'name': self.name,
+                                            'exception': e,
+                                        })
+        if gotten:
+            return True
+        if not blocking or watch.expired():
+            return False
+        raise _utils.RetryAgain()
+
+    def acquire(self,
+                blocking: bool = True,
+                delay: float = 0.01,
+                max_delay: float = 0.1,
+                timeout: Optional[float] = None,
+                cancel: Optional[_utils.CancellationToken] = None) -> bool:
+        """Attempt to acquire the lock.
+
+        Args:
+            blocking:
+                Whether to wait to try to acquire the lock.
+            delay:
+                When `blocking`, starting delay as well as the delay increment
+                (in seconds).
+            max_delay:
+                When `blocking` the maximum delay in between attempts to
+                acquire (in seconds).
+            timeout:
+                When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded
+        """
+        if delay < 0:
+            raise ValueError("Delay must be greater than or equal to zero")
+        if timeout is not None and timeout < 0:
+            raise ValueError("Timeout must be greater than or equal to zero")
+        if delay >= max_delay:
+            max_delay = delay
+        if self.acquired:
+            return True
+        self.token = uuid.uuid4().hex
+        watch = _utils.StopWatch(duration=timeout)
+        r = _utils.Retry(delay, max_delay,
+                         sleep_func=self.sleep_func, watch=watch,
+                         cancel=cancel, lock=self)
+        with watch:
+            gotten = r(self._try_acquire, blocking, watch)
+        if not gotten:
+            return False
+        self.acquired = True
+        self.lost = False
+        self._watch = _utils.watch_hold(self)
+        if self.auto_extend:
+            self._start_extending()
+        self.logger.log(_utils.BLATHER,
+                        "Acquired lock `%s` after waiting %0.3fs [%s attempts"
+                        " were required]", self.name, watch.elapsed(),
+                        r.attempts)
+        return True
+
+    def extend(self) -> bool:
+        """Reset the time to live of the held lock.
+
+        Returns:
+            Whether the lock was still held (and got extended).
+        """
+        extended = self.client.eval(EXTEND_SCRIPT, 1, self.name, self.token,
+                                    self._ttl_ms)
+        if not extended:
+            self.lost = True
+        return bool(extended)
+
+    def _start_extending(self):
+        self._extend_stop = threading.Event()
+        self._extend_thread = threading.Thread(
+            target=self._extend, args=(self._extend_stop,),
+            name='fasteners-redis-lock-extend')
+        self._extend_thread.daemon = True
+        self._extend_thread.start()
+
+    def _stop_extending(self):
+        if self._extend_thread is not None:
+            self._extend_stop.set()
+            if self._extend_thread is not threading.current_thread():
+                self._extend_thread.join()
+            self._extend_thread = None
+            self._extend_stop = None
+
+    def _extend(self, stop):
+        while not stop.wait(self.extend_interval):
+            try:
+                if self.extend():
+                    continue
+            except Exception:
+                self.logger.exception("Failed extending lock `%s`",
+                                      self.name)
+                continue
+            self.logger.error("Lock `%s` expired and was lost", self.name)
+            return
+
+    def is_held(self) -> bool:
+        """Check (with the server) that the lock is still held by this lock.
+
+        Returns:
+            Whether the server still has the lock with our token.
+        """
+        if not self.acquired or self.lost:
+            return False
+        value = self.client.get(self.name)
+        if isinstance(value, bytes):
+            value = value.decode()
+        return value == self.token
+
+    def __enter__(self):
+        gotten = self.acquire()
+        if not gotten:
+            # This shouldn't happen, but just in case...
+            raise threading.ThreadError("Unable to acquire lock `%s` (when"
+                                        " used as a context manager)"
+                                        % self.name)
+        return self
+
+    def release(self):
+        """Release the previously acquired lock."""
+        if not self.acquired:
+            raise threading.ThreadError("Unable to release an unacquired lock")
+        if self._watch is not None:
+            self._watch.done()
+            self._watch = None
+        self._stop_extending()
+        try:
+            released = self.client.eval(RELEASE_SCRIPT, 1, self.name,
+                                        self.token)
+        except Exception as e:
+            msg = "Could not release lock `%s`" % self.name
+            self.logger.exception(msg)
+            raise threading.ThreadError(msg) from e
+        finally:
+            self.acquired = False
+        if not released:
+            self.logger.warning("Lock `%s` expired before being released",
+                                self.name)
+        self.logger.log(_utils.BLATHER, "Released lock `%s`", self.name)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def redis_locked(name: str, client=None, **kwargs):
+    """Acquires & releases a distributed lock around the call to the
+    decorated function.
+
+    Args:
+        name: Name (key) of the lock on the server.
+        client: Optional client of the server (see :py:class:`.RedisLock`).
+        kwargs: Other (optional) arguments of :py:class:`.RedisLock`.
+    """
+    # A single client (its connection) for all calls.
+    client = client if client is not None else RespClient()
+
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kw):
+            # A lock object per call, it holds the lock for that call only.
+            with RedisLock(name, client=client, **kwargs):
+                return f(*args, **kw)
+
+        return wrapper
+
+    return decorator
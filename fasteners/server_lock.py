@@ -0,0 +1,346 @@
+import contextlib
+import json
+import logging
+import os
+from pathlib import Path
+import socket
+import threading
+from typing import Optional
+from typing import Union
+
+from fasteners import _utils
+
+LOG = logging.getLogger(__name__)
+
+# How often waits with a cancellation token check it (in seconds).
+_CANCEL_POLL_INTERVAL = 0.05
+
+
+def _encode(message):
+    return json.dumps(message).encode() + b'\n'
+
+
+class _Connection:
+    """A connection to a :py:class:`.LockServer` (one per lock)."""
+
+    def __init__(self, path):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(os.fsdecode(path))
+        except BaseException:
+            self._sock.close()
+            raise
+        self._buffer = b''
+
+    def send(self, message):
+        self._sock.sendall(_encode(message))
+
+    def receive(self, timeout=None):
+        """Receive a message, None if none arrived within the timeout."""
+        self._sock.settimeout(timeout)
+        while b'\n' not in self._buffer:
+            try:
+                data = self._sock.recv(4096)
+            except socket.timeout:
+                return None
+            if not data:
+                raise ConnectionError("Connection closed by the lock server")
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return json.loads(line)
+
+    def close(self):
+        self._sock.close()
+
+
+class _ServerLockBase:
+
+    def __init__(self, key, path, logger):
+        self.key = key
+        self.path = _utils.canonicalize_path(path)
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+        self._conn = None
+        self._held = None
+        self._watch = None
+
+    def _receive_grant(self, watch, cancel):
+        if cancel is None:
+            return self._conn.receive(watch.leftover())
+        # The grant is pushed by the server, so only the token is polled.
+        while not cancel.is_set():
+            leftover = watch.leftover()
+            if leftover is None or leftover > _CANCEL_POLL_INTERVAL:
+                leftover = _CANCEL_POLL_INTERVAL
+            reply = self._conn.receive(leftover)
+            if reply is not None or watch.expired():
+                return reply
+        return None
+
+    def _acquire(self, shared, blocking, timeout, cancel):
+        if timeout is not None and timeout < 0:
+            raise ValueError("Timeout must be greater than or equal to zero")
+        if self._held == shared:
+            return True
+        try:
+            if self._conn is None:
+                self._conn = _Connection(self.path)
+            self._conn.send({'op': 'acquire', 'key': self.key,
+                             'shared': shared, 'wait': blocking})
+            watch = _utils.StopWatch(duration=timeout)
+            waiting = _utils.watch_wait(self) if blocking else None
+            try:
+                with watch:
+                    reply = self._receive_grant(watch, cancel)
+            finally:
+                if waiting is not None:
+                    waiting.done()
+            if reply is None:
+                # Timed out (or cancelled), the lock might just have been
+                # granted.
+                self._conn.send({'op': 'cancel', 'key': self.key})
+                while reply is None or 'cancelled' not in reply:
+                    reply = self._conn.receive()
+                reply = {'granted': False}
+        except (OSError, ValueError) as e:
+            self._close()
+            raise threading.ThreadError("Unable to acquire lock `%(key)s`"
+                                        " from `%(path)s` due to"
+                                        " %(exception)s" %
+                                        {
+                                            'key': self.key,
+                                            'path': self.path,
+                                            'exception': e,
+                                        })
+        if not reply['granted']:
+            if self._held is None:
+                self._close()
+            return False
+        self._held = shared
+        if self._watch is None:
+            self._watch = _utils.watch_hold(self)
+        self.logger.log(_utils.BLATHER,
+                        "Acquired lock `%s` from `%s` after waiting %0.3fs",
+                        self.key, self.path, watch.elapsed())
+        return True
+
+    def _release(self):
+        if self._held is None:
+            raise threading.ThreadError("Unable to release an unacquired lock")
+        self._held = None
+        if self._watch is not None:
+            self._watch.done()
+            self._watch = None
+        try:
+            self._conn.send({'op': 'release', 'key': self.key})
+            reply = self._conn.receive()
+            while 'released' not in reply:
+                reply = self._conn.receive()
+        except (OSError, ValueError):
+            # The server releases the locks of disconnected clients anyway.
+            self.logger.exception("Could not release lock `%s` from `%s`",
+                                  self.key, self.path)
+        finally:
+            self._close()
+        self.logger.log(_utils.BLATHER, "Released lock `%s` from `%s`",
+                        self.key, self.path)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class ServerLock(_ServerLockBase):
+    """An interprocess lock granted by a :py:class:`.LockServer`.
+
+    Has the same interface as :py:class:`.InterProcessLock`. Waiters do not
+    poll: they are queued (fairly) by the server, which pushes the grant, and
+    the lock is released when its process dies.
+    """
+
+    def __init__(self,
+                 key: str,
+                 path: Union[Path, str],
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            key:
+                Name of the lock.
+            path:
+                Path of the unix socket of the lock server.
+            logger:
+                Optional logger to use for logging.
+        """
+        super(ServerLock, self).__init__(key, path, logger)
+
+    @property
+    def acquired(self):
+        return self._held is not None
+
+    def acquire(self,
+                blocking: bool = True,
+                delay: float = 0.01,
+                max_delay: float = 0.1,
+                timeout: Optional[float] = None,
+                cancel: Optional[_utils.CancellationToken] = None) -> bool:
+        """Attempt to acquire the lock.
+
+        Args:
+            blocking:
+                Whether to wait to try to acquire the lock.
+            delay:
+                Ignored, waiters are notified by the server.
+            max_delay:
+                Ignored, waiters are notified by the server.
+            timeout:
+                When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded
+        """
+        return self._acquire(False, blocking, timeout, cancel)
+
+    def __enter__(self):
+        gotten = self.acquire()
+        if not gotten:
+            # This shouldn't happen, but just in case...
+            raise threading.ThreadError("Unable to acquire lock `%s` (when"
+                                        " used as a context manager)"
+                                        % self.key)
+        return self
+
+    def release(self):
+        """Release the previously acquired lock."""
+        self._release()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class ServerReaderWriterLock(_ServerLockBase):
+    """An interprocess readers writer lock granted by a
+    :py:class:`.LockServer`.
+
+    Has the same interface as :py:class:`.InterProcessReaderWriterLock`.
+    Acquiring the other kind of lock while holding one converts the held
+    lock (like `fcntl` locks, not atomically). Conversions go before the
+    other waiters, a conversion fails right away if another holder is
+    waiting for its own conversion already (they would wait for each other).
+    """
+
+    def __init__(self,
+                 key: str,
+                 path: Union[Path, str],
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            key:
+                Name of the lock.
+            path:
+                Path of the unix socket of the lock server.
+            logger:
+                Optional logger to use for logging.
+        """
+        super(ServerReaderWriterLock, self).__init__(key, path, logger)
+
+    @contextlib.contextmanager
+    def read_lock(self, delay=0.01, max_delay=0.1):
+        """Context manager that grants a read lock"""
+
+        self.acquire_read_lock()
+        try:
+            yield
+        finally:
+            self.release_read_lock()
+
+    @contextlib.contextmanager
+    def write_lock(self, delay=0.01, max_delay=0.1):
+        """Context manager that grants a write lock"""
+
+        self.acquire_write_lock()
+        try:
+            yield
+        finally:
+            self.release_write_lock()
+
+    def acquire_read_lock(self,
+                          blocking: bool = True,
+                          delay: float = 0.01,
+                          max_delay: float = 0.1,
+                          timeout: Optional[float] = None,
+                          cancel: Optional[_utils.CancellationToken] = None
+                          ) -> bool:
+        """Attempt to acquire a reader's lock.
+
+        Args:
+            blocking:
+                Whether to wait to try to acquire the lock.
+            delay:
+                Ignored, waiters are notified by the server.
+            max_delay:
+                Ignored, waiters are notified by the server.
+            timeout:
+                When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded
+        """
+        return self._acquire(True, blocking, timeout, cancel)
+
+    def acquire_write_lock(self,
+                           blocking: bool = True,
+                           delay: float = 0.01,
+                           max_delay: float = 0.1,
+                           timeout: Optional[float] = None,
+                           cancel: Optional[_utils.CancellationToken] = None
+                           ) -> bool:
+        """Attempt to acquire a writer's lock.
+
+        Args:
+            blocking:
+                Whether to wait to try to acquire the lock.
+            delay:
+                Ignored, waiters are notified by the server.
+            max_delay:
+                Ignored, waiters are notified by the server.
+            timeout:
+                When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded
+        """
+        return self._acquire(False, blocking, timeout, cancel)
+
+    def release_read_lock(self):
+        """Release the reader's lock."""
+        self._release()
+
+    def release_write_lock(self):
+        """Release the writer's lock."""
+        self._release()
+
+
+def server_stats(path: Union[Path, str]) -> dict:
+    """Fetch the contention statistics of a :py:class:`.LockServer`.
+
+    Args:
+        path: Path of the unix socket of the lock server.
+
+    Returns:
+        The statistics (see :py:meth:`.LockServer.stats`).
+    """
+    conn = _Connection(_utils.canonicalize_path(path))
+    try:
+        conn.send({'op': 'stats'})
+        return conn.receive()
+    finally:
+        conn.close()
@@ -0,0 +1,181 @@
+import contextlib
+import logging
+import mmap
+import os
+from pathlib import Path
+from typing import Callable
+from typing import Iterator
+from typing import Optional
+from typing import Union
+import uuid
+
+from fasteners import _utils
+from fasteners.process_lock import InterProcessReaderWriterLock
+from fasteners.process_mechanism import _thread_exclusive_mechanism
+
+LOG = logging.getLogger(__name__)
+
+
+class FileUpdate:
+    """The content of a file being updated (see :py:meth:`.LockedFile.update`).
+
+    Attributes:
+        data: The content of the file (None if it does not exist), assign the
+            new content to it.
+    """
+
+    def __init__(self, data):
+        self.original = data
+        self.data = data
+
+    @property
+    def changed(self):
+        return self.data != self.original
+
+
+class LockedFile:
+    """A file read and rewritten by several processes.
+
+    Reads happen under the read lock, updates under the write lock of an
+    :py:class:`.InterProcessReaderWriterLock` of a `<path>.lock` file (the
+    file itself is replaced on every update, so can not be locked). Updates
+    write a temporary file which is renamed over the file, so readers never
+    see a partially written file.
+    """
+
+    def __init__(self,
+                 path: Union[Path, str],
+                 fsync: bool = False,
+                 mmap_threshold: int = 1 << 20,
+                 sleep_func: Callable[[float], None] = _utils.sleep,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            path:
+                Path to the file.
+            fsync:
+                Whether to flush updates (the file, then its directory) to
+                disk before releasing the write lock.
+            mmap_threshold:
+                Size (in bytes) from which :py:meth:`reading` maps the file
+                in memory instead of reading it.
+            sleep_func:
+                Optional function to use for sleeping.
+            logger:
+                Optional logger to use for logging.
+        """
+        self.path = _utils.canonicalize_path(path)
+        self.fsync = fsync
+        self.mmap_threshold = mmap_threshold
+        self.sleep_func = sleep_func
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+
+    def _lock(self):
+        return InterProcessReaderWriterLock(
+            self.path + b'.lock', sleep_func=self.sleep_func,
+            logger=self.logger, mechanism=_thread_exclusive_mechanism())
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    @contextlib.contextmanager
+    def reading(self) -> Iterator[Optional[Union[bytes, mmap.mmap]]]:
+        """Context manager that holds the read lock and gives the content of
+        the file (None if it does not exist).
+
+        Large files are memory mapped (and so must not be used after leaving
+        the context), others read.
+        """
+        with self._lock().read_lock():
+            try:
+                f = open(self.path, 'rb')
+            except FileNotFoundError:
+                yield None
+                return
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                if size < max(1, self.mmap_threshold):
+                    yield f.read()
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    yield m
+
+    def read(self) -> Optional[bytes]:
+        """Read the file under the read lock.
+
+        Returns:
+            The content of the file, None if it does not exist.
+        """
+        with self._lock().read_lock():
+            return self._read()
+
+    @contextlib.contextmanager
+    def update(self) -> Iterator[FileUpdate]:
+        """Context manager that holds the write lock and gives the content of
+        the file to update.
+
+        The new content (if changed, and unless an exception was raised) is
+        written when leaving the context.
+        """
+        with self._lock().write_lock():
+            update = FileUpdate(self._read())
+            yield update
+            if update.changed:
+                self._write(update.data)
+
+    def write(self, data: bytes):
+        """Replace the content of the file (under the write lock).
+
+        Args:
+            data: The new content of the file.
+        """
+        with self.update() as update:
+            update.data = data
+
+    def _write(self, data):
+        if data is None:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+            return
+        tmp_path = b'%s.%s.tmp' % (self.path, uuid.uuid4().hex.encode())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            try:
+                with contextlib.suppress(FileNotFoundError):
+                    os.chmod(tmp_path, os.stat(self.path).st_mode)
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp_path)
+            raise
+        if self.fsync and os.name != 'nt':
+            # The rename itself is only durable once the directory is.
+            dir_fd = os.open(os.path.dirname(self.path) or b'.', os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        self.logger.log(_utils.BLATHER, "Rewrote `%s` (%s bytes)", self.path,
+                        len(data))
+
+
+def locked_file(path: Union[Path, str], **kwargs) -> LockedFile:
+    """A file read and rewritten by several processes, see
+    :py:class:`.LockedFile`.
+
+    Args:
+        path: Path to the file.
+        kwargs: Other (optional) arguments of :py:class:`.LockedFile`.
+    """
+    return LockedFile(path, **kwargs)
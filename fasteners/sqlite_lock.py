@@ -0,0 +1,432 @@
+import contextlib
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Callable
+from typing import Optional
+from typing import Union
+import uuid
+
+from fasteners import _utils
+from fasteners.process_lock import _ensure_tree
+
+LOG = logging.getLogger(__name__)
+
+_SCHEMA = ("""
+CREATE TABLE IF NOT EXISTS holders (
+    key TEXT NOT NULL,
+    holder TEXT NOT NULL,
+    exclusive INTEGER NOT NULL,
+    pid INTEGER NOT NULL,
+    start_time INTEGER,
+    PRIMARY KEY (key, holder)
+) WITHOUT ROWID
+""", """
+CREATE INDEX IF NOT EXISTS holders_holder ON holders (holder)
+""")
+
+
+class SQLiteLockTable:
+    """A table of interprocess locks, stored in a single SQLite database.
+
+    Meant for very large key spaces, where a lock file per key would use too
+    many inodes: any number of keys is locked with a single database file
+    (in WAL mode). Every holder is recorded with its pid and process start
+    time, so that locks of crashed processes are cleaned up by waiters.
+
+    The database must be on a local filesystem, shared by processes of a
+    single host.
+    """
+
+    def __init__(self,
+                 path: Union[Path, str],
+                 busy_timeout: float = 5.0,
+                 sleep_func: Callable[[float], None] = _utils.sleep,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            path:
+                Path to the SQLite database file.
+            busy_timeout:
+                Maximal time (in seconds) to wait for other processes to
+                finish their (short) lock table transactions.
+            sleep_func:
+                Optional function to use for sleeping in between attempts to
+                acquire locks.
+            logger:
+                Optional logger to use for logging.
+        """
+        self.path = _utils.canonicalize_path(path)
+        self.busy_timeout = busy_timeout
+        self.sleep_func = sleep_func
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+        self._local = threading.local()
+
+    def _connect(self):
+        basedir = os.path.dirname(self.path)
+        if basedir:
+            made_basedir = _ensure_tree(basedir)
+            if made_basedir:
+                self.logger.log(_utils.BLATHER,
+                                'Created lock base path `%s`', basedir)
+        conn = sqlite3.connect(os.fsdecode(self.path),
+                               timeout=self.busy_timeout,
+                               isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Lock state does not outlive a reboot, no need to survive power loss.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    def _connection(self):
+        # SQLite connections can not be shared by threads, nor survive fork.
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def _try_acquire(self, holder, keys, exclusive):
+        me = os.getpid()
+        with self._transaction() as conn:
+            for key in keys:
+                rows = conn.execute(
+                    "SELECT holder, exclusive, pid, start_time FROM holders"
+                    " WHERE key = ? AND holder != ?", (key, holder)).fetchall()
+                for other, other_exclusive, pid, start_time in rows:
+                    if pid != me and _utils.process_exited(pid, start_time):
+                        self.logger.warning("Removing stale lock `%s` of"
+                                            " crashed process %s", key, pid)
+                        conn.execute("DELETE FROM holders WHERE holder = ?",
+                                     (other,))
+                    elif exclusive or other_exclusive:
+                        # All or nothing, none of the keys were taken yet.
+                        return False
+            start_time = _utils.process_start_time(me)
+            conn.executemany(
+                "INSERT OR REPLACE INTO holders"
+                " (key, holder, exclusive, pid, start_time)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(key, holder, int(exclusive), me, start_time)
+                 for key in keys])
+        return True
+
+    def _acquire(self, holder, keys, exclusive, blocking, delay, max_delay,
+                 timeout, cancel, lock=None):
+        if delay < 0:
+            raise ValueError("Delay must be greater than or equal to zero")
+        if timeout is not None and timeout < 0:
+            raise ValueError("Timeout must be greater than or equal to zero")
+        if delay >= max_delay:
+            max_delay = delay
+
+        def _try_acquire():
+            try:
+                gotten = self._try_acquire(holder, keys, exclusive)
+            except sqlite3.Error as e:
+                raise threading.ThreadError("Unable to acquire lock on %s in"
+                                            " `%s` due to %s"
+                                            % (keys, self.path, e))
+            if gotten:
+                return True
+            if not blocking or watch.expired():
+                return False
+            raise _utils.RetryAgain()
+
+        watch = _utils.StopWatch(duration=timeout)
+        r = _utils.Retry(delay, max_delay,
+                         sleep_func=self.sleep_func, watch=watch,
+                         cancel=cancel, lock=lock)
+        with watch:
+            gotten = r(_try_acquire)
+        if gotten:
+            self.logger.log(_utils.BLATHER,
+                            "Acquired lock on %s in `%s` after waiting %0.3fs"
+                            " [%s attempts were required]", keys, self.path,
+                            watch.elapsed(), r.attempts)
+        return gotten
+
+    def _release(self, holder):
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM holders WHERE holder = ?",
+                             (holder,))
+        except sqlite3.Error as e:
+            msg = "Could not release lock in `%s`" % self.path
+            self.logger.exception(msg)
+            raise threading.ThreadError(msg) from e
+
+    def cleanup(self) -> int:
+        """Remove the locks held by processes that no longer exist.
+
+        Returns:
+            The number of removed locks.
+        """
+        try:
+            with self._transaction() as conn:
+                rows = conn.execute(
+                    "SELECT DISTINCT holder, pid, start_time FROM holders"
+                ).fetchall()
+                stale = [(holder,) for holder, pid, start_time in rows
+                         if pid != os.getpid()
+                         and _utils.process_exited(pid, start_time)]
+                conn.executemany("DELETE FROM holders WHERE holder = ?",
+                                 stale)
+        except sqlite3.Error as e:
+            msg = "Could not clean up locks in `%s`" % self.path
+            self.logger.exception(msg)
+            raise threading.ThreadError(msg) from e
+        return len(stale)
+
+    def close(self):
+        """Close the database connection of the calling thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            if self._local.pid == os.getpid():
+                conn.close()
+
+    def lock(self, *keys: str) -> 'SQLiteLock':
+        """Create an (exclusive) lock of one or more keys.
+
+        Args:
+            keys:
+                Keys to lock, all of them at once (in a single transaction).
+
+        Returns:
+            A lock with the same interface as :py:class:`.InterProcessLock`.
+        """
+        return SQLiteLock(self, keys)
+
+    def reader_writer_lock(self, *keys: str) -> 'SQLiteReaderWriterLock':
+        """Create a readers writer lock of one or more keys.
+
+        Args:
+            keys:
+                Keys to lock, all of them at once (in a single transaction).
+
+        Returns:
+            A lock with the same interface as
+            :py:class:`.InterProcessReaderWriterLock`.
+        """
+        return SQLiteReaderWriterLock(self, keys)
+
+
+def _check_keys(keys):
+    if not keys:
+        raise ValueError("At least one key must be given")
+    return tuple(keys)
+
+
+class SQLiteLock:
+    """An interprocess lock of keys of a :py:class:`.SQLiteLockTable`.
+
+    Has the same interface as :py:class:`.InterProcessLock`, every lock
+    object is a distinct holder (so lock objects of the same keys exclude
+    each other, also within a single process).
+    """
+
+    def __init__(self, table: SQLiteLockTable, keys):
+        self.table = table
+        self.keys = _check_keys(keys)
+        self.holder = uuid.uuid4().hex
+        self.acquired = False
+        self._watch = None
+
+    def acquire(self,
+                blocking: bool = True,
+                delay: float = 0.01,
+                max_delay: float = 0.1,
+                timeout: Optional[float] = None,
+                cancel: Optional[_utils.CancellationToken] = None) -> bool:
+        """Attempt to acquire the lock (of all of the keys).
+
+        Args:
+            blocking:
+                Whether to wait to try to acquire the lock.
+            delay:
+                When `blocking`, starting delay as well as the delay increment
+                (in seconds).
+            max_delay:
+                When `blocking` the maximum delay in between attempts to
+                acquire (in seconds).
+            timeout:
+                When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded
+        """
+        gotten = self.table._acquire(self.holder, self.keys, True, blocking,
+                                     delay, max_delay, timeout, cancel,
+                                     lock=self)
+        if gotten:
+            self.acquired = True
+            self._watch = _utils.watch_hold(self)
+        return gotten
+
+    def __enter__(self):
+        gotten = self.acquire()
+        if not gotten:
+            # This shouldn't happen, but just in case...
+            raise threading.ThreadError("Unable to acquire a lock on %s in"
+                                        " `%s` (when used as a context"
+                                        " manager)"
+                                        % (self.keys, self.table.path))
+        return self
+
+    def release(self):
+        """Release the previously acquired lock."""
+        if not self.acquired:
+            raise threading.ThreadError("Unable to release an unacquired lock")
+        self.table._release(self.holder)
+        self.acquired = False
+        self._unwatch()
+
+    def _unwatch(self):
+        if self._watch is not None:
+            self._watch.done()
+            self._watch = None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class SQLiteReaderWriterLock:
+    """An interprocess readers writer lock of keys of a
+    :py:class:`.SQLiteLockTable`.
+
+    Has the same interface as :py:class:`.InterProcessReaderWriterLock`.
+    Like with `fcntl` locks, acquiring the other kind of lock while holding
+    one converts the held lock.
+    """
+
+    def __init__(self, table: SQLiteLockTable, keys):
+        self.table = table
+        self.keys = _check_keys(keys)
+        self.holder = uuid.uuid4().hex
+        self._watch = None
+
+    @contextlib.contextmanager
+    def read_lock(self, delay=0.01, max_delay=0.1):
+        """Context manager that grants a read lock"""
+
+        self.acquire_read_lock(blocking=True, delay=delay,
+                               max_delay=max_delay, timeout=None)
+        try:
+            yield
+        finally:
+            self.release_read_lock()
+
+    @contextlib.contextmanager
+    def write_lock(self, delay=0.01, max_delay=0.1):
+        """Context manager that grants a write lock"""
+
+        self.acquire_write_lock(blocking=True, delay=delay,
+                                max_delay=max_delay, timeout=None)
+        try:
+            yield
+        finally:
+            self.release_write_lock()
+
+    def acquire_read_lock(self,
+                          blocking: bool = True,
+                          delay: float = 0.01,
+                          max_delay: float = 0.1,
+                          timeout: Optional[float] = None,
+                          cancel: Optional[_utils.CancellationToken] = None
+                          ) -> bool:
+        """Attempt to acquire a reader's lock (of all of the keys).
+
+        Args:
+            blocking:
+                Whether to wait to try to acquire the lock.
+            delay:
+                When `blocking`, starting delay as well as the delay increment
+                (in seconds).
+            max_delay:
+                When `blocking` the maximum delay in between attempts to
+                acquire (in seconds).
+            timeout:
+                When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded
+        """
+        return self._watched(self.table._acquire(
+            self.holder, self.keys, False, blocking, delay, max_delay,
+            timeout, cancel, lock=self))
+
+    def acquire_write_lock(self,
+                           blocking: bool = True,
+                           delay: float = 0.01,
+                           max_delay: float = 0.1,
+                           timeout: Optional[float] = None,
+                           cancel: Optional[_utils.CancellationToken] = None
+                           ) -> bool:
+        """Attempt to acquire a writer's lock (of all of the keys).
+
+        Args:
+            blocking:
+                Whether to wait to try to acquire the lock.
+            delay:
+                When `blocking`, starting delay as well as the delay increment
+                (in seconds).
+            max_delay:
+                When `blocking` the maximum delay in between attempts to
+                acquire (in seconds).
+            timeout:
+                When `blocking`, maximal waiting time (in seconds).
+            cancel:
+                Optional cancellation token (a :py:class:`.CancellationToken`
+                or a `threading.Event`), waiting is given up once it is set.
+
+        Returns:
+            whether or not the acquisition succeeded
+        """
+        return self._watched(self.table._acquire(
+            self.holder, self.keys, True, blocking, delay, max_delay,
+            timeout, cancel, lock=self))
+
+    def _watched(self, gotten):
+        # A conversion keeps holding the keys, so it keeps the hold's watch.
+        if gotten and self._watch is None:
+            self._watch = _utils.watch_hold(self)
+        return gotten
+
+    def _unwatch(self):
+        if self._watch is not None:
+            self._watch.done()
+            self._watch = None
+
+    def release_read_lock(self):
+        """Release the reader's lock."""
+        self.table._release(self.holder)
+        self._unwatch()
+
+    def release_write_lock(self):
+        """Release the writer's lock."""
+        self.table._release(self.holder)
+        self._unwatch()
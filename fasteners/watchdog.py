@@ -0,0 +1,307 @@
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Callable
+from typing import Optional
+
+from fasteners import _utils
+
+LOG = logging.getLogger(__name__)
+
+WatchdogReport = collections.namedtuple(
+    'WatchdogReport', ['kind', 'lock', 'duration', 'thread', 'stack',
+                       'holders'])
+WatchdogReport.__doc__ = """A slow wait for (or a long hold of) a lock.
+
+Attributes:
+    kind: `'wait'` for a slow wait, `'hold'` for a long hold.
+    lock: The lock waited for (or held).
+    duration: How long it has been waited for (or held) so far, in seconds.
+    thread: The waiting (or holding) thread (the task for asyncio locks).
+    stack: The current stack of that thread (formatted), None if unknown.
+    holders: The holders of the lock, a list of :py:class:`.LockHolder` for
+        process locks (with their pids), of :py:class:`.ThreadHolder` for
+        the inter thread and asyncio readers writer locks (and the writer of
+        a `BigReaderWriterLock`), None if unknown.
+"""
+
+ThreadHolder = collections.namedtuple('ThreadHolder',
+                                      ['thread', 'mode', 'stack'])
+ThreadHolder.__doc__ = """A thread (or task) holding a readers writer lock.
+
+Attributes:
+    thread: The holding thread (or greenlet, or asyncio task).
+    mode: `'w'` for the writer, `'u'` for the upgradeable reader and `'r'`
+        for a reader.
+    stack: The current stack of the thread (formatted), None if unknown.
+"""
+
+
+def _stack(thread):
+    get_stack = getattr(thread, 'get_stack', None)
+    if get_stack is not None:
+        # An asyncio task, where it is suspended.
+        frames = get_stack()
+        if not frames:
+            return None
+        summary = traceback.StackSummary.extract(
+            (frame, frame.f_lineno) for frame in frames)
+        return ''.join(summary.format())
+    ident = getattr(thread, 'ident', None)
+    frame = sys._current_frames().get(ident)
+    if frame is None:
+        return None
+    return ''.join(traceback.format_stack(frame))
+
+
+class _Watch(object):
+    """A wait for (or a hold of) a lock, watched by a watchdog."""
+
+    __slots__ = ('watchdog', 'kind', 'lock', 'thread', 'since', 'reported')
+
+    def __init__(self, watchdog, kind, lock, owner):
+        self.watchdog = watchdog
+        self.kind = kind
+        self.lock = lock
+        self.thread = _utils.pick_first_not_none(owner,
+                                                 threading.current_thread())
+        self.since = time.monotonic()
+        self.reported = False
+
+    def done(self):
+        """Stop watching (the wait or hold is over)."""
+        with self.watchdog._lock:
+            self.watchdog._watches.discard(self)
+
+
+class Watchdog:
+    """Reports slow waits for, and long holds of, locks.
+
+    While running (only one watchdog runs at a time), the locks of fasteners
+    tell it when they start waiting and when they are acquired and released
+    (the writers of a `SeqLock` through its internal `ReaderWriterLock`, so
+    they are reported as waits for and holds of that lock). A single
+    background thread checks every `interval` for waits and holds that took
+    longer than their threshold, and reports each of them once: with the
+    stack of the waiting (or holding) thread and the holders of the lock (the
+    pids of the holders of process locks, the threads and stacks of the
+    holders of a `ReaderWriterLock`).
+
+    When not running, locks only check whether a watchdog is running.
+    """
+
+    def __init__(self,
+                 wait_threshold: Optional[float] = 1.0,
+                 hold_threshold: Optional[float] = None,
+                 hook: Optional[Callable[[WatchdogReport], None]] = None,
+                 interval: Optional[float] = None,
+                 logger: Optional[logging.Logger] = None):
+        """
+        Args:
+            wait_threshold:
+                Waits longer than this (in seconds) are reported, None to not
+                report waits.
+            hold_threshold:
+                Holds longer than this (in seconds) are reported, None to not
+                report holds.
+            hook:
+                Optional function called with a :py:class:`.WatchdogReport`
+                for every report (from the watchdog thread), by default
+                reports are logged as warnings.
+            interval:
+                Optional time in between checks (in seconds), by default half
+                of the smallest threshold.
+            logger:
+                Optional logger to use for logging.
+        """
+        thresholds = [threshold for threshold in (wait_threshold,
+                                                  hold_threshold)
+                      if threshold is not None]
+        if not thresholds:
+            raise ValueError("At least one threshold must be given")
+        if any(threshold <= 0 for threshold in thresholds):
+            raise ValueError("Thresholds must be greater than zero")
+        self.wait_threshold = wait_threshold
+        self.hold_threshold = hold_threshold
+        self.hook = hook
+        self.interval = _utils.pick_first_not_none(interval,
+                                                   min(thresholds) / 2.0)
+        if self.interval <= 0:
+            raise ValueError("Interval must be greater than zero")
+        self.logger = _utils.pick_first_not_none(logger, LOG)
+        # Changed by the waiting and holding threads, checked by the
+        # watchdog thread.
+        self._watches = set()
+        self._lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+        _utils.reset_after_fork(self)
+
+    def _after_fork_in_child(self):
+        # The watchdog thread is not inherited, nor are the waits and holds
+        # of the other threads.
+        if _utils.active_watchdog is self:
+            _utils.active_watchdog = None
+        self._stop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._watches.clear()
+
+    def start(self):
+        """Start watching the locks (of this process).
+
+        Raises:
+            RuntimeError: if a watchdog is running already.
+        """
+        if _utils.active_watchdog is not None:
+            raise RuntimeError("A watchdog is running already")
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        args=(self._stop,),
+                                        name='fasteners-watchdog')
+        self._thread.daemon = True
+        self._thread.start()
+        _utils.active_watchdog = self
+
+    def stop(self):
+        """Stop watching the locks."""
+        if _utils.active_watchdog is self:
+            _utils.active_watchdog = None
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._stop = None
+        with self._lock:
+            self._watches.clear()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def waiting(self, lock, owner=None) -> _Watch:
+        """Watch a wait of the current thread for a lock (used by locks).
+
+        Args:
+            lock:
+                The lock waited for.
+            owner:
+                Optional waiter other than the current thread (e.g. an
+                asyncio task).
+
+        Returns:
+            The watch, whose `done()` is to be called once the wait is over.
+        """
+        return self._watch('wait', lock, owner)
+
+    def holding(self, lock, owner=None) -> _Watch:
+        """Watch a hold of a lock by the current thread (used by locks).
+
+        Args:
+            lock:
+                The lock held.
+            owner:
+                Optional holder other than the current thread (e.g. an
+                asyncio task).
+
+        Returns:
+            The watch, whose `done()` is to be called once the lock is
+            released.
+        """
+        return self._watch('hold', lock, owner)
+
+    def _watch(self, kind, lock, owner):
+        watch = _Watch(self, kind, lock, owner)
+        with self._lock:
+            self._watches.add(watch)
+        return watch
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Report the waits and holds over their threshold (not reported
+        yet); done every `interval` by the watchdog thread."""
+        now = time.monotonic()
+        with self._lock:
+            watches = list(self._watches)
+        for watch in watches:
+            if watch.kind == 'wait':
+                threshold = self.wait_threshold
+            else:
+                threshold = self.hold_threshold
+            if (watch.reported or threshold is None
+                    or now - watch.since < threshold):
+                continue
+            watch.reported = True
+            report = WatchdogReport(watch.kind, watch.lock, now - watch.since,
+                                    watch.thread, _stack(watch.thread),
+                                    self._holders(watch.lock))
+            try:
+                if self.hook is not None:
+                    self.hook(report)
+                else:
+                    self._log(report)
+            except Exception:
+                self.logger.exception("Failed reporting %s", report)
+
+    def _holders(self, lock):
+        owners = getattr(lock, '_owners', None)
+        if owners is not None:
+            owners = owners()
+            if owners is None:
+                return None
+            return [ThreadHolder(thread, mode, _stack(thread))
+                    for thread, mode in owners]
+        holders = getattr(lock, 'holders', None)
+        if holders is None:
+            return None
+        try:
+            return holders()
+        except (NotImplementedError, OSError):
+            return None
+
+    def _log(self, report):
+        if report.kind == 'wait':
+            what = "Waiting %0.3fs for lock %s"
+        else:
+            what = "Holding %0.3fs lock %s"
+        if report.holders is None:
+            holders = "unknown holders"
+        else:
+            holders = ", ".join(
+                _describe(holder) for holder in report.holders) or "nobody"
+        stacks = [report.stack or "(stack unknown)\n"]
+        for holder in report.holders or ():
+            if isinstance(holder, ThreadHolder) and holder.stack:
+                stacks.append("Held by %s at:\n%s"
+                              % (_describe(holder), holder.stack))
+        self.logger.warning(what + " in %s (held by %s) at:\n%s",
+                            report.duration,
+                            getattr(report.lock, 'path', report.lock),
+                            _name(report.thread), holders, "".join(stacks))
+
+
+def _name(owner):
+    get_name = getattr(owner, 'get_name', None)
+    if get_name is not None:
+        # An asyncio task.
+        return 'task %s' % get_name()
+    return 'thread %s' % getattr(owner, 'name', owner)
+
+
+def _describe(holder):
+    if isinstance(holder, ThreadHolder):
+        who = _name(holder.thread)
+    elif holder.host is not None:
+        who = 'pid %s on %s' % (holder.pid, holder.host)
+    else:
+        who = 'pid %s' % holder.pid
+    return '%s (%s)' % (who, holder.mode)
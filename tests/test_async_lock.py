@@ -0,0 +1,206 @@
+import asyncio
+import random
+import subprocess
+import sys
+
+import pytest
+
+import fasteners
+from fasteners.async_lock import AsyncReaderWriterLock
+
+NAPPY_TIME = 0.05
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_read_write():
+    async def main():
+        lock = AsyncReaderWriterLock()
+        async with lock.read_lock():
+            assert lock.is_reader()
+            assert lock.owner == lock.READER
+        async with lock.write_lock():
+            assert lock.is_writer()
+            assert lock.owner == lock.WRITER
+        assert lock.owner is None
+
+    _run(main())
+
+
+def test_reentrancy_is_per_task():
+    async def main():
+        lock = AsyncReaderWriterLock()
+        async with lock.write_lock():
+            async with lock.write_lock():
+                async with lock.read_lock():
+                    assert lock.is_writer()
+                    assert lock.is_reader()
+            assert lock.is_writer()
+
+            # Another task (on the very same thread) has to wait.
+            other = asyncio.ensure_future(lock.acquire_read_lock())
+            await asyncio.sleep(NAPPY_TIME)
+            assert not other.done()
+        assert await other
+        assert lock.owner == lock.READER
+
+    _run(main())
+
+
+def test_reader_to_writer():
+    async def main():
+        lock = AsyncReaderWriterLock()
+        async with lock.read_lock():
+            with pytest.raises(RuntimeError):
+                await lock.acquire_write_lock()
+            assert lock.is_reader()
+        assert lock.owner is None
+
+    _run(main())
+
+
+def test_release_not_owned():
+    async def main():
+        lock = AsyncReaderWriterLock()
+        with pytest.raises(RuntimeError):
+            lock.release_read_lock()
+        with pytest.raises(RuntimeError):
+            lock.release_write_lock()
+
+    _run(main())
+
+
+def test_timeout():
+    async def main():
+        lock = AsyncReaderWriterLock()
+        assert await lock.acquire_write_lock()
+
+        async def other():
+            return (await lock.acquire_read_lock(timeout=NAPPY_TIME),
+                    await lock.acquire_write_lock(blocking=False),
+                    lock.has_pending_writers)
+
+        assert await asyncio.ensure_future(other()) == (False, False, False)
+        lock.release_write_lock()
+        assert lock.owner is None
+
+    _run(main())
+
+
+def test_bad_timeout():
+    async def main():
+        lock = AsyncReaderWriterLock()
+        with pytest.raises(ValueError):
+            await lock.acquire_read_lock(timeout=-1)
+
+    _run(main())
+
+
+@pytest.mark.parametrize("policy", AsyncReaderWriterLock.POLICIES)
+def test_cancelled_writer_is_removed(policy):
+    async def main():
+        lock = AsyncReaderWriterLock(policy=policy)
+        assert await lock.acquire_read_lock()
+
+        writer = asyncio.ensure_future(lock.acquire_write_lock())
+        await asyncio.sleep(0)
+        assert lock.has_pending_writers
+
+        writer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await writer
+        assert not lock.has_pending_writers
+
+        # Readers are no longer held back by the cancelled writer.
+        async def reader():
+            async with lock.read_lock():
+                return True
+
+        assert await asyncio.wait_for(asyncio.ensure_future(reader()), 1)
+        lock.release_read_lock()
+        assert lock.owner is None
+
+    _run(main())
+
+
+def test_cancelled_fifo_waiter_after_handoff():
+    async def main():
+        lock = AsyncReaderWriterLock(policy=AsyncReaderWriterLock.FIFO)
+        assert await lock.acquire_write_lock()
+        writer = asyncio.ensure_future(lock.acquire_write_lock())
+        await asyncio.sleep(0)
+
+        # The lock is handed off to the waiting writer, which is cancelled
+        # before it gets to run; it must not be left holding the lock.
+        lock.release_write_lock()
+        writer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await writer
+        assert lock.owner is None
+
+    _run(main())
+
+
+@pytest.mark.parametrize("policy", AsyncReaderWriterLock.POLICIES)
+def test_no_concurrent_readers_writers(policy):
+    lock = AsyncReaderWriterLock(policy=policy)
+    active = []
+    dups = []
+
+    async def worker(i):
+        for _ in range(10):
+            if random.choice([True, False]):
+                async with lock.write_lock():
+                    if active:
+                        dups.append(i)
+                    active.append('w')
+                    await asyncio.sleep(random.random() / 1000)
+                    active.remove('w')
+            else:
+                async with lock.read_lock():
+                    if 'w' in active:
+                        dups.append(i)
+                    active.append('r')
+                    await asyncio.sleep(random.random() / 1000)
+                    active.remove('r')
+
+    async def main():
+        await asyncio.gather(*[worker(i) for i in range(20)])
+
+    _run(main())
+    assert not dups
+    assert lock.owner is None
+
+
+class RWLocked(object):
+    def __init__(self):
+        self._lock = fasteners.AsyncReaderWriterLock()
+
+    @fasteners.async_read_locked
+    async def assert_i_am_read_locked(self):
+        assert self._lock.owner == fasteners.AsyncReaderWriterLock.READER
+
+    @fasteners.async_write_locked
+    async def assert_i_am_write_locked(self):
+        assert self._lock.owner == fasteners.AsyncReaderWriterLock.WRITER
+
+    def assert_i_am_not_locked(self):
+        assert self._lock.owner is None
+
+
+def test_read_write_locked():
+    async def main():
+        obj = RWLocked()
+        await obj.assert_i_am_write_locked()
+        await obj.assert_i_am_read_locked()
+        obj.assert_i_am_not_locked()
+
+    _run(main())
+
+
+def test_asyncio_imported_lazily():
+    code = ("import sys, fasteners; assert 'asyncio' not in sys.modules;"
+            " fasteners.AsyncReaderWriterLock; assert 'asyncio' in sys.modules")
+    subprocess.check_call([sys.executable, '-c', code])
@@ -15,6 +15,9 @@
 #    under the License.
 
 import threading
+import time
+
+import pytest
 
 import fasteners
 
@@ -45,6 +48,24 @@ class ManyLocks(object):
         assert not any(lock.locked() for lock in self._lock)
 
 
+class ManyLocksTimeout(object):
+    def __init__(self, amount):
+        self._lock = []
+        for _i in range(0, amount):
+            self._lock.append(threading.Lock())
+
+    @fasteners.locked(timeout=0.1)
+    def assert_i_am_locked(self):
+        assert all(lock.locked() for lock in self._lock)
+
+    @fasteners.locked(ordered=True)
+    def assert_i_am_locked_ordered(self):
+        assert all(lock.locked() for lock in self._lock)
+
+    def assert_i_am_not_locked(self):
+        assert not any(lock.locked() for lock in self._lock)
+
+
 class RWLocked(object):
     def __init__(self):
         self._lock = fasteners.ReaderWriterLock()
@@ -78,3 +99,49 @@ def test_read_write_locked():
     obj.assert_i_am_write_locked()
     obj.assert_i_am_read_locked()
     obj.assert_i_am_not_locked()
+
+
+def test_many_locked_timeout():
+    obj = ManyLocksTimeout(10)
+    obj.assert_i_am_locked()
+    obj.assert_i_am_locked_ordered()
+    obj.assert_i_am_not_locked()
+
+
+def test_many_locked_timeout_rolls_back():
+    obj = ManyLocksTimeout(10)
+    busy = obj._lock[5]
+    busy.acquire()
+
+    start = time.monotonic()
+    with pytest.raises(threading.ThreadError):
+        obj.assert_i_am_locked()
+    assert time.monotonic() - start >= 0.1
+    # Nothing but the busy lock stays locked.
+    busy.release()
+    obj.assert_i_am_not_locked()
+
+
+def test_many_locked_timeout_waits_for_busy_lock():
+    obj = ManyLocksTimeout(10)
+    busy = obj._lock[5]
+    busy.acquire()
+    t = threading.Timer(0.02, busy.release)
+    t.start()
+    obj.assert_i_am_locked()
+    t.join()
+    obj.assert_i_am_not_locked()
+
+
+def test_locked_timeout():
+    obj = Locked()
+
+    @fasteners.locked(timeout=0.01)
+    def assert_i_am_locked(self):
+        assert self._lock.locked()
+
+    assert_i_am_locked(obj)
+    obj._lock.acquire()
+    with pytest.raises(threading.ThreadError):
+        assert_i_am_locked(obj)
+    obj._lock.release()
@@ -51,6 +51,81 @@ def _test_eventlet_spawn_n_bugfix():
     assert FINISHED.wait(1) == 'finished'
 
 
+def _test_eventlet_detected():
+    """Locks created after monkey patching are green, even if fasteners was
+    imported before"""
+    import fasteners
+    from fasteners import _utils
+    import eventlet
+    eventlet.monkey_patch()
+
+    assert _utils.green_module() is eventlet
+
+    STARTED = eventlet.event.Event()
+    FINISHED = eventlet.event.Event()
+    lock = fasteners.ReaderWriterLock()
+
+    def other():
+        STARTED.send('started')
+        with lock.write_lock():
+            FINISHED.send('finished')
+
+    with lock.write_lock():
+        eventlet.spawn_n(other)
+        STARTED.wait()
+        assert FINISHED.wait(1) is None
+
+    assert FINISHED.wait(1) == 'finished'
+
+
+def _test_eventlet_process_locks_yield(lock_dir):
+    """Waiting for process locks (and retrying) lets other green threads run,
+    even if fasteners was imported before monkey patching"""
+    import os
+    import fasteners
+    from fasteners import _utils
+    import eventlet
+    eventlet.monkey_patch()
+
+    ticks = []
+
+    def ticker():
+        for _ in range(5):
+            ticks.append(None)
+            eventlet.sleep(0.01)
+
+    def ticks_while(wait):
+        del ticks[:]
+        t = eventlet.spawn(ticker)
+        wait()
+        # A blocking sleep never yields to the hub, so the ticker could not
+        # have started before the wait is over.
+        assert ticks
+        t.wait()
+
+    # flock locks conflict in between open files of a single process.
+    lock_file = os.path.join(lock_dir, 'lock')
+    holder = fasteners.InterProcessLock(lock_file, mechanism='flock')
+    assert holder.acquire(blocking=False)
+    waiter = fasteners.InterProcessLock(lock_file, mechanism='flock')
+    ticks_while(lambda: waiter.acquire(timeout=0.2))
+
+    rw_lock_file = os.path.join(lock_dir, 'rw_lock')
+    rw_holder = fasteners.InterProcessReaderWriterLock(rw_lock_file,
+                                                       mechanism='flock')
+    assert rw_holder.acquire_write_lock(blocking=False)
+    rw_waiter = fasteners.InterProcessReaderWriterLock(rw_lock_file,
+                                                       mechanism='flock')
+    ticks_while(lambda: rw_waiter.acquire_read_lock(timeout=0.2))
+
+    def again():
+        if retry.attempts < 10:
+            raise _utils.RetryAgain()
+
+    retry = _utils.Retry(0.01, 0.01)
+    ticks_while(lambda: retry(again))
+
+
 @pytest.mark.skip(reason="This bug is no longer triggered in recent versions of eventlet")
 def test_eventlet_spawn_n_bug():
     with concurrent.futures.ProcessPoolExecutor(mp_context=get_context('spawn')) as executor:
@@ -62,3 +137,15 @@ def test_eventlet_spawn_n_bugfix():
     with concurrent.futures.ProcessPoolExecutor(mp_context=get_context('spawn')) as executor:
         f = executor.submit(_test_eventlet_spawn_n_bugfix)
         f.result()
+
+
+def test_eventlet_detected():
+    with concurrent.futures.ProcessPoolExecutor(mp_context=get_context('spawn')) as executor:
+        f = executor.submit(_test_eventlet_detected)
+        f.result()
+
+
+def test_eventlet_process_locks_yield(tmp_path):
+    with concurrent.futures.ProcessPoolExecutor(mp_context=get_context('spawn')) as executor:
+        f = executor.submit(_test_eventlet_process_locks_yield, str(tmp_path))
+        f.result()
@@ -14,9 +14,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import subprocess
+import sys
 import threading
+import time
+import types
+
+import pytest
 
 import fasteners
+from fasteners import _utils
 
 
 def test_try_lock():
@@ -25,3 +32,156 @@ def test_try_lock():
         assert locked_1
         with fasteners.try_lock(lock) as locked_2:
             assert not locked_2
+
+
+def test_green_module(monkeypatch):
+    assert _utils.green_module() is None
+    assert _utils.current_thread_functor() is threading.current_thread
+
+    slept = []
+    gevent = types.ModuleType('gevent')
+    gevent.sleep = slept.append
+    gevent.getcurrent = object
+    monkey = types.ModuleType('gevent.monkey')
+    monkey.is_module_patched = lambda name: name == 'threading'
+    monkeypatch.setitem(sys.modules, 'gevent', gevent)
+    monkeypatch.setitem(sys.modules, 'gevent.monkey', monkey)
+
+    assert _utils.green_module() is gevent
+    assert _utils.current_thread_functor() is object
+    _utils.sleep(0.5)
+    assert slept == [0.5]
+
+
+def test_lock_stack_ordered():
+    acquired = []
+
+    class RecordingLock(object):
+        def __init__(self, name):
+            self.name = name
+
+        def acquire(self, blocking=True):
+            acquired.append(self.name)
+            return True
+
+        def release(self):
+            pass
+
+    locks = [RecordingLock(name) for name in 'cab']
+    with _utils.LockStack() as stack:
+        assert stack.acquire_locks(locks, ordered=True,
+                                   key=lambda lock: lock.name)
+    assert acquired == ['a', 'b', 'c']
+
+
+def test_lock_stack_acquire_locks_error():
+    class BrokenLock(object):
+        def acquire(self, blocking=True):
+            raise threading.ThreadError("broken")
+
+        def release(self):
+            pass
+
+    lock = threading.Lock()
+    with pytest.raises(threading.ThreadError):
+        with _utils.LockStack() as stack:
+            stack.acquire_locks([lock, BrokenLock()])
+    assert not lock.locked()
+
+
+def test_retry_cancel():
+    cancel = fasteners.CancellationToken()
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        raise _utils.RetryAgain()
+
+    t = threading.Timer(0.05, cancel.set)
+    t.start()
+    r = _utils.Retry(10, 10, cancel=cancel)
+    # Gives up right away instead of sleeping out its (long) delay.
+    assert r(fn) is False
+    t.join()
+    assert len(attempts) == 1
+    assert r(fn) is False
+    assert len(attempts) == 1
+
+
+def test_hold_stats(tmp_path):
+    path = _utils.canonicalize_path(tmp_path / 'lock')
+    stats = _utils.HoldStats.for_path(path, publish=True)
+    assert _utils.HoldStats.for_path(path) is stats
+    assert stats.hold() is None and stats.remaining(0) is None
+
+    since = stats.acquired(0.5)
+    assert stats.wait() == 0.5
+    stats.released(since - 2)
+    assert 2 <= stats.hold() < 3
+    # Start of the hold unknown, half of what is left of the average.
+    assert 0.5 <= stats.remaining(1) <= 1
+
+    # Published to other processes (and lock objects of other paths).
+    other = _utils.HoldStats(path)
+    other.publish = True
+    assert other.hold() == stats.hold()
+    assert other.wait() == 0.5
+    other.acquired(0.0)
+    assert stats.wait() == 0.375
+    assert 1 < stats.remaining(10) <= 3
+
+
+def test_adaptive_retry():
+    stats = _utils.HoldStats(b'')
+    r = _utils.AdaptiveRetry(stats, 0.01, 0.1)
+    r._started = time.monotonic()
+    # Nothing known yet, the usual delays.
+    assert r._next_delay() == 0.01
+
+    # Short holds are spun for, but not for too long.
+    stats.released(stats.acquired(0.0) - 0.0001)
+    assert r._next_delay() == 0.0
+    r._started -= r.SPIN_TIME
+    assert r._next_delay() == pytest.approx(0.02)
+
+    # Long holds are slept out.
+    stats._state = [5.0, 0.0, time.monotonic() - 1.0]
+    assert 3.9 < r._next_delay() <= 4.0
+    stats._state = [5.0, 0.0, time.monotonic() - 6.0]
+    assert r._next_delay() == pytest.approx(0.03)
+
+
+# Import time (in seconds) of the modules of fasteners itself that `import
+# fasteners` may take (best of a few runs).
+IMPORT_TIME_BUDGET = 0.02
+
+
+def test_lazy_imports():
+    code = ("import sys, fasteners\n"
+            "for name in ('logging', 'pathlib', 'fasteners.lock',"
+            " 'fasteners.process_lock', 'fasteners.process_mechanism',"
+            " 'fasteners.pywin32'):\n"
+            "    assert name not in sys.modules, name\n"
+            "for name in fasteners.__all__:\n"
+            "    getattr(fasteners, name)\n"
+            "assert set(fasteners.__all__) <= set(dir(fasteners))\n")
+    subprocess.check_call([sys.executable, '-c', code])
+
+
+def _import_time():
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import fasteners'],
+                            stderr=subprocess.PIPE, check=True).stderr
+    total = 0
+    for line in output.decode().splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip().startswith('fasteners'):
+            total += int(fields[0].split(':')[1])
+    return total / 1e6
+
+
+@pytest.mark.skipif(sys.implementation.name != 'cpython',
+                    reason='-X importtime is cpython only')
+def test_import_time_budget():
+    assert min(_import_time() for _ in range(3)) < IMPORT_TIME_BUDGET
@@ -0,0 +1,177 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import pytest
+
+from fasteners import lease_lock as ll
+
+
+@pytest.fixture()
+def lock_dir():
+    tmp_dir = tempfile.mkdtemp()
+    yield tmp_dir
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _read_lease(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_acquire_release(lock_dir):
+    lock_file = os.path.join(lock_dir, 'sub', 'lease')
+    lock = ll.InterProcessLeaseLock(lock_file)
+    with lock:
+        assert lock.is_held()
+        lease = _read_lease(lock_file)
+        assert lease['holder'] == lock.holder_id
+        assert lease['token'] == 1
+        assert not os.path.exists(lock_file + '.guard')
+    assert not lock.is_held()
+    assert _read_lease(lock_file)['holder'] is None
+
+    with lock:
+        assert lock.token == 2
+
+
+def test_exclusive(lock_dir):
+    lock_file = os.path.join(lock_dir, 'lease')
+    lock1 = ll.InterProcessLeaseLock(lock_file)
+    lock2 = ll.InterProcessLeaseLock(lock_file)
+
+    assert lock1.acquire()
+    assert not lock2.acquire(blocking=False)
+    start = time.monotonic()
+    assert not lock2.acquire(timeout=0.1)
+    assert time.monotonic() - start >= 0.1
+
+    t = threading.Timer(0.05, lock1.release)
+    t.start()
+    assert lock2.acquire(timeout=5)
+    t.join()
+    lock2.release()
+
+
+def test_bad_release(lock_dir):
+    lock = ll.InterProcessLeaseLock(os.path.join(lock_dir, 'lease'))
+    with pytest.raises(threading.ThreadError):
+        lock.release()
+
+
+def test_bad_arguments(lock_dir):
+    lock_file = os.path.join(lock_dir, 'lease')
+    with pytest.raises(ValueError):
+        ll.InterProcessLeaseLock(lock_file, ttl=0)
+    with pytest.raises(ValueError):
+        ll.InterProcessLeaseLock(lock_file, ttl=1, heartbeat_interval=1)
+
+
+def test_heartbeat_keeps_lease(lock_dir):
+    lock_file = os.path.join(lock_dir, 'lease')
+    lock1 = ll.InterProcessLeaseLock(lock_file, ttl=0.3)
+    lock2 = ll.InterProcessLeaseLock(lock_file, ttl=0.3)
+
+    with lock1:
+        assert not lock2.acquire(timeout=1)
+        assert lock1.is_held()
+
+
+def _hold_and_die(lock_file):
+    lock = ll.InterProcessLeaseLock(lock_file, ttl=0.3)
+    lock.acquire()
+    os._exit(0)
+
+
+def test_expired_lease_is_taken_over(lock_dir):
+    lock_file = os.path.join(lock_dir, 'lease')
+    child = multiprocessing.Process(target=_hold_and_die, args=(lock_file,))
+    child.start()
+    child.join()
+    assert _read_lease(lock_file)['holder'] is not None
+
+    lock = ll.InterProcessLeaseLock(lock_file, ttl=0.3)
+    assert lock.acquire(timeout=5)
+    assert lock.token == 2
+    lock.release()
+
+
+def test_fencing(lock_dir):
+    lock_file = os.path.join(lock_dir, 'lease')
+    lock1 = ll.InterProcessLeaseLock(lock_file, ttl=0.2)
+    lock2 = ll.InterProcessLeaseLock(lock_file, ttl=0.2)
+
+    assert lock1.acquire()
+    # Simulate a hung holder that stops renewing its lease.
+    lock1._stop_heartbeat()
+    assert lock2.acquire(timeout=5)
+    assert lock2.token > lock1.token
+    assert not lock1.is_held()
+    assert lock2.is_held()
+
+    # The stale holder releasing does not affect the new one.
+    lock1.release()
+    assert lock2.is_held()
+    lock2.release()
+
+
+def test_waiters_leave_guard_alone_while_held(lock_dir, monkeypatch):
+    lock_file = os.path.join(lock_dir, 'lease')
+    lock1 = ll.InterProcessLeaseLock(lock_file)
+    lock2 = ll.InterProcessLeaseLock(lock_file)
+
+    with lock1:
+        guarded = []
+        monkeypatch.setattr(lock2, '_try_lock_guard',
+                            lambda: guarded.append(True))
+        assert not lock2.acquire(timeout=0.1)
+        assert guarded == []
+
+
+def test_stale_guard_broken_once(lock_dir):
+    lock_file = os.path.join(lock_dir, 'lease')
+    lock1 = ll.InterProcessLeaseLock(lock_file, ttl=0.2)
+    lock2 = ll.InterProcessLeaseLock(lock_file, ttl=0.2)
+
+    guard_path = lock_file + '.guard'
+    with open(guard_path, 'w') as f:
+        f.write('crashed')
+    stale = time.time() - 1
+    os.utime(guard_path, (stale, stale))
+
+    # Both waiters saw the stale guard, but by the time the second one
+    # breaks it the first one already replaced it with a fresh guard.
+    seen_token = lock2._read_guard(os.fsencode(guard_path))
+    assert lock1._try_lock_guard() is False
+    assert lock1._try_lock_guard() is True
+    os.utime(guard_path, (stale, stale))
+    assert not lock2._remove_guard(
+        lambda path: lock2._read_guard(path) == seen_token)
+    assert lock2._read_guard(os.fsencode(guard_path)) == lock1._guard_token
+
+    lock1._unlock_guard()
+    assert not os.path.exists(guard_path)
+    assert os.listdir(lock_dir) == []
+
+
+def test_broken_guard_not_removed_by_former_holder(lock_dir):
+    lock_file = os.path.join(lock_dir, 'lease')
+    lock1 = ll.InterProcessLeaseLock(lock_file, ttl=0.2)
+    lock2 = ll.InterProcessLeaseLock(lock_file, ttl=0.2)
+
+    guard_path = lock_file + '.guard'
+    assert lock1._try_lock_guard()
+    # lock1 stalls past the ttl, lock2 breaks its guard and takes it.
+    stale = time.time() - 1
+    os.utime(guard_path, (stale, stale))
+    assert not lock2._try_lock_guard()
+    assert lock2._try_lock_guard()
+
+    lock1._unlock_guard()
+    assert lock2._read_guard(os.fsencode(guard_path)) == lock2._guard_token
+    lock2._unlock_guard()
+    assert os.listdir(lock_dir) == []
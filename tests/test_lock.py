@@ -16,6 +16,8 @@
 
 import collections
 from concurrent import futures
+import gc
+import os
 import random
 import threading
 import time
@@ -48,9 +50,10 @@ def _find_overlaps(times, start, end):
     return overlaps
 
 
-def _spawn_variation(readers, writers, max_workers=None):
+def _spawn_variation(readers, writers, max_workers=None,
+                     policy=fasteners.ReaderWriterLock.PREFER_WRITERS):
     start_stops = collections.deque()
-    lock = fasteners.ReaderWriterLock()
+    lock = fasteners.ReaderWriterLock(policy=policy)
 
     def read_func(ident):
         with lock.read_lock():
@@ -517,8 +520,9 @@ def test_double_reader_plain():
     assert not lock.is_writer()
 
 
-def test_multi_reader_multi_writer():
-    writer_times, reader_times = _spawn_variation(10, 10)
+@pytest.mark.parametrize("policy", fasteners.ReaderWriterLock.POLICIES)
+def test_multi_reader_multi_writer(policy):
+    writer_times, reader_times = _spawn_variation(10, 10, policy=policy)
     assert len(writer_times) == 10
     assert len(reader_times) == 10
 
@@ -592,3 +596,713 @@ def test_error_when_releasing_read_lock_without_read_lock():
     lock = fasteners.ReaderWriterLock()
     with pytest.raises(RuntimeError):
         lock.release_read_lock()
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        fasteners.ReaderWriterLock(policy='random')
+
+
+def _wait_for(predicate):
+    watch = _utils.StopWatch(duration=WAIT_TIMEOUT)
+    watch.start()
+    while not predicate():
+        assert not watch.expired()
+        time.sleep(0.001)
+
+
+def _policy_order(policy):
+    """Record the order in which queued readers and writers get the lock.
+
+    A reader holds the lock while a writer, a reader and a second writer
+    queue up (in that order) behind it.
+    """
+    lock = fasteners.ReaderWriterLock(policy=policy)
+    order = collections.deque()
+    release = threading.Event()
+
+    def holder():
+        with lock.read_lock():
+            order.append('r0')
+            release.wait(WAIT_TIMEOUT)
+
+    def writer(name):
+        with lock.write_lock():
+            order.append(name)
+            time.sleep(NAPPY_TIME)
+
+    def reader(name):
+        with lock.read_lock():
+            order.append(name)
+            time.sleep(NAPPY_TIME)
+
+    threads = [_daemon_thread(holder)]
+    threads[0].start()
+    _wait_for(lambda: lock.owner == lock.READER)
+
+    w1 = _daemon_thread(lambda: writer('w1'))
+    w1.start()
+    threads.append(w1)
+    _wait_for(lambda: len(lock._pending_writers) == 1)
+
+    r1 = _daemon_thread(lambda: reader('r1'))
+    r1.start()
+    threads.append(r1)
+    time.sleep(NAPPY_TIME)
+
+    w2 = _daemon_thread(lambda: writer('w2'))
+    w2.start()
+    threads.append(w2)
+    _wait_for(lambda: len(lock._pending_writers) == 2)
+
+    release.set()
+    for t in threads:
+        t.join(WAIT_TIMEOUT)
+    return list(order)
+
+
+def test_policy_prefer_writers():
+    assert _policy_order(fasteners.ReaderWriterLock.PREFER_WRITERS) == [
+        'r0', 'w1', 'w2', 'r1']
+
+
+def test_policy_prefer_readers():
+    assert _policy_order(fasteners.ReaderWriterLock.PREFER_READERS) == [
+        'r0', 'r1', 'w1', 'w2']
+
+
+def test_policy_phase_fair():
+    assert _policy_order(fasteners.ReaderWriterLock.PHASE_FAIR) == [
+        'r0', 'w1', 'r1', 'w2']
+
+
+def test_policy_fifo():
+    assert _policy_order(fasteners.ReaderWriterLock.FIFO) == [
+        'r0', 'w1', 'r1', 'w2']
+
+
+def test_policy_fifo_no_barging():
+    lock = fasteners.ReaderWriterLock(policy=fasteners.ReaderWriterLock.FIFO)
+    lock.acquire_read_lock()
+    writer = _daemon_thread(lock.acquire_write_lock)
+    writer.start()
+    _wait_for(lambda: lock.has_pending_writers)
+
+    # A new reader queues up behind the pending writer...
+    got_read = threading.Event()
+
+    def reader():
+        with lock.read_lock():
+            got_read.set()
+
+    _daemon_thread(reader).start()
+    assert not got_read.wait(NAPPY_TIME)
+
+    # ... and the writer is handed the lock as soon as we let go.
+    lock.release_read_lock()
+    writer.join(WAIT_TIMEOUT)
+    assert lock.owner == lock.WRITER
+    assert not got_read.is_set()
+
+
+def test_upgradeable_reader_with_plain_readers():
+    lock = fasteners.ReaderWriterLock()
+    got_read = threading.Event()
+
+    def reader():
+        with lock.read_lock():
+            got_read.set()
+
+    with lock.upgradeable_read_lock():
+        assert lock.is_reader()
+        assert lock.is_upgradeable_reader()
+        assert lock.owner == lock.READER
+        t = _daemon_thread(reader)
+        t.start()
+        assert got_read.wait(WAIT_TIMEOUT)
+        t.join(WAIT_TIMEOUT)
+
+    assert not lock.is_reader()
+    assert lock.owner is None
+
+
+def test_single_upgradeable_reader():
+    lock = fasteners.ReaderWriterLock()
+    got_upgradeable = threading.Event()
+
+    def other():
+        with lock.upgradeable_read_lock():
+            got_upgradeable.set()
+
+    lock.acquire_upgradeable_read_lock()
+    t = _daemon_thread(other)
+    t.start()
+    assert not got_upgradeable.wait(NAPPY_TIME)
+    lock.release_upgradeable_read_lock()
+    assert got_upgradeable.wait(WAIT_TIMEOUT)
+    t.join(WAIT_TIMEOUT)
+
+
+def test_upgrade_waits_for_readers_and_blocks_writers():
+    lock = fasteners.ReaderWriterLock()
+    activated = collections.deque()
+    reading = threading.Event()
+    release_reader = threading.Event()
+
+    def reader():
+        with lock.read_lock():
+            reading.set()
+            release_reader.wait(WAIT_TIMEOUT)
+            activated.append('r')
+
+    def writer():
+        with lock.write_lock():
+            activated.append('w')
+
+    lock.acquire_upgradeable_read_lock()
+    r = _daemon_thread(reader)
+    r.start()
+    assert reading.wait(WAIT_TIMEOUT)
+    w = _daemon_thread(writer)
+    w.start()
+    _wait_for(lambda: lock.has_pending_writers)
+
+    release_reader.set()
+    lock.upgrade()
+    assert lock.is_writer()
+    assert not lock.is_upgradeable_reader()
+    activated.append('u')
+    lock.release_write_lock()
+
+    r.join(WAIT_TIMEOUT)
+    w.join(WAIT_TIMEOUT)
+    assert list(activated) == ['r', 'u', 'w']
+
+
+def test_upgrade_not_starved_by_preferred_readers():
+    lock = fasteners.ReaderWriterLock(
+        policy=fasteners.ReaderWriterLock.PREFER_READERS)
+    activated = collections.deque()
+    reading = threading.Event()
+    release_reader = threading.Event()
+
+    def reader():
+        with lock.read_lock():
+            reading.set()
+            release_reader.wait(WAIT_TIMEOUT)
+            activated.append('r1')
+
+    def late_reader():
+        with lock.read_lock():
+            activated.append('r2')
+
+    def upgrader():
+        lock.acquire_upgradeable_read_lock()
+        lock.upgrade()
+        activated.append('u')
+        lock.release_write_lock()
+
+    r = _daemon_thread(reader)
+    r.start()
+    assert reading.wait(WAIT_TIMEOUT)
+    u = _daemon_thread(upgrader)
+    u.start()
+    _wait_for(lambda: lock._upgrading)
+    r2 = _daemon_thread(late_reader)
+    r2.start()
+    time.sleep(0.05)
+    assert not activated
+
+    release_reader.set()
+    for t in (r, u, r2):
+        t.join(WAIT_TIMEOUT)
+    assert list(activated) == ['r1', 'u', 'r2']
+
+
+def test_upgrade_in_context_manager():
+    lock = fasteners.ReaderWriterLock()
+    with lock.upgradeable_read_lock():
+        lock.upgrade()
+        assert lock.owner == lock.WRITER
+    assert lock.owner is None
+
+    with lock.upgradeable_read_lock():
+        lock.upgrade()
+        lock.downgrade()
+        assert lock.owner == lock.READER
+        assert not lock.is_writer()
+    assert lock.owner is None
+
+
+def test_upgrade_errors():
+    lock = fasteners.ReaderWriterLock()
+    with pytest.raises(RuntimeError):
+        lock.upgrade()
+
+    with lock.read_lock():
+        with pytest.raises(RuntimeError):
+            lock.acquire_upgradeable_read_lock()
+
+    with lock.upgradeable_read_lock():
+        with pytest.raises(RuntimeError):
+            lock.acquire_write_lock()
+        with lock.read_lock():
+            with pytest.raises(RuntimeError):
+                lock.upgrade()
+        with lock.upgradeable_read_lock():
+            with pytest.raises(RuntimeError):
+                lock.upgrade()
+
+    with pytest.raises(RuntimeError):
+        lock.release_upgradeable_read_lock()
+    assert lock.owner is None
+
+
+def test_downgrade_keeps_writers_out():
+    lock = fasteners.ReaderWriterLock()
+    activated = collections.deque()
+
+    def writer():
+        with lock.write_lock():
+            activated.append('w')
+
+    lock.acquire_write_lock()
+    w = _daemon_thread(writer)
+    w.start()
+    _wait_for(lambda: lock.has_pending_writers)
+
+    lock.downgrade()
+    assert lock.is_reader()
+    assert not lock.is_writer(check_pending=False)
+    time.sleep(NAPPY_TIME)
+    activated.append('r')
+    lock.release_read_lock()
+
+    w.join(WAIT_TIMEOUT)
+    assert list(activated) == ['r', 'w']
+
+
+def test_downgrade_errors():
+    lock = fasteners.ReaderWriterLock()
+    with pytest.raises(RuntimeError):
+        lock.downgrade()
+
+    with lock.write_lock():
+        with lock.write_lock():
+            with pytest.raises(RuntimeError):
+                lock.downgrade()
+
+
+@pytest.mark.parametrize("policy", fasteners.ReaderWriterLock.POLICIES)
+def test_upgradeable_no_concurrent_writers(policy):
+    lock = fasteners.ReaderWriterLock(policy=policy)
+    active = collections.deque()
+    dups = collections.deque()
+
+    def check(me):
+        if active:
+            dups.append(me)
+        active.append(me)
+        time.sleep(random.random() / 1000)
+        active.remove(me)
+
+    def upgrader(i):
+        with lock.upgradeable_read_lock():
+            lock.upgrade()
+            check(i)
+            if i % 2:
+                lock.downgrade()
+
+    def writer(i):
+        with lock.write_lock():
+            check(i)
+
+    def reader(i):
+        with lock.read_lock():
+            time.sleep(random.random() / 1000)
+
+    funcs = [upgrader, writer, reader]
+    with futures.ThreadPoolExecutor(max_workers=THREAD_COUNT) as e:
+        fs = [e.submit(funcs[i % 3], i) for i in range(0, 60)]
+    for f in fs:
+        f.result()
+    assert not dups
+    assert lock.owner is None
+
+
+@pytest.mark.parametrize("policy", fasteners.ReaderWriterLock.POLICIES)
+@pytest.mark.parametrize("token_cls", [fasteners.CancellationToken,
+                                       threading.Event])
+def test_cancel_waits(policy, token_cls):
+    lock = fasteners.ReaderWriterLock(policy=policy)
+    results = []
+
+    def waiter(acquire):
+        cancel = token_cls()
+        t = threading.Timer(0.05, cancel.set)
+        t.start()
+        w = threading.Thread(
+            target=lambda: results.append(acquire(cancel=cancel)))
+        w.start()
+        w.join(WAIT_TIMEOUT)
+        t.join()
+
+    lock.acquire_write_lock()
+    for acquire in (lock.acquire_read_lock, lock.acquire_write_lock,
+                    lock.acquire_upgradeable_read_lock):
+        start = time.monotonic()
+        waiter(acquire)
+        assert time.monotonic() - start < WAIT_TIMEOUT
+    assert results == [False, False, False]
+    lock.release_write_lock()
+
+    # Cancelled waiters left no trace, the lock is free for everyone.
+    assert lock.acquire_write_lock(cancel=token_cls())
+    lock.release_write_lock()
+    assert lock.acquire_upgradeable_read_lock()
+    assert lock.acquire_read_lock()
+    lock.release_read_lock()
+    lock.release_upgradeable_read_lock()
+    assert lock.owner is None
+    assert not lock.has_pending_writers
+
+
+def test_cancellation_token_wakes_up_waiters():
+    lock = fasteners.ReaderWriterLock()
+    cancel = fasteners.CancellationToken()
+    lock.acquire_write_lock()
+    t = threading.Timer(0.05, cancel.set)
+    t.start()
+    w = threading.Thread(target=lock.acquire_read_lock, args=(cancel,))
+    w.start()
+    # Waits without polling, only the token can wake it up.
+    w.join(5)
+    t.join()
+    assert not w.is_alive()
+    assert not cancel._callbacks
+    lock.release_write_lock()
+
+
+def test_big_reader_lock_reentrancy():
+    lock = fasteners.BigReaderWriterLock()
+    with lock.read_lock():
+        with lock.read_lock():
+            assert lock.is_reader()
+        with pytest.raises(RuntimeError):
+            lock.acquire_write_lock()
+        assert lock.is_reader()
+    assert not lock.is_reader()
+
+    with lock.write_lock():
+        with lock.write_lock():
+            with lock.read_lock():
+                assert lock.is_writer()
+                assert lock.is_reader()
+        assert lock.is_writer()
+        assert not lock.is_reader()
+    assert not lock.is_writer()
+
+    with pytest.raises(RuntimeError):
+        lock.release_read_lock()
+    with pytest.raises(RuntimeError):
+        lock.release_write_lock()
+
+
+def test_big_reader_lock_writer_to_reader():
+    lock = fasteners.BigReaderWriterLock()
+    got_write = threading.Event()
+
+    def writer():
+        with lock.write_lock():
+            got_write.set()
+
+    lock.acquire_write_lock()
+    lock.acquire_read_lock()
+    lock.release_write_lock()
+    assert lock.is_reader()
+    assert not lock.is_writer()
+
+    t = _daemon_thread(writer)
+    t.start()
+    assert not got_write.wait(NAPPY_TIME)
+    lock.release_read_lock()
+    assert got_write.wait(WAIT_TIMEOUT)
+    t.join(WAIT_TIMEOUT)
+
+
+def test_big_reader_lock_readers_share():
+    lock = fasteners.BigReaderWriterLock()
+    barrier = threading.Barrier(THREAD_COUNT, timeout=WAIT_TIMEOUT)
+
+    def reader():
+        with lock.read_lock():
+            # Would break if the readers excluded each other.
+            barrier.wait()
+
+    with futures.ThreadPoolExecutor(max_workers=THREAD_COUNT) as e:
+        fs = [e.submit(reader) for _ in range(THREAD_COUNT)]
+    for f in fs:
+        f.result()
+
+
+def test_big_reader_lock_no_concurrent_readers_writers():
+    lock = fasteners.BigReaderWriterLock()
+    active = collections.deque()
+    dups = collections.deque()
+
+    def run(me):
+        for _ in range(20):
+            if random.random() < 0.2:
+                with lock.write_lock():
+                    if active:
+                        dups.append(me)
+                    active.append(lock)
+                    time.sleep(random.random() / 1000)
+                    active.remove(lock)
+            else:
+                with lock.read_lock():
+                    active.append(me)
+                    time.sleep(random.random() / 1000)
+                    if lock in active:
+                        dups.append(me)
+                    active.remove(me)
+
+    with futures.ThreadPoolExecutor(max_workers=THREAD_COUNT) as e:
+        fs = [e.submit(run, i) for i in range(THREAD_COUNT)]
+    for f in fs:
+        f.result()
+    assert not dups
+
+
+def test_big_reader_lock_forgets_dead_threads():
+    lock = fasteners.BigReaderWriterLock()
+
+    def reader():
+        with lock.read_lock():
+            pass
+
+    threads = [_daemon_thread(reader) for _ in range(5)]
+    for t in threads:
+        t.start()
+        t.join()
+    del t, threads
+    gc.collect()
+    assert len(lock._slots) == 0
+
+
+def test_seq_lock_read_write():
+    lock = fasteners.SeqLock()
+    data = {'a': 0, 'b': 0}
+    assert lock.read(lambda: data['a']) == 0
+
+    with lock.write_lock():
+        assert lock.sequence % 2 == 1
+        with lock.write_lock():
+            data['a'] = data['b'] = 1
+        assert lock.sequence % 2 == 1
+    assert lock.sequence == 2
+    assert lock.read(lambda: (data['a'], data['b'])) == (1, 1)
+
+    with pytest.raises(RuntimeError):
+        lock.release_write_lock()
+
+
+def test_seq_lock_read_begin_retry():
+    lock = fasteners.SeqLock()
+    seq = lock.read_begin()
+    assert not lock.read_retry(seq)
+    with lock.write_lock():
+        assert lock.read_retry(lock.read_begin())
+    assert lock.read_retry(seq)
+
+
+def test_seq_lock_consistent_reads():
+    lock = fasteners.SeqLock()
+    data = {'a': 0, 'b': 0}
+    watch = _utils.StopWatch(duration=1)
+    watch.start()
+    torn = collections.deque()
+
+    def writer():
+        while not watch.expired():
+            with lock.write_lock():
+                data['a'] += 1
+                time.sleep(0)
+                data['b'] += 1
+
+    def reader():
+        while not watch.expired():
+            a, b = lock.read(lambda: (data['a'], data['b']))
+            if a != b:
+                torn.append((a, b))
+
+    with futures.ThreadPoolExecutor(max_workers=4) as e:
+        fs = [e.submit(writer)] + [e.submit(reader) for _ in range(3)]
+    for f in fs:
+        f.result()
+    assert not torn
+
+
+def test_seq_lock_falls_back_to_read_lock():
+    lock = fasteners.SeqLock(max_retries=0)
+    calls = collections.deque()
+    lock.acquire_write_lock()
+
+    def reader():
+        return lock.read(calls.append, 'read')
+
+    with futures.ThreadPoolExecutor(max_workers=1) as e:
+        f = e.submit(reader)
+        time.sleep(NAPPY_TIME)
+        # The fallback read lock waits for the writer.
+        assert not calls
+        lock.release_write_lock()
+        f.result()
+    assert list(calls) == ['read']
+
+
+def test_versioned_value():
+    value = fasteners.VersionedValue({'a': 1})
+    assert value.version == 0
+    assert value.get() == {'a': 1}
+
+    assert value.set({'a': 2}) == {'a': 1}
+    assert value.version == 1
+    assert value.update(lambda old: dict(old, b=3)) == {'a': 2, 'b': 3}
+    assert value.version == 2
+
+    with value.read() as snapshot:
+        assert snapshot == {'a': 2, 'b': 3}
+    assert value.synchronize(timeout=0)
+
+
+def test_versioned_value_synchronize_waits_for_old_readers():
+    value = fasteners.VersionedValue('old')
+    reading = threading.Event()
+    done_reading = threading.Event()
+    seen = collections.deque()
+
+    def reader():
+        with value.read() as snapshot:
+            reading.set()
+            done_reading.wait(WAIT_TIMEOUT)
+            seen.append(snapshot)
+
+    t = _daemon_thread(reader)
+    t.start()
+    assert reading.wait(WAIT_TIMEOUT)
+
+    assert value.set('new') == 'old'
+    # Readers of the new version do not hold anything up...
+    with value.read() as snapshot:
+        assert snapshot == 'new'
+    # ...but the old reader does.
+    assert not value.synchronize(timeout=NAPPY_TIME)
+
+    done_reading.set()
+    assert value.synchronize(timeout=WAIT_TIMEOUT)
+    t.join(WAIT_TIMEOUT)
+    assert list(seen) == ['old']
+
+
+def test_versioned_value_synchronize_in_old_read():
+    value = fasteners.VersionedValue(0)
+    with value.read():
+        value.set(1)
+        with pytest.raises(RuntimeError):
+            value.synchronize()
+
+
+def _use_inherited_rw_lock(lock):
+    try:
+        # The forking thread still holds its read lock, the reader thread
+        # (and its read lock) is gone.
+        assert lock.is_reader()
+        lock.release_read_lock()
+        assert lock.owner is None
+        cancel = threading.Event()
+        threading.Timer(5, cancel.set).start()
+        assert lock.acquire_write_lock(cancel=cancel)
+        lock.release_write_lock()
+    except BaseException:
+        os._exit(1)
+    os._exit(0)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_fork_resets_reader_writer_lock():
+    lock = fasteners.ReaderWriterLock()
+    entered = threading.Event()
+    leave = threading.Event()
+
+    def _read():
+        with lock.read_lock():
+            entered.set()
+            leave.wait(WAIT_TIMEOUT)
+
+    t = threading.Thread(target=_read)
+    t.start()
+    entered.wait(WAIT_TIMEOUT)
+    with lock.read_lock():
+        pid = os.fork()
+        if pid == 0:
+            _use_inherited_rw_lock(lock)
+        _pid, status = os.waitpid(pid, 0)
+    leave.set()
+    t.join()
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+def _use_inherited_thread_locks(big_lock, seq_lock, value):
+    try:
+        # The threads reading, writing and updating them are gone.
+        assert big_lock.is_reader()
+        big_lock.release_read_lock()
+        big_lock.acquire_write_lock()
+        big_lock.release_write_lock()
+        assert not seq_lock.sequence & 1
+        assert seq_lock.read(lambda: 'read', max_retries=0) == 'read'
+        with seq_lock.write_lock():
+            pass
+        value.set(2)
+        assert value.synchronize(timeout=5)
+    except BaseException:
+        os._exit(1)
+    os._exit(0)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_fork_resets_thread_locks():
+    big_lock = fasteners.BigReaderWriterLock()
+    seq_lock = fasteners.SeqLock()
+    value = fasteners.VersionedValue(0)
+    entered = threading.Event()
+    leave = threading.Event()
+
+    def _read():
+        with big_lock.read_lock():
+            with value.read():
+                entered.set()
+                leave.wait(WAIT_TIMEOUT)
+
+    def _write():
+        with seq_lock.write_lock():
+            entered.wait(WAIT_TIMEOUT)
+            leave.wait(WAIT_TIMEOUT)
+
+    threads = [threading.Thread(target=_read), threading.Thread(target=_write)]
+    for t in threads:
+        t.start()
+    entered.wait(WAIT_TIMEOUT)
+    while not seq_lock.sequence & 1:
+        time.sleep(0.001)
+    value.set(1)
+    with big_lock.read_lock():
+        pid = os.fork()
+        if pid == 0:
+            _use_inherited_thread_locks(big_lock, seq_lock, value)
+        _pid, status = os.waitpid(pid, 0)
+    leave.set()
+    for t in threads:
+        t.join()
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import pytest
+
+from fasteners import lock_server as ls
+from fasteners import server_lock as sl
+
+WIN32 = os.name == 'nt'
+
+pytestmark = pytest.mark.skipif(WIN32, reason='Needs unix domain sockets')
+
+
+@pytest.fixture()
+def socket_path():
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'locks.sock')
+    server = ls.LockServer(path)
+    server.start()
+    yield path
+    server.stop()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _wait_for_waiters(path, key, waiters):
+    start = time.monotonic()
+    while sl.server_stats(path)['keys'][key]['waiters'] != waiters:
+        assert time.monotonic() - start < 5
+        time.sleep(0.001)
+
+
+def test_exclusive(socket_path):
+    lock1 = sl.ServerLock('a', socket_path)
+    lock2 = sl.ServerLock('a', socket_path)
+
+    with lock1:
+        assert not lock2.acquire(blocking=False)
+        start = time.monotonic()
+        assert not lock2.acquire(timeout=0.1)
+        assert time.monotonic() - start >= 0.1
+        with sl.ServerLock('b', socket_path):
+            pass
+    assert lock2.acquire(blocking=False)
+    lock2.release()
+    with pytest.raises(threading.ThreadError):
+        lock2.release()
+
+
+def test_fifo_handoff(socket_path):
+    holder = sl.ServerLock('a', socket_path)
+    assert holder.acquire()
+    order = []
+
+    def waiter(i):
+        with sl.ServerLock('a', socket_path):
+            order.append(i)
+
+    threads = []
+    for i in range(5):
+        t = threading.Thread(target=waiter, args=(i,))
+        t.start()
+        threads.append(t)
+        _wait_for_waiters(socket_path, 'a', i + 1)
+    holder.release()
+    for t in threads:
+        t.join()
+    assert order == list(range(5))
+
+    stats = sl.server_stats(socket_path)
+    # Forgotten once neither held nor waited for, only counted.
+    assert stats['keys'] == {}
+    assert stats['totals']['acquisitions'] == 6
+    assert stats['totals']['contended'] == 5
+    assert stats['totals']['max_waiters'] == 5
+
+
+def _acquire_and_die(path):
+    assert sl.ServerLock('a', path).acquire()
+    os._exit(0)
+
+
+def test_released_on_disconnect(socket_path):
+    child = multiprocessing.Process(target=_acquire_and_die,
+                                    args=(socket_path,))
+    child.start()
+    child.join(10)
+    assert sl.ServerLock('a', socket_path).acquire(timeout=5)
+
+
+def test_reader_writer(socket_path):
+    reader1 = sl.ServerReaderWriterLock('a', socket_path)
+    reader2 = sl.ServerReaderWriterLock('a', socket_path)
+    writer = sl.ServerReaderWriterLock('a', socket_path)
+
+    with reader1.read_lock():
+        with reader2.read_lock():
+            assert not writer.acquire_write_lock(blocking=False)
+        # Converted into a write lock.
+        assert reader1.acquire_write_lock(blocking=False)
+        assert not reader2.acquire_read_lock(blocking=False)
+    with writer.write_lock():
+        assert not reader1.acquire_read_lock(blocking=False)
+
+
+def test_conversion_goes_first(socket_path):
+    reader1 = sl.ServerReaderWriterLock('a', socket_path)
+    reader2 = sl.ServerReaderWriterLock('a', socket_path)
+    writer = sl.ServerReaderWriterLock('a', socket_path)
+    assert reader1.acquire_read_lock()
+    assert reader2.acquire_read_lock()
+    t = threading.Thread(target=writer.acquire_write_lock)
+    t.start()
+    _wait_for_waiters(socket_path, 'a', 1)
+    converted = []
+    c = threading.Thread(
+        target=lambda: converted.append(reader1.acquire_write_lock()))
+    c.start()
+    _wait_for_waiters(socket_path, 'a', 2)
+    # A second conversion would deadlock.
+    assert not reader2.acquire_write_lock(timeout=5)
+    reader2.release_read_lock()
+    c.join(5)
+    assert converted == [True]
+    assert t.is_alive()
+    reader1.release_write_lock()
+    t.join(5)
+    writer.release_write_lock()
+
+
+def test_socket_in_use(socket_path):
+    with pytest.raises(OSError):
+        ls.LockServer(socket_path).start()
+    # Still served.
+    with sl.ServerLock('a', socket_path):
+        pass
+
+
+def test_no_server(socket_path):
+    lock = sl.ServerLock('a', socket_path + '.missing')
+    with pytest.raises(threading.ThreadError):
+        lock.acquire()
@@ -0,0 +1,241 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from fasteners import process_event as pe
+
+WIN32 = os.name == 'nt'
+
+
+@pytest.fixture()
+def state_file(tmp_path):
+    return str(tmp_path / 'state')
+
+
+def _waiters(path):
+    try:
+        return os.listdir(path + '.waiters')
+    except FileNotFoundError:
+        return []
+
+
+def _wait_for_waiters(path, count):
+    deadline = time.monotonic() + 10
+    while len(_waiters(path)) < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def _wait_on_event(path):
+    event = pe.InterProcessEvent(path, poll_interval=60)
+    assert event.wait(timeout=10)
+
+
+def _wait_on_condition(path, results_file, i):
+    cond = pe.InterProcessCondition(path, poll_interval=60)
+    with cond:
+        assert cond.wait(timeout=10)
+        with open(results_file, 'a') as f:
+            f.write('%d\n' % i)
+
+
+def test_event(state_file):
+    event = pe.InterProcessEvent(state_file)
+    assert not event.is_set()
+    start = time.monotonic()
+    assert not event.wait(timeout=0.1)
+    assert time.monotonic() - start >= 0.1
+    event.set()
+    assert event.is_set()
+    assert event.wait(timeout=0)
+    event.clear()
+    assert not event.is_set()
+    assert not _waiters(state_file)
+    with pytest.raises(ValueError):
+        event.wait(timeout=-1)
+
+
+def test_event_wakes_up_waiting_process(state_file):
+    child = multiprocessing.Process(target=_wait_on_event, args=(state_file,))
+    child.start()
+    try:
+        _wait_for_waiters(state_file, 1)
+        start = time.monotonic()
+        pe.InterProcessEvent(state_file).set()
+        child.join(10)
+        # Woken up right away, not after its (minute long) poll interval.
+        assert time.monotonic() - start < 5
+        assert child.exitcode == 0
+    finally:
+        if child.is_alive():
+            child.terminate()
+            child.join()
+
+
+def test_event_polling(state_file, monkeypatch):
+    monkeypatch.setattr(pe, '_HAS_FIFOS', False)
+    event = pe.InterProcessEvent(state_file, poll_interval=0.01)
+    t = threading.Timer(0.05, pe.InterProcessEvent(state_file).set)
+    t.start()
+    assert event.wait(timeout=10)
+    t.join()
+
+
+@pytest.mark.skipif(WIN32, reason='fifos are posix only')
+def test_notify_skips_dead_waiters(state_file):
+    waiters = pe._Waiters(os.fsencode(state_file) + b'.waiters', 1.0,
+                          time.sleep)
+    dead = waiters.register()
+    # A waiter that died, leaving its fifo (without reader) behind.
+    os.close(dead.read_fd)
+    os.close(dead.write_fd)
+    alive = waiters.register()
+    assert waiters.notify(1) == 1
+    assert waiters.wait(alive, 0)
+    assert not _waiters(state_file)
+    waiters.unregister(alive)
+
+
+def test_condition_notify(state_file, tmp_path):
+    results_file = str(tmp_path / 'results')
+    cond = pe.InterProcessCondition(state_file)
+    children = []
+    try:
+        for i in range(3):
+            child = multiprocessing.Process(
+                target=_wait_on_condition, args=(state_file, results_file, i))
+            child.start()
+            children.append(child)
+            _wait_for_waiters(state_file, i + 1)
+
+        with cond:
+            assert cond.notify() == 1
+        children[0].join(10)
+        assert children[0].exitcode == 0
+        time.sleep(0.1)
+        assert children[1].is_alive() and children[2].is_alive()
+
+        with cond:
+            assert cond.notify_all() == 2
+        for child in children:
+            child.join(10)
+            assert child.exitcode == 0
+        with open(results_file) as f:
+            assert f.read().split()[0] == '0'
+    finally:
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+                child.join()
+
+
+def test_condition_wait_for(state_file):
+    cond = pe.InterProcessCondition(state_file, poll_interval=0.01)
+    with cond:
+        start = time.monotonic()
+        assert not cond.wait_for(lambda: False, timeout=0.1)
+        assert time.monotonic() - start >= 0.1
+        assert cond.wait_for(lambda: True, timeout=0)
+        assert not cond.wait(timeout=0.01)
+        assert cond.lock.acquired
+
+
+def test_condition_bad_usage(state_file):
+    cond = pe.InterProcessCondition(state_file)
+    with pytest.raises(RuntimeError):
+        cond.wait()
+    with pytest.raises(RuntimeError):
+        cond.notify()
+    with pytest.raises(RuntimeError):
+        cond.notify_all()
+
+
+def _wait_on_barrier(path, parties):
+    barrier = pe.InterProcessBarrier(path, parties, poll_interval=60)
+    barrier.wait(timeout=10)
+
+
+def _arrive_and_die(path):
+    barrier = pe.InterProcessBarrier(path, 3)
+    t = threading.Thread(target=barrier.wait)
+    t.daemon = True
+    t.start()
+    while barrier.n_waiting < 1:
+        time.sleep(0.01)
+    os._exit(0)
+
+
+def test_barrier_threads(state_file):
+    barrier = pe.InterProcessBarrier(state_file, 3)
+    indexes = []
+
+    def _wait():
+        for _ in range(2):
+            indexes.append(barrier.wait(timeout=10))
+
+    threads = [threading.Thread(target=_wait) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(indexes) == [0, 0, 1, 1, 2, 2]
+    assert barrier.n_waiting == 0
+    assert not barrier.broken
+
+
+def test_barrier_wakes_up_waiting_processes(state_file):
+    children = [multiprocessing.Process(target=_wait_on_barrier,
+                                        args=(state_file, 3))
+                for _ in range(2)]
+    for child in children:
+        child.start()
+    try:
+        barrier = pe.InterProcessBarrier(state_file, 3)
+        _wait_for_waiters(state_file, 2)
+        start = time.monotonic()
+        assert barrier.wait(timeout=10) == 2
+        for child in children:
+            child.join(10)
+            assert child.exitcode == 0
+        # Woken up right away, not after their (minute long) poll interval.
+        assert time.monotonic() - start < 5
+    finally:
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+                child.join()
+
+
+def test_barrier_timeout_and_reset(state_file):
+    barrier = pe.InterProcessBarrier(state_file, 2)
+    with pytest.raises(threading.BrokenBarrierError):
+        barrier.wait(timeout=0.1)
+    assert barrier.broken
+    with pytest.raises(threading.BrokenBarrierError):
+        barrier.wait(timeout=0)
+    barrier.reset()
+    assert not barrier.broken
+
+    t = threading.Timer(0.1, barrier.reset)
+    t.start()
+    with pytest.raises(threading.BrokenBarrierError):
+        barrier.wait(timeout=10)
+    t.join()
+    assert not barrier.broken
+    with pytest.raises(ValueError):
+        pe.InterProcessBarrier(state_file, 0)
+
+
+def test_barrier_breaks_when_party_dies(state_file):
+    child = multiprocessing.Process(target=_arrive_and_die,
+                                    args=(state_file,))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+    barrier = pe.InterProcessBarrier(state_file, 3, poll_interval=0.05)
+    with pytest.raises(threading.BrokenBarrierError):
+        barrier.wait(timeout=10)
+    assert barrier.broken
@@ -28,6 +28,7 @@ import time
 import pytest
 
 from fasteners import process_lock as pl
+from fasteners import process_mechanism as pm
 from fasteners.process_mechanism import _interprocess_mechanism
 
 WIN32 = os.name == 'nt'
@@ -284,3 +285,409 @@ def test_lock_twice(lock_dir):
 
     # should release without crashing
     lock.release()
+
+
+MECHANISMS = ['default', 'mkdir', 'excl'] + ([] if WIN32 else ['fcntl', 'flock'])
+
+
+def _try_lock_with(lock_file, mechanism):
+    lock = pl.InterProcessLock(lock_file, mechanism=mechanism)
+    if not lock.acquire(blocking=False):
+        sys.exit(0)
+    lock.release()
+    sys.exit(1)
+
+
+def _acquire_and_die(lock_file, mechanism):
+    lock = pl.InterProcessLock(lock_file, mechanism=mechanism)
+    assert lock.acquire(blocking=False)
+    os._exit(0)
+
+
+@pytest.mark.parametrize("mechanism", MECHANISMS)
+def test_mechanisms(lock_dir, mechanism):
+    lock_file = os.path.join(lock_dir, 'lock')
+    lock = pl.InterProcessLock(lock_file, mechanism=mechanism)
+
+    def attempt_acquire():
+        child = multiprocessing.Process(target=_try_lock_with,
+                                        args=(lock_file, mechanism))
+        with scoped_child_processes([child], timeout=10, exitcode=None):
+            pass
+        return child.exitcode
+
+    assert lock.acquire(timeout=5)
+    try:
+        assert attempt_acquire() == 0
+    finally:
+        lock.release()
+    assert attempt_acquire() == 1
+    assert lock.acquire(timeout=5)
+    lock.release()
+
+
+@pytest.mark.parametrize("mechanism", ['mkdir', 'excl'])
+def test_mechanisms_break_stale_locks(lock_dir, mechanism):
+    lock_file = os.path.join(lock_dir, 'lock')
+    child = multiprocessing.Process(target=_acquire_and_die,
+                                    args=(lock_file, mechanism))
+    with scoped_child_processes([child], timeout=10):
+        pass
+    assert os.path.exists(lock_file)
+
+    lock = pl.InterProcessLock(lock_file, mechanism=mechanism)
+    assert lock.acquire(timeout=5)
+    lock.release()
+    assert not os.path.exists(lock_file)
+    assert os.listdir(lock_dir) == []
+
+
+def test_mkdir_breaks_unowned_lock(lock_dir):
+    lock_file = os.path.join(lock_dir, 'lock')
+    # Left behind by a holder that crashed before writing its owner record.
+    os.mkdir(lock_file)
+    lock = pl.InterProcessLock(lock_file, mechanism='mkdir')
+    assert not lock.acquire(blocking=False)
+    stamp = time.time() - 2 * pm._OWNER_GRACE
+    os.utime(lock_file, (stamp, stamp))
+    assert lock.acquire(timeout=5)
+    lock.release()
+    assert os.listdir(lock_dir) == []
+
+
+def test_mkdir_puts_back_acquired_lock(lock_dir, monkeypatch):
+    lock_file = os.path.join(lock_dir, 'lock')
+    holder = pl.InterProcessLock(lock_file, mechanism='mkdir')
+    assert holder.acquire(blocking=False)
+    # Stale when first checked, acquired by someone else once moved aside.
+    owners = iter([(pm._hostname(), -1), None])
+    monkeypatch.setattr(pm._MkdirInterProcessMechanism, '_stale_owner',
+                        lambda self, lockdir: next(owners))
+    lock = pl.InterProcessLock(lock_file, mechanism='mkdir')
+    assert not lock.acquire(blocking=False)
+    assert os.listdir(lock_dir) == ['lock']
+    holder.release()
+
+
+@pytest.mark.parametrize("mechanism", ['mkdir', 'excl'])
+def test_mechanisms_wrong_path_type(lock_dir, mechanism):
+    lock_file = os.path.join(lock_dir, 'lock')
+    if mechanism == 'mkdir':
+        # As left behind by the default backend.
+        open(lock_file, 'w').close()
+    else:
+        os.mkdir(lock_file)
+    lock = pl.InterProcessLock(lock_file, mechanism=mechanism)
+    with pytest.raises(threading.ThreadError):
+        lock.acquire(timeout=5)
+
+
+def test_mechanism_registry(lock_dir, monkeypatch):
+    released = []
+
+    class RecordingMechanism(pm.InterProcessMechanism):
+        def trylock(self, lockfile):
+            pass
+
+        def unlock(self, lockfile):
+            released.append(lockfile.name)
+
+    monkeypatch.setattr(pm, '_mechanisms', dict(pm._mechanisms))
+    pm.register_mechanism('recording', RecordingMechanism())
+    lock_file = os.path.join(lock_dir, 'lock')
+    with pl.InterProcessLock(lock_file, mechanism='recording'):
+        pass
+    assert released == [os.fsencode(lock_file)]
+
+    with pytest.raises(ValueError):
+        pl.InterProcessLock(lock_file, mechanism='unknown')
+    with pytest.raises(TypeError):
+        pl.InterProcessReaderWriterLock(lock_file,
+                                        mechanism=RecordingMechanism())
+    with pytest.raises(TypeError):
+        pm.register_mechanism('bad', object())
+
+
+def _tickets_taken(lock_file):
+    with open(lock_file + '.tickets', 'rb') as f:
+        return pl._TicketQueue._COUNTERS.unpack(f.read(16))[0]
+
+
+def _fair_worker(lock_file, order_file, i):
+    with pl.InterProcessLock(lock_file, fair=True):
+        with open(order_file, 'a') as f:
+            f.write('%s\n' % i)
+
+
+def _queue_and_die(lock_file):
+    lock = pl.InterProcessLock(lock_file, fair=True)
+    lock._tickets.open()
+    lock._tickets.take()
+    os._exit(0)
+
+
+def _wait_for_tickets(lock_file, tickets):
+    start = time.time()
+    while _tickets_taken(lock_file) != tickets:
+        assert time.time() - start < 10
+        time.sleep(0.001)
+
+
+@pytest.mark.skipif(WIN32, reason='Fair locks are not supported on windows')
+def test_fair_lock_order(lock_dir):
+    lock_file = os.path.join(lock_dir, 'lock')
+    order_file = os.path.join(lock_dir, 'order')
+    lock = pl.InterProcessLock(lock_file, fair=True)
+    assert lock.acquire()
+
+    children = []
+    for i in range(5):
+        child = multiprocessing.Process(target=_fair_worker,
+                                        args=(lock_file, order_file, i))
+        children.append(child)
+        child.start()
+        _wait_for_tickets(lock_file, i + 2)
+    # A waiter that died in the queue is skipped.
+    child = multiprocessing.Process(target=_queue_and_die, args=(lock_file,))
+    child.start()
+    child.join()
+    last = multiprocessing.Process(target=_fair_worker,
+                                   args=(lock_file, order_file, 5))
+    children.append(last)
+    last.start()
+
+    lock.release()
+    for child in children:
+        child.join(10)
+        assert child.exitcode == 0
+    with open(order_file) as f:
+        assert f.read().split() == [str(i) for i in range(6)]
+
+
+@pytest.mark.skipif(WIN32, reason='Fair locks are not supported on windows')
+def test_fair_lock_timeout(lock_dir):
+    lock_file = os.path.join(lock_dir, 'lock')
+    lock1 = pl.InterProcessLock(lock_file, fair=True)
+    lock2 = pl.InterProcessLock(lock_file, fair=True)
+    lock3 = pl.InterProcessLock(lock_file, fair=True)
+
+    assert lock1.acquire()
+    assert not lock2.acquire(blocking=False)
+    assert not lock2.acquire(timeout=0.05)
+
+    # The ticket of the waiter that gave up does not hold up the others.
+    t = threading.Timer(0.05, lock1.release)
+    t.start()
+    assert lock3.acquire(timeout=5)
+    t.join()
+    assert not lock2.acquire(blocking=False)
+    lock3.release()
+    assert lock2.acquire(blocking=False)
+    lock2.release()
+
+
+@pytest.mark.skipif(WIN32, reason='flock and fair locks are posix only')
+@pytest.mark.parametrize('fair', [False, True])
+def test_cancel_acquire(lock_dir, fair):
+    lock_file = os.path.join(lock_dir, 'lock')
+    # flock locks also exclude the lock objects of a single process.
+    lock1 = pl.InterProcessLock(lock_file, mechanism='flock', fair=fair)
+    lock2 = pl.InterProcessLock(lock_file, mechanism='flock', fair=fair)
+    rw_lock1 = pl.InterProcessReaderWriterLock(lock_file + '.rw',
+                                               mechanism='flock')
+    rw_lock2 = pl.InterProcessReaderWriterLock(lock_file + '.rw',
+                                               mechanism='flock')
+    assert lock1.acquire()
+    assert rw_lock1.acquire_write_lock()
+
+    for acquire in (lock2.acquire, rw_lock2.acquire_read_lock,
+                    rw_lock2.acquire_write_lock):
+        cancel = threading.Event()
+        t = threading.Timer(0.05, cancel.set)
+        t.start()
+        start = time.monotonic()
+        # Gives up right away instead of sleeping out its (long) delay.
+        assert not acquire(delay=30, max_delay=30, cancel=cancel)
+        assert time.monotonic() - start < 10
+        t.join()
+
+    lock1.release()
+    rw_lock1.release_write_lock()
+    assert lock2.acquire(blocking=False)
+    lock2.release()
+
+
+@pytest.mark.skipif(WIN32, reason='flock is posix only')
+def test_adaptive_acquire(lock_dir):
+    lock_file = os.path.join(lock_dir, 'lock')
+    # flock locks also exclude the lock objects of a single process.
+    holder = pl.InterProcessLock(lock_file, mechanism='flock',
+                                 publish_stats=True)
+    naps = []
+
+    def _sleep(seconds):
+        naps.append(seconds)
+        time.sleep(seconds)
+
+    waiter = pl.InterProcessLock(lock_file, mechanism='flock', adaptive=True,
+                                 sleep_func=_sleep)
+    for _ in range(3):
+        with holder:
+            time.sleep(0.3)
+    assert 0.3 <= waiter.stats.hold() < 1
+    assert os.path.exists(lock_file + '.stats')
+
+    assert holder.acquire()
+    t = threading.Timer(0.3, holder.release)
+    t.start()
+    assert waiter.acquire(max_delay=0.01)
+    t.join()
+    waiter.release()
+    # Slept out (most of) the hold, instead of waking up every 10ms.
+    assert sum(naps) >= 0.2
+    assert len(naps) < 10
+
+
+def test_unpublishable_stats(lock_dir, monkeypatch):
+    def _open(self):
+        raise OSError(errno.EROFS, "Read-only file system")
+
+    monkeypatch.setattr(pl._utils.HoldStats, '_open', _open)
+    lock_file = os.path.join(lock_dir, 'lock')
+    lock = pl.InterProcessLock(lock_file, publish_stats=True)
+    # Kept in memory only, the lock works all the same.
+    with lock:
+        assert lock.acquired
+    assert not lock.acquired
+    assert not os.path.exists(lock_file + '.stats')
+
+
+def _use_inherited(lock, rw_lock):
+    # Inherited as unlocked, the parent still holds them.
+    assert not lock.acquired and lock.lockfile is None
+    assert not lock.acquire(blocking=False)
+    assert not rw_lock.acquire_read_lock(blocking=False)
+
+
+def _try_lock_with_object(lock):
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+@pytest.mark.parametrize('mechanism', ['fcntl', 'flock'])
+def test_fork_resets_locks(lock_dir, mechanism):
+    lock = pl.InterProcessLock(os.path.join(lock_dir, 'lock'),
+                               mechanism=mechanism)
+    rw_lock = pl.InterProcessReaderWriterLock(os.path.join(lock_dir, 'rw'),
+                                              mechanism=mechanism)
+    assert lock.acquire()
+    assert rw_lock.acquire_write_lock()
+    ctx = multiprocessing.get_context('fork')
+    child = ctx.Process(target=_use_inherited, args=(lock, rw_lock))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+    lock.release()
+    rw_lock.release_write_lock()
+
+    # Created before forking, usable in the child once released.
+    child = ctx.Process(target=_try_lock_with_object, args=(lock,))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+
+
+def _hold(lock_file, mechanism, exclusive, held, done):
+    if exclusive is None:
+        lock = pl.InterProcessLock(lock_file, mechanism=mechanism)
+        assert lock.acquire()
+    else:
+        lock = pl.InterProcessReaderWriterLock(lock_file, mechanism=mechanism)
+        if exclusive:
+            assert lock.acquire_write_lock()
+        else:
+            assert lock.acquire_read_lock()
+    held.set()
+    done.wait(10)
+
+
+@contextlib.contextmanager
+def _held_by_children(lock_file, mechanism, modes):
+    done = multiprocessing.Event()
+    children = []
+    try:
+        for exclusive in modes:
+            held = multiprocessing.Event()
+            child = multiprocessing.Process(
+                target=_hold,
+                args=(lock_file, mechanism, exclusive, held, done))
+            child.start()
+            children.append(child)
+            assert held.wait(10)
+        yield [child.pid for child in children]
+    finally:
+        done.set()
+        for child in children:
+            child.join(10)
+
+
+@pytest.mark.skipif(not os.path.exists(pm._PROC_LOCKS),
+                    reason='all holders are only listed from /proc/locks')
+@pytest.mark.parametrize('mechanism', ['fcntl', 'flock'])
+def test_holders(lock_dir, mechanism):
+    lock_file = os.path.join(lock_dir, 'lock')
+    lock = pl.InterProcessLock(lock_file, mechanism=mechanism)
+    assert lock.holders() == []
+    assert not lock.is_locked()
+    with _held_by_children(lock_file, mechanism, [None]) as pids:
+        assert lock.holders() == [pm.LockHolder(pids[0], 'w', None)]
+        assert lock.is_locked()
+    assert not lock.is_locked()
+    with lock:
+        assert lock.holders() == [pm.LockHolder(os.getpid(), 'w', None)]
+
+    rw_lock = pl.InterProcessReaderWriterLock(lock_file + '.rw',
+                                              mechanism=mechanism)
+    with _held_by_children(lock_file + '.rw', mechanism,
+                           [False, False]) as pids:
+        holders = rw_lock.holders()
+        assert sorted(holders) == sorted(pm.LockHolder(pid, 'r', None)
+                                         for pid in pids)
+        assert rw_lock.is_locked()
+    with _held_by_children(lock_file + '.rw', mechanism, [True]) as pids:
+        assert rw_lock.holders() == [pm.LockHolder(pids[0], 'w', None)]
+    assert not rw_lock.is_locked()
+
+
+@pytest.mark.skipif(WIN32, reason='fcntl and flock are posix only')
+def test_holders_without_proc_locks(lock_dir, monkeypatch):
+    monkeypatch.setattr(pm, '_PROC_LOCKS', os.path.join(lock_dir, 'missing'))
+    lock_file = os.path.join(lock_dir, 'lock')
+    lock = pl.InterProcessLock(lock_file)
+    assert lock.holders() == []
+    with _held_by_children(lock_file, 'fcntl', [None]) as pids:
+        # Probed with F_GETLK.
+        assert lock.holders() == [pm.LockHolder(pids[0], 'w', None)]
+    assert not lock.is_locked()
+    with lock:
+        # Never reported by F_GETLK, the holding lock object adds itself.
+        assert lock.holders() == [pm.LockHolder(os.getpid(), 'w', None)]
+    rw_lock = pl.InterProcessReaderWriterLock(lock_file + '.rw')
+    with rw_lock.read_lock():
+        assert rw_lock.holders() == [pm.LockHolder(os.getpid(), 'r', None)]
+    assert rw_lock.holders() == []
+    flock_lock = pl.InterProcessLock(lock_file, mechanism='flock')
+    assert flock_lock.holders() is None
+    assert flock_lock.is_locked() is None
+
+
+@pytest.mark.parametrize('mechanism', ['mkdir', 'excl'])
+def test_holders_from_owner_record(lock_dir, mechanism):
+    lock_file = os.path.join(lock_dir, 'lock')
+    lock = pl.InterProcessLock(lock_file, mechanism=mechanism)
+    assert not lock.is_locked()
+    with _held_by_children(lock_file, mechanism, [None]) as pids:
+        assert lock.holders() == [pm.LockHolder(pids[0], 'w',
+                                                pm._hostname())]
+    assert lock.holders() == []
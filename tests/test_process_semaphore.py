@@ -0,0 +1,102 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from fasteners import process_semaphore as ps
+
+
+@pytest.fixture()
+def lock_file(tmp_path):
+    return str(tmp_path / 'semaphore')
+
+
+def _hold_permit(lock_file, held, release):
+    sem = ps.InterProcessSemaphore(lock_file, 2)
+    with sem:
+        held.set()
+        release.wait(10)
+
+
+def _acquire_and_die(lock_file):
+    sem = ps.InterProcessSemaphore(lock_file, 1)
+    assert sem.acquire()
+    os._exit(0)
+
+
+def test_permits_in_process(lock_file):
+    sems = [ps.InterProcessSemaphore(lock_file, 2) for _ in range(3)]
+    assert sems[0].acquire()
+    assert sems[1].acquire()
+    assert {sems[0].slot, sems[1].slot} == {0, 1}
+    assert not sems[2].acquire(blocking=False)
+    start = time.monotonic()
+    assert not sems[2].acquire(timeout=0.1)
+    assert time.monotonic() - start >= 0.1
+
+    t = threading.Timer(0.05, sems[0].release)
+    t.start()
+    assert sems[2].acquire(timeout=5)
+    t.join()
+    sems[1].release()
+    sems[2].release()
+
+
+def test_permits_across_processes(lock_file):
+    held = multiprocessing.Event()
+    release = multiprocessing.Event()
+    children = []
+    try:
+        for _ in range(2):
+            held.clear()
+            child = multiprocessing.Process(target=_hold_permit,
+                                            args=(lock_file, held, release))
+            child.start()
+            children.append(child)
+            assert held.wait(10)
+        sem = ps.InterProcessSemaphore(lock_file, 2)
+        assert not sem.acquire(blocking=False)
+        release.set()
+        assert sem.acquire(timeout=10)
+        sem.release()
+    finally:
+        release.set()
+        for child in children:
+            child.join(10)
+            assert child.exitcode == 0
+
+
+def test_permits_of_dead_processes_are_reclaimed(lock_file):
+    child = multiprocessing.Process(target=_acquire_and_die,
+                                    args=(lock_file,))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+    sem = ps.InterProcessSemaphore(lock_file, 1)
+    assert sem.acquire(blocking=False)
+    sem.release()
+
+
+def test_bad_usage(lock_file):
+    with pytest.raises(ValueError):
+        ps.InterProcessSemaphore(lock_file, 0)
+    sem = ps.InterProcessSemaphore(lock_file, 1)
+    with pytest.raises(threading.ThreadError):
+        sem.release()
+    with pytest.raises(ValueError):
+        sem.acquire(timeout=-1)
+
+
+def test_interprocess_semaphore_locked(lock_file):
+    other = ps.InterProcessSemaphore(lock_file, 1)
+
+    @ps.interprocess_semaphore_locked(lock_file, 1)
+    def locked():
+        assert not other.acquire(blocking=False)
+        return True
+
+    assert locked()
+    assert other.acquire(blocking=False)
+    other.release()
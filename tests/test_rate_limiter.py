@@ -0,0 +1,106 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from fasteners import rate_limiter as rl
+
+
+@pytest.fixture()
+def state_file(tmp_path):
+    return str(tmp_path / 'bucket')
+
+
+def _take_tokens(state_file, count):
+    limiter = rl.InterProcessRateLimiter(state_file, rate=100)
+    for _ in range(count):
+        assert limiter.wait(timeout=10)
+
+
+def test_acquire(state_file):
+    limiter = rl.InterProcessRateLimiter(state_file, rate=10, capacity=5)
+    # Starts full.
+    assert limiter.acquire(5) == 0.0
+    wait = limiter.acquire(2)
+    assert 0.1 < wait <= 0.2
+    # Borrowed tokens, later callers wait longer.
+    assert limiter.acquire(1) > wait
+    assert limiter.acquire(1, max_wait=0) is None
+    limiter.close()
+
+
+def test_shared_by_limiters(state_file):
+    limiter1 = rl.InterProcessRateLimiter(state_file, rate=10, capacity=2)
+    limiter2 = rl.InterProcessRateLimiter(state_file, rate=10, capacity=2)
+    assert limiter1.acquire(2) == 0.0
+    assert limiter2.acquire(1, max_wait=0) is None
+    assert limiter2.acquire(1) > 0
+
+
+def test_wait(state_file):
+    limiter = rl.InterProcessRateLimiter(state_file, rate=20, capacity=1)
+    start = time.monotonic()
+    for _ in range(5):
+        assert limiter.wait()
+    # 1 token right away, then 4 at 20 per second.
+    assert time.monotonic() - start >= 0.19
+    assert not limiter.wait(timeout=0)
+
+
+def test_rate_across_processes(state_file):
+    limiter = rl.InterProcessRateLimiter(state_file, rate=100)
+    assert limiter.acquire(100) == 0.0
+    start = time.monotonic()
+    children = [multiprocessing.Process(target=_take_tokens,
+                                        args=(state_file, 10))
+                for _ in range(3)]
+    for child in children:
+        child.start()
+    for child in children:
+        child.join(30)
+        assert child.exitcode == 0
+    # The bucket was empty, 30 tokens take 0.3 seconds to come in.
+    assert time.monotonic() - start >= 0.29
+
+
+class _FrozenTime:
+    """A clock that does not move (the limiter only reads it)."""
+
+    @staticmethod
+    def monotonic():
+        return 1000.0
+
+
+def test_threads(state_file, monkeypatch):
+    monkeypatch.setattr(rl, 'time', _FrozenTime)
+    limiter = rl.InterProcessRateLimiter(state_file, rate=1000, capacity=10)
+    waits = []
+
+    def _take():
+        for _ in range(10):
+            waits.append(limiter.acquire())
+
+    threads = [threading.Thread(target=_take) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # Every token was handed out once: the first 10 right away, the others
+    # borrowed one after the other (1ms apart).
+    expected = [0.0] * 10 + [i / 1000.0 for i in range(1, 41)]
+    assert sorted(waits) == pytest.approx(expected)
+
+
+def test_bad_usage(state_file):
+    with pytest.raises(ValueError):
+        rl.InterProcessRateLimiter(state_file, rate=0)
+    with pytest.raises(ValueError):
+        rl.InterProcessRateLimiter(state_file, rate=1, capacity=0)
+    limiter = rl.InterProcessRateLimiter(state_file, rate=1, capacity=2)
+    with pytest.raises(ValueError):
+        limiter.acquire(3)
+    with pytest.raises(ValueError):
+        limiter.acquire(0)
+    with pytest.raises(ValueError):
+        limiter.acquire(1, max_wait=-1)
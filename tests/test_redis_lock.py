@@ -0,0 +1,200 @@
+import socketserver
+import threading
+import time
+
+import pytest
+
+from fasteners import redis_lock as rl
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    """An in-process server speaking (the lock related subset of) RESP."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super(FakeRedis, self).__init__(('127.0.0.1', 0), _FakeRedisHandler)
+        self.data = {}
+        self.data_lock = threading.Lock()
+
+    def _get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def command(self, args):
+        name = args[0].upper()
+        with self.data_lock:
+            if name == b'SET':
+                key, value = args[1], args[2]
+                options = [arg.upper() for arg in args[3:]]
+                if b'NX' in options and self._get(key) is not None:
+                    return None
+                expires = None
+                if b'PX' in options:
+                    px = int(args[3 + options.index(b'PX') + 1])
+                    expires = time.monotonic() + px / 1000.0
+                self.data[key] = (value, expires)
+                return 'OK'
+            if name == b'GET':
+                return self._get(args[1])
+            if name == b'EVAL':
+                script, key, token = args[1].decode(), args[3], args[4]
+                if self._get(key) != token:
+                    return 0
+                if script == rl.RELEASE_SCRIPT:
+                    del self.data[key]
+                elif script == rl.EXTEND_SCRIPT:
+                    self.data[key] = (token,
+                                      time.monotonic() + int(args[5]) / 1000.0)
+                else:
+                    raise rl.ResponseError("NOSCRIPT unknown script")
+                return 1
+        raise rl.ResponseError("ERR unknown command %r" % name)
+
+
+class _FakeRedisHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            try:
+                reply = self.server.command(args)
+            except rl.ResponseError as e:
+                self.wfile.write(b'-%s\r\n' % str(e).encode())
+                continue
+            if reply is None:
+                self.wfile.write(b'$-1\r\n')
+            elif isinstance(reply, int):
+                self.wfile.write(b':%d\r\n' % reply)
+            elif isinstance(reply, bytes):
+                self.wfile.write(b'$%d\r\n%s\r\n' % (len(reply), reply))
+            else:
+                self.wfile.write(b'+%s\r\n' % reply.encode())
+
+
+@pytest.fixture()
+def server():
+    server = FakeRedis()
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server):
+    return rl.RespClient(*server.server_address)
+
+
+def test_acquire_release(server):
+    lock = rl.RedisLock('lock', client=_client(server))
+    with lock:
+        assert lock.is_held()
+        assert server.data[b'lock'][0] == lock.token.encode()
+    assert not lock.is_held()
+    assert b'lock' not in server.data
+
+
+def test_exclusive(server):
+    lock1 = rl.RedisLock('lock', client=_client(server))
+    lock2 = rl.RedisLock('lock', client=_client(server))
+
+    assert lock1.acquire()
+    assert not lock2.acquire(blocking=False)
+    start = time.monotonic()
+    assert not lock2.acquire(timeout=0.1)
+    assert time.monotonic() - start >= 0.1
+
+    t = threading.Timer(0.05, lock1.release)
+    t.start()
+    assert lock2.acquire(timeout=5)
+    t.join()
+    lock2.release()
+
+
+def test_bad_usage(server):
+    lock = rl.RedisLock('lock', client=_client(server))
+    with pytest.raises(threading.ThreadError):
+        lock.release()
+    with pytest.raises(ValueError):
+        rl.RedisLock('lock', ttl=0)
+    with pytest.raises(ValueError):
+        rl.RedisLock('lock', ttl=1, extend_interval=1)
+
+
+def test_connection_error():
+    # Nothing listens on port 1.
+    lock = rl.RedisLock('lock', client=rl.RespClient('127.0.0.1', 1))
+    with pytest.raises(threading.ThreadError):
+        lock.acquire()
+
+
+def test_auto_extend(server):
+    lock1 = rl.RedisLock('lock', client=_client(server), ttl=0.3)
+    lock2 = rl.RedisLock('lock', client=_client(server), ttl=0.3)
+    with lock1:
+        assert not lock2.acquire(timeout=1)
+        assert lock1.is_held()
+
+
+def test_expired_lock_is_not_released_by_former_holder(server):
+    lock1 = rl.RedisLock('lock', client=_client(server), ttl=0.1,
+                         auto_extend=False)
+    lock2 = rl.RedisLock('lock', client=_client(server), ttl=0.1,
+                         auto_extend=False)
+    assert lock1.acquire()
+    assert lock2.acquire(timeout=5)
+    assert not lock1.extend()
+    assert not lock1.is_held()
+    lock1.release()
+    assert lock2.is_held()
+    lock2.release()
+
+
+def test_redis_locked(server):
+    client = _client(server)
+    other = rl.RedisLock('lock', client=client)
+
+    @rl.redis_locked('lock', client=client)
+    def locked():
+        assert not other.acquire(blocking=False)
+        return True
+
+    assert locked()
+    assert other.acquire(blocking=False)
+    other.release()
+
+
+def test_redis_locked_threads(server):
+    inside = []
+    overlaps = []
+
+    @rl.redis_locked('lock', client=_client(server))
+    def locked():
+        inside.append(1)
+        overlaps.append(len(inside))
+        time.sleep(0.01)
+        inside.pop()
+
+    threads = [threading.Thread(target=locked) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert overlaps == [1] * 5
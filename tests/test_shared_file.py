@@ -0,0 +1,82 @@
+import json
+import mmap
+import multiprocessing
+import os
+
+import pytest
+
+from fasteners import shared_file as sf
+
+
+@pytest.fixture()
+def path(tmp_path):
+    return str(tmp_path / 'state.json')
+
+
+def _increment(path, count):
+    f = sf.locked_file(path)
+    for _ in range(count):
+        with f.update() as update:
+            update.data = b'%d' % (int(update.data or 0) + 1)
+
+
+def test_read_write(path):
+    f = sf.locked_file(path)
+    assert f.read() is None
+    with f.reading() as data:
+        assert data is None
+    f.write(b'{}')
+    assert f.read() == b'{}'
+    with f.update() as update:
+        state = json.loads(update.data)
+        state['a'] = 1
+        update.data = json.dumps(state).encode()
+    assert json.loads(f.read()) == {'a': 1}
+    assert not [name for name in os.listdir(os.path.dirname(path))
+                if name.endswith('.tmp')]
+    with f.update() as update:
+        update.data = None
+    assert not os.path.exists(path)
+
+
+def test_unchanged_update_does_not_rewrite(path):
+    f = sf.locked_file(path, fsync=True)
+    f.write(b'data')
+    inode = os.stat(path).st_ino
+    with f.update() as update:
+        update.data = b'data'
+    assert os.stat(path).st_ino == inode
+    f.write(b'other')
+    assert os.stat(path).st_ino != inode
+
+
+def test_failed_update_does_not_write(path):
+    f = sf.locked_file(path)
+    f.write(b'data')
+    with pytest.raises(RuntimeError):
+        with f.update() as update:
+            update.data = b'other'
+            raise RuntimeError
+    assert f.read() == b'data'
+
+
+def test_reading_large_files_maps_them(path):
+    f = sf.locked_file(path, mmap_threshold=10)
+    f.write(b'x' * 5)
+    with f.reading() as data:
+        assert data == b'x' * 5
+    f.write(b'x' * 100)
+    with f.reading() as data:
+        assert isinstance(data, mmap.mmap)
+        assert data[:] == b'x' * 100
+
+
+def test_updates_across_processes(path):
+    children = [multiprocessing.Process(target=_increment, args=(path, 50))
+                for _ in range(4)]
+    for child in children:
+        child.start()
+    for child in children:
+        child.join(30)
+        assert child.exitcode == 0
+    assert sf.locked_file(path).read() == b'200'
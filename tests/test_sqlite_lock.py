@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+import pytest
+
+from fasteners import sqlite_lock as sl
+
+
+@pytest.fixture()
+def lock_dir():
+    tmp_dir = tempfile.mkdtemp()
+    yield tmp_dir
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@pytest.fixture()
+def table(lock_dir):
+    table = sl.SQLiteLockTable(os.path.join(lock_dir, 'sub', 'locks.db'))
+    yield table
+    table.close()
+
+
+def test_exclusive(table):
+    lock1 = table.lock('a')
+    lock2 = table.lock('a')
+    with lock1:
+        assert not lock2.acquire(blocking=False)
+        assert not lock2.acquire(timeout=0.05)
+        with table.lock('b'):
+            pass
+    assert lock2.acquire(blocking=False)
+    lock2.release()
+
+
+def test_bad_release_and_keys(table):
+    with pytest.raises(threading.ThreadError):
+        table.lock('a').release()
+    with pytest.raises(ValueError):
+        table.lock()
+
+
+def test_batched_all_or_nothing(table):
+    many = table.lock(*['key-%s' % i for i in range(1000)])
+    with table.lock('key-999'):
+        assert not many.acquire(blocking=False)
+        # None of the other keys were taken.
+        with table.lock('key-0'):
+            pass
+    assert many.acquire(blocking=False)
+    assert not table.lock('key-500').acquire(blocking=False)
+    many.release()
+    with table.lock('key-500'):
+        pass
+
+
+def test_reader_writer(table):
+    reader1 = table.reader_writer_lock('a')
+    reader2 = table.reader_writer_lock('a')
+    writer = table.reader_writer_lock('a')
+    with reader1.read_lock():
+        with reader2.read_lock():
+            assert not writer.acquire_write_lock(blocking=False)
+        assert not writer.acquire_write_lock(blocking=False)
+        # Converted into a write lock, like fcntl locks.
+        assert reader1.acquire_write_lock(blocking=False)
+        assert not reader2.acquire_read_lock(blocking=False)
+    with writer.write_lock():
+        assert not reader1.acquire_read_lock(blocking=False)
+
+
+def test_threads(table):
+    active = []
+    dups = []
+
+    def worker():
+        lock = table.lock('a')
+        for _ in range(20):
+            with lock:
+                if active:
+                    dups.append(True)
+                active.append(True)
+                active.pop()
+        table.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not dups
+
+
+def _try_lock(path):
+    lock = sl.SQLiteLockTable(path).lock('a')
+    if not lock.acquire(blocking=False):
+        sys.exit(0)
+    lock.release()
+    sys.exit(1)
+
+
+def _acquire_and_die(path):
+    assert sl.SQLiteLockTable(path).lock('a', 'b').acquire(blocking=False)
+    os._exit(0)
+
+
+def _run_child(target, path):
+    child = multiprocessing.Process(target=target, args=(path,))
+    child.start()
+    child.join(10)
+    return child.exitcode
+
+
+def test_interprocess(table):
+    path = os.fsdecode(table.path)
+    with table.lock('a'):
+        assert _run_child(_try_lock, path) == 0
+    assert _run_child(_try_lock, path) == 1
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='pids are reused right away on'
+                    ' windows, where holders have no start time')
+def test_stale_locks(table):
+    path = os.fsdecode(table.path)
+    assert _run_child(_acquire_and_die, path) == 0
+    assert table.cleanup() == 1
+    assert table.cleanup() == 0
+
+    # Waiters remove the locks of crashed holders themselves.
+    assert _run_child(_acquire_and_die, path) == 0
+    lock = table.lock('b')
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+def test_released_by_holder_index(table):
+    with table.lock('a'):
+        plan = table._connection().execute(
+            "EXPLAIN QUERY PLAN DELETE FROM holders WHERE holder = ?",
+            ('x',)).fetchall()
+    assert 'holders_holder' in ' '.join(row[-1] for row in plan)
+
+
+def test_cleanup_errors(lock_dir):
+    # Not a database.
+    table = sl.SQLiteLockTable(lock_dir)
+    with pytest.raises(threading.ThreadError):
+        table.cleanup()
@@ -0,0 +1,256 @@
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from fasteners import _utils
+from fasteners import async_lock
+from fasteners import lock
+from fasteners import lock_server as ls
+from fasteners import process_lock as pl
+from fasteners import server_lock as sl
+from fasteners import sqlite_lock
+from fasteners import watchdog as wd
+
+
+@pytest.fixture()
+def lock_file(tmp_path):
+    return str(tmp_path / 'file.lock')
+
+
+@pytest.fixture()
+def reports():
+    return []
+
+
+def _wait_for(predicate):
+    deadline = time.monotonic() + 10
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def _hold(lock_file, held, done):
+    with pl.InterProcessLock(lock_file):
+        held.set()
+        done.wait(10)
+
+
+@contextlib.contextmanager
+def _held_by_child(lock_file):
+    held = multiprocessing.Event()
+    done = multiprocessing.Event()
+    child = multiprocessing.Process(target=_hold,
+                                    args=(lock_file, held, done))
+    child.start()
+    try:
+        assert held.wait(10)
+        yield child.pid, done
+    finally:
+        done.set()
+        child.join(10)
+
+
+def test_slow_wait(lock_file, reports):
+    waiter = pl.InterProcessLock(lock_file)
+    with _held_by_child(lock_file) as (pid, done):
+        with wd.Watchdog(wait_threshold=0.05, hook=reports.append):
+            t = threading.Timer(0.3, done.set)
+            t.start()
+            assert waiter.acquire(timeout=10)
+            t.join()
+            waiter.release()
+    assert len(reports) == 1
+    report = reports[0]
+    assert report.kind == 'wait'
+    assert report.lock is waiter
+    assert report.duration >= 0.05
+    assert report.thread is threading.current_thread()
+    assert 'test_slow_wait' in report.stack
+    # The holders of other processes are not listed everywhere.
+    if report.holders is not None:
+        assert [h.pid for h in report.holders] == [pid]
+
+
+def test_long_hold(lock_file, reports):
+    with wd.Watchdog(wait_threshold=None, hold_threshold=0.05,
+                     hook=reports.append) as watchdog:
+        with pl.InterProcessLock(lock_file):
+            _wait_for(lambda: reports)
+        # Short holds are not reported.
+        with pl.InterProcessLock(lock_file):
+            pass
+        watchdog.check()
+        assert not watchdog._watches
+    assert [r.kind for r in reports] == ['hold']
+    assert reports[0].duration >= 0.05
+
+
+def test_reader_writer_lock(reports):
+    rw_lock = lock.ReaderWriterLock()
+    reading = threading.Event()
+    done = threading.Event()
+
+    def _read():
+        with rw_lock.read_lock():
+            reading.set()
+            done.wait(10)
+
+    with wd.Watchdog(wait_threshold=0.05, hold_threshold=0.05,
+                     hook=reports.append) as watchdog:
+        reader = threading.Thread(target=_read, name='reader')
+        reader.start()
+        reading.wait(10)
+        t = threading.Timer(0.3, done.set)
+        t.start()
+        with rw_lock.write_lock():
+            pass
+        t.join()
+        reader.join()
+        assert not watchdog._watches
+    waits = [r for r in reports if r.kind == 'wait']
+    assert len(waits) == 1
+    [holder] = waits[0].holders
+    assert holder.thread is reader
+    assert holder.mode == lock.ReaderWriterLock.READER
+    assert '_read' in holder.stack
+    holds = [r for r in reports if r.kind == 'hold']
+    assert [r.thread for r in holds] == [reader]
+
+
+def test_async_reader_writer_lock(reports):
+    async def _run():
+        rw_lock = async_lock.AsyncReaderWriterLock()
+        reading = asyncio.Event()
+        done = asyncio.Event()
+
+        async def _read():
+            async with rw_lock.read_lock():
+                reading.set()
+                await done.wait()
+
+        reader = asyncio.ensure_future(_read())
+        await reading.wait()
+        asyncio.get_running_loop().call_later(0.3, done.set)
+        async with rw_lock.write_lock():
+            pass
+        await reader
+        return reader
+
+    with wd.Watchdog(wait_threshold=0.05, hold_threshold=0.05,
+                     hook=reports.append) as watchdog:
+        reader = asyncio.run(_run())
+        assert not watchdog._watches
+    waits = [r for r in reports if r.kind == 'wait']
+    assert len(waits) == 1
+    [holder] = waits[0].holders
+    assert holder.thread is reader
+    assert holder.mode == async_lock.AsyncReaderWriterLock.READER
+    holds = [r for r in reports if r.kind == 'hold']
+    assert [r.thread for r in holds] == [reader]
+
+
+def test_big_reader_writer_lock(reports):
+    rw_lock = lock.BigReaderWriterLock()
+    writing = threading.Event()
+    done = threading.Event()
+
+    def _write():
+        with rw_lock.write_lock():
+            writing.set()
+            done.wait(10)
+
+    with wd.Watchdog(wait_threshold=0.05, hold_threshold=0.05,
+                     hook=reports.append) as watchdog:
+        writer = threading.Thread(target=_write, name='writer')
+        writer.start()
+        writing.wait(10)
+        t = threading.Timer(0.3, done.set)
+        t.start()
+        with rw_lock.read_lock():
+            pass
+        t.join()
+        writer.join()
+        assert not watchdog._watches
+    waits = [r for r in reports if r.kind == 'wait']
+    assert len(waits) == 1
+    assert waits[0].thread is threading.current_thread()
+    [holder] = waits[0].holders
+    assert holder.thread is writer
+    assert holder.mode == 'w'
+    holds = [r for r in reports if r.kind == 'hold']
+    assert [r.thread for r in holds] == [writer]
+
+
+def test_sqlite_lock(tmp_path, reports):
+    table = sqlite_lock.SQLiteLockTable(str(tmp_path / 'locks.db'))
+    try:
+        with wd.Watchdog(wait_threshold=0.05, hold_threshold=0.05,
+                         hook=reports.append) as watchdog:
+            locked = table.lock('a')
+            rw_lock = table.reader_writer_lock('b')
+            with locked, rw_lock.write_lock():
+                _wait_for(lambda: len(reports) == 2)
+            assert not watchdog._watches
+    finally:
+        table.close()
+    assert sorted(r.kind for r in reports) == ['hold', 'hold']
+    assert {r.lock for r in reports} == {locked, rw_lock}
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='Needs unix domain sockets')
+def test_server_lock(tmp_path, reports):
+    path = str(tmp_path / 'locks.sock')
+    server = ls.LockServer(path)
+    server.start()
+    try:
+        holder = sl.ServerLock('a', path)
+        waiter = sl.ServerLock('a', path)
+        with wd.Watchdog(wait_threshold=0.05, hold_threshold=0.05,
+                         hook=reports.append) as watchdog:
+            assert holder.acquire()
+            t = threading.Timer(0.3, holder.release)
+            t.start()
+            assert waiter.acquire(timeout=10)
+            t.join()
+            waiter.release()
+            assert not watchdog._watches
+    finally:
+        server.stop()
+    assert [r.lock for r in reports if r.kind == 'wait'] == [waiter]
+    assert holder in [r.lock for r in reports if r.kind == 'hold']
+
+
+def test_logs_reports(lock_file, caplog):
+    waiter = pl.InterProcessLock(lock_file)
+    with _held_by_child(lock_file) as (pid, _done):
+        holders = waiter.holders()
+        with caplog.at_level(logging.WARNING, logger='fasteners.watchdog'):
+            with wd.Watchdog(wait_threshold=0.05):
+                assert not waiter.acquire(timeout=0.3)
+    [record] = caplog.records
+    message = record.getMessage()
+    assert 'Waiting' in message
+    if holders is None:
+        assert 'unknown holders' in message
+    else:
+        assert 'pid %s (w)' % pid in message
+    assert 'test_logs_reports' in message
+
+
+def test_bad_usage():
+    with pytest.raises(ValueError):
+        wd.Watchdog(wait_threshold=None)
+    with pytest.raises(ValueError):
+        wd.Watchdog(wait_threshold=0)
+    with pytest.raises(ValueError):
+        wd.Watchdog(interval=-1)
+    with wd.Watchdog():
+        with pytest.raises(RuntimeError):
+            wd.Watchdog().start()
+    assert _utils.active_watchdog is None